@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+# Copyright lowRISC contributors (OpenTitan project).
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Run one OTBN binary on many inputs in the standalone simulator
+
+This reads and decodes the ELF file once and then runs it on each input in
+turn, spreading the runs across a pool of worker processes. This is much
+faster than running standalone.py for each input, which has to load the
+instruction definitions and decode the ELF every time.
+
+An input is a DMEM image, given as raw little-endian bytes (the same format
+as the data in an ELF file). It gets loaded on top of the ELF file's initial
+DMEM contents, at the address given by --at (by default, the start of DMEM).
+Inputs can be given as:
+
+  - A file, which contains a single DMEM image.
+
+  - A directory, where each file in the directory (in sorted order) contains
+    a single DMEM image.
+
+  - The string '-', meaning to read a stream of DMEM images from stdin. Each
+    image is preceded by its length in bytes as a 32-bit little-endian
+    integer.
+
+For each input, the simulator writes the final DMEM contents (in the same
+format as standalone.py's --dump-dmem) and registers (as with --dump-regs) to
+<name>.dmem and <name>.regs in the output directory. The name of an input is
+its file name for a file, or stdin-N for the N'th image from stdin. If two
+inputs would have the same name (such as files with the same name in
+different directories), we stop with an error before running anything, rather
+than letting one input's dumps overwrite another's. A summary with the cycle
+count, ERR_BITS and STOP_PC for each input gets written to stdout, with one
+tab-separated line per input.
+
+With --testcases, each input file is instead a testcase HJSON file (as for
+standalone.py's --testcase), which says how to set up DMEM and the registers
+and what to expect at the end of the run. Nothing is written to the output
+directory: the final state is checked against the testcase, and the summary
+line for each input ends with PASS or FAIL. The details of any failures get
+written to stderr. See testgen_batch.py for a way to generate testcases and
+run them without writing them to files.
+
+'''
+
+import argparse
+import io
+import multiprocessing
+import os
+import re
+import struct
+import sys
+from typing import (BinaryIO, Dict, Iterable, Iterator, List, Optional,
+                    Tuple)
+
+import hjson  # type: ignore
+
+from sim.load_elf import ElfImage, load_elf_image, read_elf_image
+from sim.standalonesim import StandaloneSim
+from shared.dmem_dump import parse_actual_dmem
+from shared.final_state import check_final_state
+from shared.reg_dump import parse_reg_dump
+from shared.testcase import OtbnTestCase
+from shared.testgen import Testcase
+
+# The decoded ELF file and run settings, set by _init_worker in each worker
+# process.
+_IMAGE: Optional[ElfImage] = None
+_OUT_DIR = '.'
+_LOAD_ADDR = 0
+
+# The result of running a single input: (name, cycles, ERR_BITS, STOP_PC, ok)
+# where ok is false if the run stopped at the wrong address.
+RunResult = Tuple[str, int, int, int, bool]
+
+# The result of running a single testcase: (name, cycles, ERR_BITS, STOP_PC,
+# report) where report describes any mismatches with the testcase's expected
+# values and is empty if the test passed.
+TestcaseResult = Tuple[str, int, int, int, str]
+
+
+def _init_worker(image: ElfImage, out_dir: str, load_addr: int) -> None:
+    global _IMAGE, _OUT_DIR, _LOAD_ADDR
+    _IMAGE = image
+    _OUT_DIR = out_dir
+    _LOAD_ADDR = load_addr
+
+
+def _read_stream(stream: BinaryIO) -> Iterator[Tuple[str, bytes]]:
+    '''Read length-prefixed DMEM images from stream'''
+    idx = 0
+    while True:
+        hdr = stream.read(4)
+        if not hdr:
+            return
+        if len(hdr) != 4:
+            raise RuntimeError('Truncated length for input {} on stdin.'
+                               .format(idx))
+        length = struct.unpack('<I', hdr)[0]
+        data = stream.read(length)
+        if len(data) != length:
+            raise RuntimeError('Input {} on stdin should be {} bytes long, '
+                               'but we only got {}.'
+                               .format(idx, length, len(data)))
+        yield ('stdin-{}'.format(idx), data)
+        idx += 1
+
+
+def _expand_inputs(paths: List[str]) -> List[str]:
+    '''Expand any directories in paths to the files that they contain'''
+    ret = []
+    for path in paths:
+        if path != '-' and os.path.isdir(path):
+            files = [os.path.join(path, name)
+                     for name in sorted(os.listdir(path))]
+            ret += [f for f in files if os.path.isfile(f)]
+        else:
+            ret.append(path)
+    return ret
+
+
+def _check_input_names(files: List[str]) -> None:
+    '''Check that no two inputs would write the same output files
+
+    files should be the result of _expand_inputs. Raises a ValueError if
+    there is a clash.
+
+    '''
+    seen: Dict[str, str] = {}
+    for file in files:
+        if file == '-':
+            continue
+        name = os.path.basename(file)
+        if name in seen:
+            raise ValueError('The inputs {} and {} are both called {!r}, so '
+                             'their dumps would overwrite each other.'
+                             .format(seen[name], file, name))
+        if '-' in files and re.fullmatch(r'stdin-[0-9]+', name):
+            raise ValueError('The input {} is called {!r}, which clashes '
+                             'with the names of inputs from stdin.'
+                             .format(file, name))
+        seen[name] = file
+
+
+def _read_inputs(files: List[str]) -> Iterator[Tuple[str, bytes]]:
+    '''Read (name, data) for each input in files
+
+    files should be the result of _expand_inputs.
+
+    '''
+    for file in files:
+        if file == '-':
+            yield from _read_stream(sys.stdin.buffer)
+            continue
+
+        with open(file, 'rb') as handle:
+            yield (os.path.basename(file), handle.read())
+
+
+def _load_sim(image: ElfImage) -> Tuple[StandaloneSim, Optional[int]]:
+    '''Make a simulator with image loaded, as standalone.py would
+
+    Returns the simulator and the expected end address of a run.
+
+    '''
+    sim = StandaloneSim(tracing=False)
+    exp_end_addr = load_elf_image(sim, image)
+    sim.load_test_sideload_keys()
+    return sim, exp_end_addr
+
+
+def _run_input(name_data: Tuple[str, bytes]) -> RunResult:
+    '''Run the ELF file on one input, writing its dumps to the output dir'''
+    name, data = name_data
+    assert _IMAGE is not None
+
+    sim, exp_end_addr = _load_sim(_IMAGE)
+    sim.state.dmem.load_le_words(data, has_validity=False,
+                                 word_offset=_LOAD_ADDR // 4)
+    sim.state.ext_regs.commit()
+
+    sim.start(collect_stats=False)
+
+    regs = io.StringIO()
+    cycles = sim.run(verbose=False, dump_file=regs)
+
+    with open(os.path.join(_OUT_DIR, name + '.regs'), 'w') as regs_file:
+        regs_file.write(regs.getvalue())
+    with open(os.path.join(_OUT_DIR, name + '.dmem'), 'wb') as dmem_file:
+        dmem_file.write(sim.dump_data())
+
+    ok = exp_end_addr is None or sim.state.pc == exp_end_addr
+    return (name, cycles,
+            sim.state.ext_regs.read('ERR_BITS', False),
+            sim.state.ext_regs.read('STOP_PC', False),
+            ok)
+
+
+def _run_testcase(name_case: Tuple[str, Testcase]) -> TestcaseResult:
+    '''Run the ELF file on one testcase and check the final state'''
+    name, case = name_case
+    assert _IMAGE is not None
+
+    sim, _ = _load_sim(_IMAGE)
+    testcase = OtbnTestCase.from_dict(case, _IMAGE.symbols)
+    sim.load_dmem_vars(testcase.input.dmem)
+    sim.load_regs_vars(testcase.input.regs)
+    sim.state.ext_regs.commit()
+
+    sim.start(collect_stats=False)
+    if testcase.entrypoint:
+        sim.state.pc = testcase.entrypoint
+
+    regs = io.StringIO()
+    cycles = sim.run(verbose=False, dump_file=regs)
+
+    result = check_final_state(testcase.output.regs, testcase.output.dmem,
+                               parse_reg_dump(regs.getvalue()),
+                               parse_actual_dmem(sim.dump_data()),
+                               _IMAGE.symbols, testcase.entrypoint)
+    return (name, cycles,
+            sim.state.ext_regs.read('ERR_BITS', False),
+            sim.state.ext_regs.read('STOP_PC', False),
+            result.report() if result.has_errors() else '')
+
+
+def run_testcases(image: ElfImage,
+                  testcases: Iterable[Tuple[str, Testcase]],
+                  jobs: int = 1) -> Iterator[TestcaseResult]:
+    '''Run image on each (name, testcase) pair in testcases
+
+    The testcases are run by a pool of jobs worker processes (or in this
+    process if jobs is 1) and the results are yielded in order.
+
+    '''
+    init_args = (image, '.', 0)
+    if jobs <= 1:
+        _init_worker(*init_args)
+        for name_case in testcases:
+            yield _run_testcase(name_case)
+        return
+
+    with multiprocessing.Pool(jobs,
+                              initializer=_init_worker,
+                              initargs=init_args) as pool:
+        yield from pool.imap(_run_testcase, testcases)
+
+
+def _get_load_addr(image: ElfImage, at: Optional[str]) -> int:
+    '''Interpret the --at argument as a symbol or an address'''
+    if at is None:
+        return 0
+    if at in image.symbols:
+        addr = image.symbols[at]
+    else:
+        try:
+            addr = int(at, 0)
+        except ValueError:
+            raise ValueError('{!r} is neither a symbol in the ELF file nor an '
+                             'address.'.format(at)) from None
+    if addr & 3:
+        raise ValueError('Cannot load inputs at the unaligned address {:#x}.'
+                         .format(addr))
+    return addr
+
+
+def _check_testcases(image: ElfImage, paths: List[str], jobs: int) -> int:
+    '''Run the testcases in paths, printing a summary line for each'''
+    testcases = ((name, hjson.loads(data.decode()))
+                 for name, data in _read_inputs(_expand_inputs(paths)))
+
+    failures = 0
+    for name, cycles, err_bits, stop_pc, report in run_testcases(image,
+                                                                 testcases,
+                                                                 jobs):
+        print('{}\t{}\t{:#x}\t{:#x}\t{}'
+              .format(name, cycles, err_bits, stop_pc,
+                      'FAIL' if report else 'PASS'))
+        if report:
+            print(f'{name}:\n{report}', file=sys.stderr)
+            failures += 1
+
+    return 1 if failures else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('elf')
+    parser.add_argument('inputs', nargs='+', metavar='INPUT',
+                        help=("a DMEM image, a directory of DMEM images, or "
+                              "'-' to read a stream of length-prefixed DMEM "
+                              "images from stdin."))
+    parser.add_argument('-o', '--out-dir', default='.',
+                        help=("directory for the per-input dumps. Defaults "
+                              "to the current directory."))
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help=("number of worker processes. Defaults to the "
+                              "number of CPUs."))
+    parser.add_argument('--at', metavar='SYMBOL_OR_ADDR',
+                        help=("load each DMEM image at this symbol or "
+                              "address, rather than at the start of DMEM."))
+    parser.add_argument('--testcases', action='store_true',
+                        help=("treat each input as a testcase HJSON file "
+                              "and check the final state against it, rather "
+                              "than writing dumps."))
+
+    args = parser.parse_args()
+
+    if args.jobs is None or args.jobs < 1:
+        args.jobs = 1
+
+    image = read_elf_image(args.elf)
+
+    if args.testcases:
+        if args.at is not None or '-' in args.inputs:
+            print('--testcases cannot be used with --at or with inputs '
+                  'from stdin.', file=sys.stderr)
+            return 1
+        return _check_testcases(image, args.inputs, args.jobs)
+    try:
+        load_addr = _get_load_addr(image, args.at)
+    except ValueError as err:
+        print(err, file=sys.stderr)
+        return 1
+
+    files = _expand_inputs(args.inputs)
+    try:
+        _check_input_names(files)
+    except ValueError as err:
+        print(err, file=sys.stderr)
+        return 1
+
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    inputs = _read_inputs(files)
+    init_args = (image, args.out_dir, load_addr)
+
+    failures = 0
+
+    def report(result: RunResult) -> None:
+        nonlocal failures
+        name, cycles, err_bits, stop_pc, ok = result
+        print('{}\t{}\t{:#x}\t{:#x}'.format(name, cycles, err_bits, stop_pc))
+        if not ok:
+            assert image.exp_end_addr is not None
+            print('Run for {} did not stop at _expected_end_addr ({:#x}).'
+                  .format(name, image.exp_end_addr),
+                  file=sys.stderr)
+            failures += 1
+
+    if args.jobs == 1:
+        _init_worker(*init_args)
+        for name_data in inputs:
+            report(_run_input(name_data))
+    else:
+        with multiprocessing.Pool(args.jobs,
+                                  initializer=_init_worker,
+                                  initargs=init_args) as pool:
+            for result in pool.imap(_run_input, inputs):
+                report(result)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
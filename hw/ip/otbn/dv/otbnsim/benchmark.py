@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# Copyright lowRISC contributors (OpenTitan project).
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Measure the simulation speed of the standalone OTBN simulator
+
+This runs each ELF file given on the command line through the standalone
+simulator (with the same setup as standalone.py) and reports the number of
+simulated cycles per second of wall-clock time. Each binary is run with
+change tracing enabled (as used by the stepped interface for cosimulation)
+and disabled (as used by standalone.py).
+
+The ELF files will typically be OTBN crypto programs, built with something
+like:
+
+    ./bazelisk.sh build //sw/otbn/crypto/tests:rsa_1024_dec_test
+
+'''
+
+import argparse
+import os
+import sys
+import time
+from typing import List, Tuple
+
+from tabulate import tabulate
+
+from sim.load_elf import load_elf
+from sim.standalonesim import StandaloneSim
+
+
+def run_once(elf: str, tracing: bool) -> Tuple[int, float]:
+    '''Simulate elf from start to finish
+
+    Returns a pair (cycles, seconds), where seconds only counts the time spent
+    in the run itself (not loading the ELF).
+
+    '''
+    sim = StandaloneSim(tracing=tracing)
+    load_elf(sim, elf)
+
+    sim.load_test_sideload_keys()
+    sim.state.ext_regs.commit()
+
+    sim.start(collect_stats=False)
+
+    start_time = time.perf_counter()
+    cycles = sim.run(verbose=False, dump_file=None)
+    return (cycles, time.perf_counter() - start_time)
+
+
+def bench_elf(elf: str, repeats: int) -> List[object]:
+    '''Benchmark elf with and without tracing, returning a table row'''
+    row: List[object] = [os.path.basename(elf)]
+    speeds = []
+    for tracing in [True, False]:
+        best_time = None
+        cycles = 0
+        for _ in range(repeats):
+            cycles, seconds = run_once(elf, tracing)
+            if best_time is None or seconds < best_time:
+                best_time = seconds
+        assert best_time is not None
+
+        speed = cycles / best_time
+        speeds.append(speed)
+        if tracing:
+            row.append(cycles)
+        row += [f'{best_time:.3f}', f'{speed:.0f}']
+
+    row.append(f'{speeds[1] / speeds[0]:.2f}x')
+    return row
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('elfs', nargs='+', metavar='ELF')
+    parser.add_argument('-n', '--repeats', type=int, default=3,
+                        help=('Number of runs for each configuration. The '
+                              'fastest run is reported. Defaults to 3.'))
+    args = parser.parse_args()
+
+    if args.repeats < 1:
+        print('The number of repeats must be positive.', file=sys.stderr)
+        return 1
+
+    rows = [bench_elf(elf, args.repeats) for elf in args.elfs]
+    print(tabulate(rows,
+                   headers=['binary', 'cycles',
+                            'traced (s)', 'traced (cycles/s)',
+                            'untraced (s)', 'untraced (cycles/s)',
+                            'speedup']))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
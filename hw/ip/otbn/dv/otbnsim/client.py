@@ -0,0 +1,250 @@
+# Copyright lowRISC contributors (OpenTitan project).
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''A client for the OTBN simulator server (server.py)
+
+A test suite that runs OTBN code many times can start one server and then
+talk to it with an OTBNClient, rather than starting a new Python interpreter
+(and loading the simulator) for each run. For example:
+
+    server = start_server('/tmp/otbn.sock')
+    try:
+        with OTBNClient('/tmp/otbn.sock') as client:
+            client.load_elf('prog.elf')
+            client.load_dmem(inputs, at='input_buf')
+            result = client.run()
+            dmem = client.dump_dmem()
+    finally:
+        server.terminate()
+        server.wait()
+
+Each connection is a separate session with its own ELF file, inputs and
+results, so several clients (in different threads or processes) can use the
+same server at once.
+
+This module only uses the Python standard library, so it doesn't need the
+simulator to be importable.
+
+The protocol is a sequence of messages. Each message is a JSON object (the
+header) and a possibly empty string of bytes (the data). On the wire, it is
+sent as the length of the header and the length of the data (each as a 32-bit
+little-endian integer), followed by the header, encoded as UTF-8, and then the
+data. The client sends a request with a "cmd" field and the server sends back
+exactly one response, which has an "ok" field. If "ok" is false, the
+"error" field says what went wrong.
+
+'''
+
+import json
+import os
+import socket
+import struct
+import subprocess
+import sys
+import time
+from typing import Any, Dict, NamedTuple, Optional, Tuple, Union
+
+# A message header
+Header = Dict[str, Any]
+
+_LENGTHS = struct.Struct('<II')
+
+_SERVER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'server.py')
+
+
+class OTBNServerError(RuntimeError):
+    '''An error reported by the server'''
+    pass
+
+
+def _recv_exactly(sock: socket.socket, length: int) -> Optional[bytes]:
+    '''Read exactly length bytes from sock
+
+    Returns None if the connection is closed before anything is read. Raises
+    a RuntimeError if it is closed part-way through.
+
+    '''
+    chunks = []
+    remaining = length
+    while remaining:
+        chunk = sock.recv(min(remaining, 1 << 20))
+        if not chunk:
+            if remaining == length:
+                return None
+            raise RuntimeError('Connection closed part-way through a '
+                               'message.')
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def send_msg(sock: socket.socket, header: Header, data: bytes = b'') -> None:
+    '''Send a message with the given header and data'''
+    hdr_bytes = json.dumps(header).encode('utf-8')
+    sock.sendall(_LENGTHS.pack(len(hdr_bytes), len(data)) + hdr_bytes + data)
+
+
+def recv_msg(sock: socket.socket) -> Optional[Tuple[Header, bytes]]:
+    '''Receive a message, returning its header and data
+
+    Returns None if the other end has closed the connection.
+
+    '''
+    lengths = _recv_exactly(sock, _LENGTHS.size)
+    if lengths is None:
+        return None
+    hdr_len, data_len = _LENGTHS.unpack(lengths)
+    hdr_bytes = _recv_exactly(sock, hdr_len) or b''
+    data = _recv_exactly(sock, data_len) or b''
+    if len(hdr_bytes) != hdr_len or len(data) != data_len:
+        raise RuntimeError('Connection closed part-way through a message.')
+
+    header = json.loads(hdr_bytes.decode('utf-8'))
+    if not isinstance(header, dict):
+        raise RuntimeError('Message header is not a JSON object.')
+    return (header, data)
+
+
+class RunResult(NamedTuple):
+    '''A summary of a run on the server'''
+    # The number of cycles that the run took
+    cycles: int
+    # The values of the ERR_BITS, INSN_CNT and STOP_PC registers at the end
+    err_bits: int
+    insn_cnt: int
+    stop_pc: int
+    # False if the ELF file defines _expected_end_addr and the run stopped
+    # somewhere else.
+    end_addr_ok: bool
+
+
+class OTBNClient:
+    '''A connection to an OTBN simulator server'''
+    def __init__(self, socket_path: str) -> None:
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._sock.connect(socket_path)
+        except OSError:
+            self._sock.close()
+            raise
+
+    def close(self) -> None:
+        self._sock.close()
+
+    def __enter__(self) -> 'OTBNClient':
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def _request(self, header: Header,
+                 data: bytes = b'') -> Tuple[Header, bytes]:
+        '''Send a request and wait for the response'''
+        send_msg(self._sock, header, data)
+        response = recv_msg(self._sock)
+        if response is None:
+            raise RuntimeError('The server closed the connection.')
+        rsp_header, rsp_data = response
+        if not rsp_header.get('ok'):
+            raise OTBNServerError(rsp_header.get('error', 'Unknown error.'))
+        return (rsp_header, rsp_data)
+
+    def load_elf(self, path: str) -> None:
+        '''Use the ELF file at path for later runs
+
+        This also clears any DMEM images or register values from earlier
+        calls to load_dmem or set_regs. The server reads the file when it
+        runs it, so a relative path is made absolute here first.
+
+        '''
+        self._request({'cmd': 'load_elf', 'path': os.path.abspath(path)})
+
+    def load_dmem(self, data: bytes, at: Union[int, str] = 0) -> None:
+        '''Load data into DMEM at address or symbol at before each run
+
+        data is raw little-endian bytes and at must be word-aligned. This goes
+        on top of the ELF file's initial DMEM contents, and any earlier calls
+        to load_dmem since the last load_elf.
+
+        '''
+        self._request({'cmd': 'load_dmem', 'at': at}, data)
+
+    def set_regs(self, regs: Dict[str, int]) -> None:
+        '''Set registers before each run
+
+        regs maps register names to values, as with the "regs" section of a
+        test case: "x3" for a GPR, "w7" for a WDR or the name of an external
+        register.
+
+        '''
+        self._request({'cmd': 'set_regs', 'regs': regs})
+
+    def run(self) -> RunResult:
+        '''Run the ELF file on the loaded inputs
+
+        The final registers and DMEM are kept on the server: use dump_regs and
+        dump_dmem to get them.
+
+        '''
+        header, _ = self._request({'cmd': 'run'})
+        return RunResult(cycles=header['cycles'],
+                         err_bits=header['err_bits'],
+                         insn_cnt=header['insn_cnt'],
+                         stop_pc=header['stop_pc'],
+                         end_addr_ok=header['end_addr_ok'])
+
+    def dump_regs(self) -> str:
+        '''Get the registers at the end of the last run
+
+        This is in the same format as standalone.py's --dump-regs.
+
+        '''
+        header, _ = self._request({'cmd': 'dump_regs'})
+        regs = header['regs']
+        assert isinstance(regs, str)
+        return regs
+
+    def dump_dmem(self) -> bytes:
+        '''Get DMEM at the end of the last run
+
+        This is in the same format as standalone.py's --dump-dmem.
+
+        '''
+        return self._request({'cmd': 'dump_dmem'})[1]
+
+
+def start_server(socket_path: str,
+                 jobs: Optional[int] = None,
+                 timeout: float = 60.0) -> 'subprocess.Popen[bytes]':
+    '''Start server.py in a subprocess, listening on socket_path
+
+    Waits until the server accepts connections (or raises a RuntimeError
+    after timeout seconds) and then returns the process. The server runs
+    until the process is terminated.
+
+    '''
+    cmd = [sys.executable, _SERVER_PATH, socket_path]
+    if jobs is not None:
+        cmd += ['--jobs', str(jobs)]
+    proc = subprocess.Popen(cmd)
+
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            OTBNClient(socket_path).close()
+            return proc
+        except OSError:
+            pass
+
+        if proc.poll() is not None:
+            raise RuntimeError('The OTBN simulator server exited with status '
+                               '{} before it started listening.'
+                               .format(proc.returncode))
+        if time.monotonic() > deadline:
+            proc.terminate()
+            proc.wait()
+            raise RuntimeError('Timed out waiting for the OTBN simulator '
+                               'server to start.')
+        time.sleep(0.05)
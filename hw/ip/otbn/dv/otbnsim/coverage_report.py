@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# Copyright lowRISC contributors (OpenTitan project).
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Write an lcov report for the runs in a coverage database
+
+The database is filled in by standalone.py (with --coverage-db) or by
+stepped.py (with the OTBN_SIM_COVERAGE_DB environment variable).
+
+'''
+
+import argparse
+import os
+import sys
+
+from sim.coverage_db import CoverageDB
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('db', help='The coverage database.')
+    parser.add_argument(
+        '-o', '--output',
+        metavar="FILE",
+        type=argparse.FileType('w'),
+        default=sys.stdout,
+        help="the file to write the lcov report to (default: STDOUT)."
+    )
+    parser.add_argument(
+        '--summary',
+        action='store_true',
+        help=("print the number of runs of each ELF file (keyed by its "
+              "SHA-256 hash) to STDERR.")
+    )
+    args = parser.parse_args()
+
+    # Connecting would create an empty database, which is never what we want.
+    if not os.path.exists(args.db):
+        print(f'No coverage database at {args.db}.', file=sys.stderr)
+        return 1
+
+    with CoverageDB(args.db) as db:
+        if args.summary:
+            for digest, runs in db.get_runs().items():
+                print(f'{digest}: {runs} runs', file=sys.stderr)
+        args.output.write(db.dump_lcov_coverage())
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# Copyright lowRISC contributors (OpenTitan project).
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''A long-running OTBN simulator that serves runs over a Unix socket
+
+Starting a Python interpreter and loading the simulator costs much more than
+a short OTBN run. This server pays that cost once: it listens on a Unix
+domain socket and runs programs in the standalone simulator for any number of
+clients, which can connect at the same time. The runs are spread across a
+pool of worker processes. Each worker keeps the ELF files that it has decoded
+(see read_elf_image) and the basic blocks that it has compiled for them, so
+running the same binary again is cheap.
+
+Use client.py to talk to the server. Each connection is a session with these
+commands:
+
+    load_elf      Use an ELF file (given by path) for later runs. This clears
+                  any DMEM images or registers from the session.
+
+    load_dmem     Load a DMEM image at an address or symbol before each run.
+
+    set_regs      Set registers before each run.
+
+    run           Run the ELF file, as standalone.py does, and return the
+                  cycle count, ERR_BITS, INSN_CNT and STOP_PC.
+
+    dump_regs     Return the registers at the end of the last run.
+
+    dump_dmem     Return DMEM at the end of the last run.
+
+The server stops when it gets SIGINT or SIGTERM.
+
+'''
+
+import argparse
+import io
+import multiprocessing
+import multiprocessing.pool
+import os
+import signal
+import socketserver
+import stat
+import sys
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from client import Header, recv_msg, send_msg
+from sim.blocks import BlockEngine
+from sim.load_elf import ElfImage, load_elf_image, read_elf_image
+from sim.standalonesim import StandaloneSim
+
+
+class RunJob(NamedTuple):
+    '''Everything that a worker needs to do a run'''
+    elf_path: str
+    # DMEM images to load on top of the ELF file's initial DMEM contents, in
+    # order. Each is (address or symbol, data).
+    dmem_loads: List[Tuple[Union[int, str], bytes]]
+    regs: Dict[str, int]
+
+
+class JobResult(NamedTuple):
+    '''The result of a RunJob'''
+    cycles: int
+    err_bits: int
+    insn_cnt: int
+    stop_pc: int
+    end_addr_ok: bool
+    regs: str
+    dmem: bytes
+
+
+# The cache directory for decoded ELF files, set by _init_worker.
+_CACHE_DIR: Optional[str] = None
+
+# Block engines for the ELF images that we have run recently, keyed by the id
+# of the image. The image is stored too, which keeps it alive (so the id can't
+# be reused) and lets us check that we have the right one.
+_ENGINES: 'OrderedDict[int, Tuple[ElfImage, BlockEngine]]' = OrderedDict()
+_ENGINES_SIZE = 16
+
+
+def _init_worker(cache_dir: Optional[str], in_pool: bool) -> None:
+    global _CACHE_DIR
+    _CACHE_DIR = cache_dir
+
+    # The server process handles SIGINT. Don't let a Ctrl-C at the terminal
+    # make every worker print a traceback too.
+    if in_pool:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _get_engine(image: ElfImage) -> BlockEngine:
+    '''Get a block engine for image's program
+
+    The engine only depends on the program, which never changes, so sims that
+    run the same image can share one and its compiled blocks.
+
+    '''
+    entry = _ENGINES.get(id(image))
+    if entry is not None and entry[0] is image:
+        _ENGINES.move_to_end(id(image))
+        return entry[1]
+
+    engine = BlockEngine(image.program)
+    _ENGINES[id(image)] = (image, engine)
+    if len(_ENGINES) > _ENGINES_SIZE:
+        _ENGINES.popitem(last=False)
+    return engine
+
+
+def _get_load_addr(image: ElfImage, at: Union[int, str]) -> int:
+    '''Interpret the address of a DMEM image as a symbol or an address'''
+    if isinstance(at, str):
+        if at not in image.symbols:
+            raise ValueError('{!r} is not a symbol in the ELF file.'
+                             .format(at))
+        addr = image.symbols[at]
+    else:
+        addr = at
+    if addr & 3:
+        raise ValueError('Cannot load DMEM at the unaligned address {:#x}.'
+                         .format(addr))
+    return addr
+
+
+def _run_job(job: RunJob) -> JobResult:
+    '''Do a run in the standalone simulator'''
+    image = read_elf_image(job.elf_path, _CACHE_DIR)
+
+    sim = StandaloneSim(tracing=False)
+    exp_end_addr = load_elf_image(sim, image)
+    sim.blocks = _get_engine(image)
+
+    sim.load_test_sideload_keys()
+
+    for at, data in job.dmem_loads:
+        addr = _get_load_addr(image, at)
+        sim.state.dmem.load_le_words(data, has_validity=False,
+                                     word_offset=addr // 4)
+    sim.load_regs_vars(job.regs)
+
+    sim.state.ext_regs.commit()
+
+    sim.start(collect_stats=False)
+
+    regs = io.StringIO()
+    cycles = sim.run(verbose=False, dump_file=regs)
+
+    return JobResult(cycles=cycles,
+                     err_bits=sim.state.ext_regs.read('ERR_BITS', False),
+                     insn_cnt=sim.state.ext_regs.read('INSN_CNT', False),
+                     stop_pc=sim.state.ext_regs.read('STOP_PC', False),
+                     end_addr_ok=(exp_end_addr is None or
+                                  sim.state.pc == exp_end_addr),
+                     regs=regs.getvalue(),
+                     dmem=sim.dump_data())
+
+
+class _Session:
+    '''The state for one client connection'''
+    def __init__(self) -> None:
+        self.elf_path: Optional[str] = None
+        self.dmem_loads: List[Tuple[Union[int, str], bytes]] = []
+        self.regs: Dict[str, int] = {}
+        self.result: Optional[JobResult] = None
+
+    def get_result(self) -> JobResult:
+        if self.result is None:
+            raise ValueError('No run has finished yet.')
+        return self.result
+
+
+class SimServer(socketserver.ThreadingUnixStreamServer):
+    '''A server that does runs for clients in a pool of workers
+
+    If jobs is 1, there is no pool: runs happen one at a time in the server
+    process.
+
+    '''
+    daemon_threads = True
+
+    def __init__(self,
+                 socket_path: str,
+                 jobs: int,
+                 cache_dir: Optional[str] = None) -> None:
+        # Remove a socket left behind by an earlier server (but don't delete
+        # anything else that happens to be at socket_path).
+        try:
+            if stat.S_ISSOCK(os.stat(socket_path).st_mode):
+                os.unlink(socket_path)
+        except FileNotFoundError:
+            pass
+
+        self.socket_path = socket_path
+        self._pool: Optional[multiprocessing.pool.Pool] = None
+        self._lock = threading.Lock()
+        if jobs > 1:
+            self._pool = multiprocessing.Pool(jobs,
+                                              initializer=_init_worker,
+                                              initargs=(cache_dir, True))
+        else:
+            _init_worker(cache_dir, False)
+
+        super().__init__(socket_path, _SessionHandler)
+
+    def run_job(self, job: RunJob) -> JobResult:
+        if self._pool is not None:
+            return self._pool.apply(_run_job, (job,))
+
+        with self._lock:
+            return _run_job(job)
+
+    def server_close(self) -> None:
+        super().server_close()
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+
+# A command handler. This takes the session, request header and data and
+# returns the response header (without "ok") and data.
+_Handler = Callable[[SimServer, _Session, Header, bytes],
+                    Tuple[Header, bytes]]
+
+
+def on_load_elf(server: SimServer, session: _Session,
+                header: Header, data: bytes) -> Tuple[Header, bytes]:
+    path = header.get('path')
+    if not isinstance(path, str):
+        raise ValueError('load_elf needs a path.')
+    if not os.path.isfile(path):
+        raise ValueError('No such file: {!r}.'.format(path))
+
+    session.elf_path = path
+    session.dmem_loads = []
+    session.regs = {}
+    session.result = None
+    return ({}, b'')
+
+
+def on_load_dmem(server: SimServer, session: _Session,
+                 header: Header, data: bytes) -> Tuple[Header, bytes]:
+    at = header.get('at', 0)
+    if not isinstance(at, (int, str)):
+        raise ValueError('The address for load_dmem should be an integer '
+                         'or a symbol name.')
+    session.dmem_loads.append((at, data))
+    return ({}, b'')
+
+
+def on_set_regs(server: SimServer, session: _Session,
+                header: Header, data: bytes) -> Tuple[Header, bytes]:
+    regs = header.get('regs')
+    if not (isinstance(regs, dict) and
+            all(isinstance(v, int) for v in regs.values())):
+        raise ValueError('set_regs needs a dictionary of register values.')
+    session.regs.update(regs)
+    return ({}, b'')
+
+
+def on_run(server: SimServer, session: _Session,
+           header: Header, data: bytes) -> Tuple[Header, bytes]:
+    if session.elf_path is None:
+        raise ValueError('No ELF file loaded.')
+
+    session.result = None
+    result = server.run_job(RunJob(elf_path=session.elf_path,
+                                   dmem_loads=session.dmem_loads,
+                                   regs=session.regs))
+    session.result = result
+    return ({'cycles': result.cycles,
+             'err_bits': result.err_bits,
+             'insn_cnt': result.insn_cnt,
+             'stop_pc': result.stop_pc,
+             'end_addr_ok': result.end_addr_ok}, b'')
+
+
+def on_dump_regs(server: SimServer, session: _Session,
+                 header: Header, data: bytes) -> Tuple[Header, bytes]:
+    return ({'regs': session.get_result().regs}, b'')
+
+
+def on_dump_dmem(server: SimServer, session: _Session,
+                 header: Header, data: bytes) -> Tuple[Header, bytes]:
+    return ({}, session.get_result().dmem)
+
+
+_HANDLERS: Dict[str, _Handler] = {
+    'load_elf': on_load_elf,
+    'load_dmem': on_load_dmem,
+    'set_regs': on_set_regs,
+    'run': on_run,
+    'dump_regs': on_dump_regs,
+    'dump_dmem': on_dump_dmem,
+}
+
+
+class _SessionHandler(socketserver.BaseRequestHandler):
+    '''Handle the requests from one client connection'''
+    def handle(self) -> None:
+        server = self.server
+        assert isinstance(server, SimServer)
+        session = _Session()
+
+        while True:
+            msg = recv_msg(self.request)
+            if msg is None:
+                return
+            header, data = msg
+
+            cmd = header.get('cmd')
+            handler = _HANDLERS.get(cmd) if isinstance(cmd, str) else None
+            if handler is None:
+                send_msg(self.request,
+                         {'ok': False,
+                          'error': 'Unknown command: {!r}.'.format(cmd)})
+                continue
+
+            try:
+                rsp_header, rsp_data = handler(server, session, header, data)
+            except Exception as err:
+                send_msg(self.request,
+                         {'ok': False,
+                          'error': '{}: {}'.format(type(err).__name__, err)})
+                continue
+
+            rsp_header['ok'] = True
+            send_msg(self.request, rsp_header, rsp_data)
+
+
+def _on_sigterm(signum: int, frame: object) -> None:
+    # Raising SystemExit gets us out of serve_forever and runs the cleanup in
+    # main.
+    sys.exit(0)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('socket', help='path of the Unix socket to listen on.')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help=("number of worker processes. Defaults to the "
+                              "number of CPUs."))
+    parser.add_argument('--cache-dir', metavar='DIR',
+                        default=os.environ.get('OTBN_SIM_CACHE_DIR'),
+                        help=("cache decoded ELF files in this directory. "
+                              "Defaults to $OTBN_SIM_CACHE_DIR, if set."))
+    args = parser.parse_args()
+
+    if args.jobs is None or args.jobs < 1:
+        args.jobs = 1
+
+    signal.signal(signal.SIGTERM, _on_sigterm)
+
+    server = SimServer(args.socket, args.jobs, args.cache_dir)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+# Copyright lowRISC contributors (OpenTitan project).
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''A basic-block execution engine for the standalone simulator
+
+When running standalone, most cycles are spent executing straight-line code
+where nothing happens outside the core: there are no RND, KMAC or MAI
+accesses, no stall requests and no injected errors. OTBNSim.step() still does
+all of its per-cycle bookkeeping for these cycles (stepping the EDN clients,
+KMAC and the MAI, checking for pending errors and stall requests, fetching
+each instruction and so on).
+
+The BlockEngine splits the program into straight-line basic blocks (in the
+sense of shared/control_flow.py: runs of instructions whose straight-line
+property is set in insns.yml) and compiles each block into a single callable
+the first time it is run. That callable runs every cycle of the block,
+skipping the bookkeeping that can't have any effect.
+
+Control flow instructions and CSR/WSR accesses (which include all accesses to
+RND, URND, KMAC and the MAI) are never part of a block, so they always go
+through OTBNSim.step(). If something unusual happens part-way through a block
+(an error, a loop back-edge or a delayed error from the next cycle), the block
+stops at the end of that cycle and leaves the simulator exactly as if it had
+been stepping one cycle at a time.
+
+'''
+
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from shared.section import CodeSection
+
+from .decode import IllegalInsn
+from .insn import BNWSRR, BNWSRW, CSRRS, CSRRW
+from .isa import OTBNInsn
+from .state import FsmState
+
+if TYPE_CHECKING:
+    from .sim import OTBNSim
+
+# A compiled block. This takes the simulator and a cycle budget and runs the
+# block (stopping early once it has used the budget), returning the number of
+# cycles that it took.
+BlockFn = Callable[['OTBNSim', int], int]
+
+# Instruction classes that are straight-line but can't go in a block because
+# they might access RND, URND, KMAC or the MAI (or otherwise need the
+# per-cycle handling in OTBNSim.step).
+_NON_BLOCK_CLASSES = (BNWSRR, BNWSRW, CSRRS, CSRRW, IllegalInsn)
+
+
+def _can_run_in_block(insn: OTBNInsn) -> bool:
+    '''Can insn be part of a basic block?'''
+    return (insn.has_bits and
+            not isinstance(insn, _NON_BLOCK_CLASSES) and
+            bool(insn.insn.straight_line) and
+            not insn.affects_control)
+
+
+def _compile_block(steps: Tuple[Tuple[int, OTBNInsn], ...]) -> BlockFn:
+    '''Compile a straight-line sequence of (pc, insn) pairs to a callable'''
+
+    bound_steps = tuple((pc, insn, insn.execute) for pc, insn in steps)
+    no_warps: Dict[int, int] = {}
+
+    def run_block(sim: 'OTBNSim', budget: int) -> int:
+        state = sim.state
+        urnd = state.wsrs.URND
+        stats = sim.stats
+        loop_warps = sim.loop_warps
+        prof = sim.sim_profile
+
+        cycles = 0
+        for pc, insn, execute in bound_steps:
+            # The first cycle of the instruction. This matches
+            # OTBNSim._step_exec, but we know that the rest of the state (EDN,
+            # KMAC, MAI etc.) doesn't need stepping, so we just step URND.
+            # No instruction in a block affects control flow, so we can pass
+            # False to pre_insn.
+            urnd.step()
+            cycles += 1
+            if prof is not None:
+                exec_start = perf_counter()
+            state.pre_insn(False)
+            gen = execute(state)
+
+            # If the instruction takes multiple cycles, its execute() method
+            # returned a generator. Run that to completion, modelling a stall
+            # cycle for each yield. If the instruction fails, it is aborted
+            # (and retires immediately), just like in _step_exec.
+            while gen is not None:
+                try:
+                    next(gen)
+                except StopIteration:
+                    break
+                if state.pending_halt:
+                    break
+
+                if prof is not None:
+                    prof.add_insn(insn.insn.mnemonic, exec_start)
+
+                state.commit(sim_stalled=True)
+                if stats is not None:
+                    stats.record_stall(state)
+
+                # If the instruction caused a delayed error or we have run out
+                # of cycles, let the generic stepping code handle the rest of
+                # the instruction.
+                if state.has_pending_err_bits() or cycles >= budget:
+                    sim._next_insn = insn
+                    sim._execute_generator = gen
+                    return cycles
+
+                urnd.step()
+                cycles += 1
+                if prof is not None:
+                    exec_start = perf_counter()
+
+            # The instruction has finished. This matches OTBNSim._on_retire.
+            if prof is not None:
+                prof.add_insn(insn.insn.mnemonic, exec_start)
+            state.post_insn(loop_warps.get(pc, no_warps))
+            if stats is not None:
+                stats.record_insn(insn, state)
+            halting = state.stop_if_pending_halt()
+            state.commit(sim_stalled=False)
+
+            if halting:
+                sim._next_insn = None
+                return cycles
+
+            # Stop early if we've gone back to the top of a loop, have an
+            # error to take on the next cycle or have run out of cycles.
+            if (state.pc != pc + 4 or state.has_pending_err_bits() or
+                    cycles >= budget):
+                break
+
+        sim._next_insn = sim._fetch(state.pc)
+        return cycles
+
+    return run_block
+
+
+class BlockEngine:
+    '''Finds, compiles and runs basic blocks in a program'''
+    def __init__(self, program: List[OTBNInsn]) -> None:
+        self._program = program
+        # Compiled blocks, keyed by start PC. The value is None if there is no
+        # block starting at that PC (because the instruction there can't run
+        # in a block).
+        self._blocks: Dict[int, Optional[BlockFn]] = {}
+
+    def _find_block(self, start_pc: int) -> Optional[CodeSection]:
+        '''Find the longest block starting at start_pc'''
+        end_idx = start_pc >> 2
+        while (end_idx < len(self._program) and
+               _can_run_in_block(self._program[end_idx])):
+            end_idx += 1
+
+        if end_idx == start_pc >> 2:
+            return None
+
+        return CodeSection(start_pc, 4 * end_idx - 4)
+
+    def _get_block(self, pc: int) -> Optional[BlockFn]:
+        '''Get the compiled block starting at pc, compiling it if necessary'''
+        if pc in self._blocks:
+            return self._blocks[pc]
+
+        fn = None
+        section = self._find_block(pc)
+        if section is not None:
+            steps = tuple((pc, self._program[pc >> 2]) for pc in section)
+            fn = _compile_block(steps)
+
+        self._blocks[pc] = fn
+        return fn
+
+    def try_run(self, sim: 'OTBNSim') -> int:
+        '''Try to run a basic block starting at the current PC
+
+        If the simulator is in a state where it can run a block and there is
+        one that starts at the current PC, run it and return the number of
+        cycles taken. Otherwise return zero: the caller should use
+        OTBNSim.step() to step a cycle instead.
+
+        '''
+        state = sim.state
+        if (sim._next_insn is None or
+                sim._execute_generator is not None or
+                state.get_fsm_state() != FsmState.EXEC):
+            return 0
+
+        # The block doesn't step anything outside the core, so it can only
+        # run for as long as nothing there needs stepping.
+        budget = state.quiet_cycles()
+        if not budget:
+            return 0
+
+        block = self._get_block(state.pc)
+        if block is None:
+            return 0
+
+        cycles = block(sim, budget)
+        state.skip_quiet_cycles(cycles)
+        return cycles
@@ -0,0 +1,176 @@
+# Copyright lowRISC contributors (OpenTitan project).
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''A database of line coverage, merged over many simulation runs
+
+Writing an lcov file for every run and merging them afterwards is slow when
+there are thousands of runs. Instead, each run can add the number of times it
+executed each PC to a CoverageDB, which is an SQLite database keyed by a hash
+of the ELF file and the PC. The first run of each ELF file also stores the
+source lines that an lcov report for it should describe, so a single report
+can be rendered at the end without needing the ELF files again.
+
+SQLite does the locking, so concurrent runs (from different processes) can
+add to the same database. Each run is added in one transaction.
+
+'''
+
+import sqlite3
+from collections import defaultdict
+from typing import Dict, List, Mapping, Optional
+
+from elftools.elf.elffile import ELFFile
+
+from shared.disk_cache import file_digest
+
+from .stats import (LineHits, SourceLine, format_lcov, lcov_line_hits,
+                    lcov_source_lines)
+
+# Bump this if the schema changes.
+_SCHEMA_VERSION = 1
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS programs (
+    digest TEXT PRIMARY KEY,
+    runs INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS lines (
+    digest TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    addr INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    lineno INTEGER NOT NULL,
+    PRIMARY KEY (digest, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS hits (
+    digest TEXT NOT NULL,
+    pc INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (digest, pc)
+) WITHOUT ROWID;
+'''
+
+
+class CoverageDB:
+    '''Accumulated line coverage for OTBN programs, stored in SQLite'''
+    def __init__(self, path: str, timeout: float = 60) -> None:
+        # We manage transactions ourselves (isolation_level=None), so that
+        # each run can take the write lock up front with BEGIN IMMEDIATE.
+        # This avoids deadlocks between concurrent writers that would
+        # otherwise both start by reading.
+        self._conn = sqlite3.connect(path, timeout=timeout,
+                                     isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+
+        version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+        if version not in [0, _SCHEMA_VERSION]:
+            self._conn.close()
+            raise RuntimeError(f'Coverage database at {path} has schema '
+                               f'version {version}, but we expected '
+                               f'{_SCHEMA_VERSION}.')
+        if version == 0:
+            # Another process might be creating the tables at the same time,
+            # but the schema uses IF NOT EXISTS, so that's fine.
+            self._conn.executescript('BEGIN IMMEDIATE;' + _SCHEMA +
+                                     f'PRAGMA user_version={_SCHEMA_VERSION};'
+                                     'COMMIT;')
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> 'CoverageDB':
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def _has_program(self, digest: str) -> bool:
+        row = self._conn.execute('SELECT 1 FROM programs WHERE digest = ?',
+                                 (digest,)).fetchone()
+        return row is not None
+
+    def add_run(self,
+                elf_path: str,
+                coverage: Mapping[int, int],
+                digest: Optional[str] = None) -> None:
+        '''Add the coverage from one run of the ELF file at elf_path
+
+        coverage maps PCs to the number of times they were executed (as in
+        ExecutionStats.coverage). If the caller has already hashed the ELF
+        file, it can pass the hash as digest.
+
+        '''
+        if digest is None:
+            digest = file_digest(elf_path)
+
+        # Only read the debug information the first time we see an ELF file.
+        # Doing this outside the transaction keeps the lock short. If two
+        # runs race to add the same new ELF file, both read the lines but
+        # only the first stores them.
+        lines: Optional[List[SourceLine]] = None
+        if not self._has_program(digest):
+            with open(elf_path, 'rb') as handle:
+                lines = lcov_source_lines(ELFFile(handle))
+
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = self._conn.execute(
+                'INSERT OR IGNORE INTO programs (digest, runs) VALUES (?, 0)',
+                (digest,))
+            if cursor.rowcount and lines is not None:
+                self._conn.executemany(
+                    'INSERT INTO lines (digest, seq, addr, path, lineno) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    ((digest, seq, line.addr, line.path, line.lineno)
+                     for seq, line in enumerate(lines)))
+
+            self._conn.execute(
+                'UPDATE programs SET runs = runs + 1 WHERE digest = ?',
+                (digest,))
+            self._conn.executemany(
+                'INSERT INTO hits (digest, pc, count) VALUES (?, ?, ?) '
+                'ON CONFLICT (digest, pc) DO UPDATE '
+                'SET count = count + excluded.count',
+                ((digest, pc, count)
+                 for pc, count in coverage.items() if count))
+        except BaseException:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._conn.execute('COMMIT')
+
+    def get_runs(self) -> Dict[str, int]:
+        '''Return the number of runs added for each ELF file hash'''
+        return dict(self._conn.execute(
+            'SELECT digest, runs FROM programs ORDER BY digest'))
+
+    def get_hits(self, digest: str) -> Dict[int, int]:
+        '''Return the total hit count for each PC of an ELF file'''
+        return dict(self._conn.execute(
+            'SELECT pc, count FROM hits WHERE digest = ? ORDER BY pc',
+            (digest,)))
+
+    def dump_lcov_coverage(self) -> str:
+        '''Render the coverage of every program as one lcov tracefile
+
+        Hit counts for each program are worked out as in
+        ExecutionStatAnalyzer.dump_lcov_coverage. If several programs include
+        the same source line, their hit counts are added together.
+
+        '''
+        merged: LineHits = defaultdict(dict)
+        for digest in self.get_runs():
+            lines = [SourceLine(addr, path, lineno)
+                     for addr, path, lineno in self._conn.execute(
+                         'SELECT addr, path, lineno FROM lines '
+                         'WHERE digest = ? ORDER BY seq', (digest,))]
+            if not lines:
+                continue
+
+            hits = lcov_line_hits(lines, self.get_hits(digest))
+            for path, path_hits in hits.items():
+                merged_hits = merged[path]
+                for lineno, count in path_hits.items():
+                    merged_hits[lineno] = merged_hits.get(lineno, 0) + count
+
+        return format_lcov(merged) if merged else ''
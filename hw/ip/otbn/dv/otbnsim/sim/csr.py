@@ -51,9 +51,8 @@ class CSRFile:
     '''A model of the CSR file'''
     def __init__(self, wsrs: WSRFile) -> None:
         self.flags = FlagGroups()
-        self.RND_PREFETCH = WrapperCSR(
-            write_func=lambda val: wsrs.RND.request_value()
-        )
+        self._wsrs = wsrs
+        self.RND_PREFETCH = WrapperCSR(write_func=self._write_rnd_prefetch)
         self.KMAC_STATUS = KmacStatusCSR('KMAC_STATUS')
         self.KMAC_IF_STATUS = KmacIfStatusCSR('KMAC_IF_STATUS')
         self.KMAC_INTR = KmacIntrCSR('KMAC_INTR')
@@ -87,6 +86,11 @@ class CSRFile:
             CsrAddrs.MAI_STATUS: self.MAI_STATUS,
         }
 
+    def _write_rnd_prefetch(self, value: int) -> None:
+        # This is a bound method rather than a lambda so that a deep copy of
+        # the CSR file (see OTBNState.snapshot) points at the copied WSRs.
+        self._wsrs.RND.request_value()
+
     @staticmethod
     def _get_field(field_idx: int, field_size: int, val: int) -> int:
         mask = (1 << field_size) - 1
@@ -5,7 +5,10 @@
 '''Code to load instruction words into a simulator'''
 
 import struct
-from typing import Iterator, List, Optional, Tuple
+from functools import lru_cache
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Type
+
+from shared.operand import ImmOperandType
 
 from .constants import ErrBits
 from .isa import INSNS_FILE, OTBNInsn
@@ -62,25 +65,71 @@ class EmptyInsn(OTBNInsn):
         return None
 
 
-def _decode_word(pc: int, word: int) -> OTBNInsn:
+def _has_pc_rel_operand(cls: Type[OTBNInsn]) -> bool:
+    '''Does the instruction have an operand whose value depends on the PC?'''
+    return any(isinstance(op.op_type, ImmOperandType) and op.op_type.pc_rel
+               for op in cls.insn.operands)
+
+
+# The classes for instructions whose operand values don't depend on the PC
+_PC_INDEPENDENT_CLASSES = {cls for cls in INSN_CLASSES
+                           if not _has_pc_rel_operand(cls)}
+
+
+class _WordInfo(NamedTuple):
+    '''The result of decoding a 32-bit word, independent of its address
+
+    If the word doesn't decode, cls is None and msg explains why. Otherwise,
+    enc_vals holds the encoded operand values. If the operand values don't
+    depend on the PC, op_vals holds them too.
+
+    '''
+    cls: Optional[Type[OTBNInsn]]
+    msg: str
+    enc_vals: Dict[str, int]
+    op_vals: Optional[Dict[str, int]]
+
+
+@lru_cache(maxsize=1 << 16)
+def _decode_word_info(word: int) -> _WordInfo:
+    '''Decode a 32-bit word as far as we can without knowing its address
+
+    Programs (and the programs loaded one after another in a DV regression)
+    contain lots of copies of the same words, so this is cached.
+
+    '''
     mnem = INSNS_FILE.mnem_for_word(word)
     if mnem is None:
-        return IllegalInsn(pc, word, 'No legal decoding')
+        return _WordInfo(None, 'No legal decoding', {}, None)
 
     cls = MNEM_TO_CLASS.get(mnem)
     if cls is None:
-        return IllegalInsn(pc, word, f'No insn class for mnemonic {mnem}')
+        return _WordInfo(None, f'No insn class for mnemonic {mnem}', {}, None)
 
     # Decode the instruction. We know that we have an encoding (we checked in
     # get_insn_masks).
     assert cls.insn.encoding is not None
     enc_vals = cls.insn.encoding.extract_operands(word)
 
-    # Make sense of these encoded values as "operand values" (doing any
-    # shifting, sign interpretation etc.)
-    op_vals = cls.insn.enc_vals_to_op_vals(pc, enc_vals)
+    # If we can, make sense of these encoded values as "operand values" (doing
+    # any shifting, sign interpretation etc.). The PC passed here is ignored.
+    op_vals = None
+    if cls in _PC_INDEPENDENT_CLASSES:
+        op_vals = cls.insn.enc_vals_to_op_vals(0, enc_vals)
+
+    return _WordInfo(cls, '', enc_vals, op_vals)
+
+
+def _decode_word(pc: int, word: int) -> OTBNInsn:
+    info = _decode_word_info(word)
+    if info.cls is None:
+        return IllegalInsn(pc, word, info.msg)
+
+    op_vals = info.op_vals
+    if op_vals is None:
+        op_vals = info.cls.insn.enc_vals_to_op_vals(pc, info.enc_vals)
 
-    return cls(word, op_vals)
+    return info.cls(word, op_vals)
 
 
 def decode_words(base_addr: int,
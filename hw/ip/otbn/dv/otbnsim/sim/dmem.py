@@ -2,7 +2,6 @@
 # Licensed under the Apache License, Version 2.0, see LICENSE for details.
 # SPDX-License-Identifier: Apache-2.0
 
-import struct
 from typing import Dict, List, Sequence, Tuple
 
 from shared.mem_layout import get_memory_layout
@@ -22,13 +21,26 @@ class TraceDmemStore(Trace):
         return 'dmem[{:#x}..{:#x}] = {:#x}'.format(self.addr, top, self.value)
 
 
+# A table that expands a byte from the validity bitmap (one bit per 32-bit
+# word) to 8 bytes, one for each word, that are 1 for valid words and 0 for
+# invalid ones.
+_VALIDITY_BYTES = [bytes((byte >> i) & 1 for i in range(8))
+                   for byte in range(256)]
+
+# A table for bytes.translate that maps a validity byte from _VALIDITY_BYTES to
+# 0xff for a valid word and 0x00 for an invalid one.
+_WORD_MASK_TABLE = bytes([0, 0xff]) + bytes(254)
+
+
 class Dmem:
     '''An object representing OTBN's DMEM.
 
-    Memory is stored as an array of 32-byte words (the native width for the
-    OTBN wide side). These words are stored as 256-bit unsigned integers. This
-    is the same width as the wide-side registers (to avoid unnecessary
-    packing/unpacking work), but the unsigned values simplify tracing.
+    Memory is stored as a flat little-endian bytearray, together with a
+    validity bitmap that has a bit for each 32-bit word (so one byte for each
+    256-bit word, the native width for the OTBN wide side). Wide loads and
+    stores convert directly between a 32-byte slice of the memory and a
+    256-bit unsigned integer, which is the same width as the wide-side
+    registers.
 
     '''
 
@@ -47,14 +59,17 @@ class Dmem:
             raise RuntimeError('DMEM size ({}) is not divisible by 32.'
                                .format(dmem_size))
 
-        # We represent the contents of DMEM as a list of 32-bit words (unlike
-        # the RTL, which uses an array of 256-bit words). An entry in self.data
-        # is a tuple of (value, validity). The value is an integer representing
-        # the 32-bit word, and validity is a boolean indicating whether the
-        # word has valid integrity bits. If validity is False, we'll get
-        # an error if we try to read it.
-        num_words = dmem_size // 4
-        self.data: List[Tuple[int, bool]] = [(0, False)] * num_words
+        # The contents of DMEM. self.view is a memoryview of self.data, which
+        # lets us take slices without copying them.
+        self.data = bytearray(dmem_size)
+        self.view = memoryview(self.data)
+
+        # The validity bitmap. Bit i of self.valid[j] is set if 32-bit word
+        # 8 * j + i has valid integrity bits. If it is clear, we'll get an
+        # error if we try to read that word. Note that an invalid word keeps
+        # its contents (which can still be read, along with a validity flag of
+        # False).
+        self.valid = bytearray(dmem_size // 32)
 
         # Because it's an actual memory, stores to DMEM take two cycles in the
         # RTL. We wouldn't need to model this except that a DMEM invalidation
@@ -66,7 +81,34 @@ class Dmem:
         # self.pending list. Entries here will only make it to self.data on the
         # next commit().
         self.trace: List[TraceDmemStore] = []
-        self.pending: Dict[int, int] = {}
+        self.pending: List[TraceDmemStore] = []
+
+    def __getstate__(self) -> Dict[str, object]:
+        # A memoryview can't be pickled or copied, so drop it here and make a
+        # new one in __setstate__.
+        state = self.__dict__.copy()
+        del state['view']
+        return state
+
+    def __setstate__(self, state: Dict[str, object]) -> None:
+        self.__dict__.update(state)
+        self.view = memoryview(self.data)
+
+    def _set_valid(self, word_idx: int, valid: bool) -> None:
+        '''Set or clear the validity bit for a 32-bit word'''
+        bit = 1 << (word_idx & 7)
+        if valid:
+            self.valid[word_idx >> 3] |= bit
+        else:
+            self.valid[word_idx >> 3] &= ~bit
+
+    def _check_load_size(self, num_bytes: int, word_offset: int) -> None:
+        '''Raise a ValueError if num_bytes won't fit at word_offset'''
+        if 4 * word_offset + num_bytes > len(self.data):
+            raise ValueError('Trying to load {} bytes of data at byte offset '
+                             '{}, but DMEM is only {} bytes long.'
+                             .format(num_bytes, 4 * word_offset,
+                                     len(self.data)))
 
     def _load_5byte_le_words(self, data: bytes, word_offset: int) -> None:
         '''Replace the memory start at word_offset with data
@@ -81,25 +123,25 @@ class Dmem:
                              'which is not a multiple of 5.'
                              .format(len(data)))
 
-        len_data_32 = len(data) // 5
-        len_mem_32 = (256 // 32) * len(self.data)
+        num_words = len(data) // 5
+        self._check_load_size(4 * num_words, word_offset)
 
-        if len_data_32 > len_mem_32:
-            raise ValueError('Trying to load {} bytes of data, but DMEM '
-                             'is only {} bytes long.'
-                             .format(4 * len_data_32, 32 * len(self.data)))
+        validity = data[0::5]
+        bad_vld = validity.translate(None, b'\x00\x01')
+        if bad_vld:
+            idx32 = validity.index(bad_vld[0])
+            raise ValueError('The validity byte for 32-bit word {} '
+                             'in the input data is {}, not 0 or 1.'
+                             .format(idx32, bad_vld[0]))
 
-        # Zero-pad up to the next 32-bit word, represented by 5 bytes. Because
-        # things are little-endian, this is like zero-extending the last word.
-        if len(data) % 5:
-            data = data + b'0' * (5 - (len(data) % 5))
+        # Scatter the four bytes of each word into place
+        lo = 4 * word_offset
+        hi = lo + 4 * num_words
+        for i in range(4):
+            self.data[lo + i:hi:4] = data[1 + i::5]
 
-        for idx32, (vld, u32) in enumerate(struct.iter_unpack('<BI', data)):
-            if vld not in [0, 1]:
-                raise ValueError('The validity byte for 32-bit word {} '
-                                 'in the input data is {}, not 0 or 1.'
-                                 .format(idx32, vld))
-            self.data[idx32 + word_offset] = (u32, vld)
+        for idx32, vld in enumerate(validity):
+            self._set_valid(word_offset + idx32, vld != 0)
 
     def _load_4byte_le_words(self, data: bytes, word_offset: int) -> None:
         '''Replace the memory start at word_offset with data
@@ -108,17 +150,18 @@ class Dmem:
         little-endian format.
 
         '''
-        if len(data) > 32 * len(self.data):
-            raise ValueError('Trying to load {} bytes of data, but DMEM '
-                             'is only {} bytes long.'
-                             .format(len(data), 32 * len(self.data)))
         # Zero-pad bytes up to the next multiple of 32 bits (because things
         # are little-endian, is like zero-extending the last word).
         if len(data) % 4:
-            data = data + b'0' * (32 - (len(data) % 32))
+            data = bytes(data) + bytes(4 - (len(data) % 4))
+
+        self._check_load_size(len(data), word_offset)
+
+        lo = 4 * word_offset
+        self.view[lo:lo + len(data)] = data
 
-        for idx32, u32 in enumerate(struct.iter_unpack('<I', data)):
-            self.data[idx32 + word_offset] = (u32[0], True)
+        for idx32 in range(word_offset, word_offset + len(data) // 4):
+            self._set_valid(idx32, True)
 
     def load_le_words(self, data: bytes, has_validity: bool, word_offset: int) -> None:
         '''Replace the memory start at word_offset with data
@@ -135,24 +178,40 @@ class Dmem:
     def dump_le_words(self) -> bytes:
         '''Return the contents of memory as bytes.
 
-        The bytes are formatted as little-endian 32-bit words. These
-        words are themselves packed little-endian into 256-bit words.
+        Each 32-bit word is represented with 5 bytes: a validity byte (0 or 1)
+        followed by the word itself in little-endian format. Invalid words
+        are dumped as zero.
 
         '''
-        ret = b''
-        for idx, (u32, valid) in enumerate(self.data):
-            # If there's a pending store, apply it. This matches the RTL, where
-            # we only observe the memory after that store has landed.
-            # A pending store is assumed to have always valid data.
-            has_pending_store = self.pending.get(idx) is not None
-            u32 = self.pending.get(idx, u32)
-
-            if valid or has_pending_store:
-                ret += struct.pack('<BI', 1, u32)
-            else:
-                ret += struct.pack('<BI', 0, 0)
-
-        return ret
+        # If there are pending stores, apply them to a copy of the memory.
+        # This matches the RTL, where we only observe the memory after that
+        # store has landed.
+        data = self.data
+        valid = self.valid
+        if self.pending:
+            data = bytearray(data)
+            valid = bytearray(valid)
+            for item in self.pending:
+                self._apply_store(data, valid, item)
+
+        validity = b''.join(_VALIDITY_BYTES[byte] for byte in valid)
+
+        # Zero any invalid words. A short run can leave most of the memory
+        # invalid, so do this with a mask rather than one word at a time.
+        if 0 in validity:
+            word_mask = validity.translate(_WORD_MASK_TABLE)
+            mask = bytearray(len(data))
+            for i in range(4):
+                mask[i::4] = word_mask
+            masked = (int.from_bytes(data, 'little') &
+                      int.from_bytes(mask, 'little'))
+            data = bytearray(masked.to_bytes(len(data), 'little'))
+
+        ret = bytearray(5 * len(validity))
+        ret[0::5] = validity
+        for i in range(4):
+            ret[1 + i::5] = data[i::4]
+        return bytes(ret)
 
     def is_valid_256b_addr(self, addr: int) -> bool:
         '''Return true if this is a valid address for a BN.LID/BN.SID'''
@@ -160,24 +219,37 @@ class Dmem:
         if addr & 31:
             return False
 
-        word_addr = addr // 4
-        if word_addr >= len(self.data):
+        if addr >= len(self.data):
             return False
 
         return True
 
+    def _pending_overlaps(self, addr: int, num_bytes: int) -> bool:
+        '''Return true if a pending store overlaps the given range'''
+        for item in self.pending:
+            item_bytes = 32 if item.is_wide else 4
+            if item.addr < addr + num_bytes and addr < item.addr + item_bytes:
+                return True
+        return False
+
     def load_u256(self, addr: int) -> Tuple[int, bool]:
         '''Read a u256 little-endian value from an aligned address'''
         assert addr >= 0
         assert self.is_valid_256b_addr(addr)
-        ret_data = 0
-        valid = True
-        for i in range(256 // 32):
-            data_32, valid_32 = self.load_u32(addr + 4 * i)
-            ret_data = ret_data | (data_32 << (i * 32))
-            valid = valid and valid_32
 
-        return (ret_data, valid)
+        # Handle "read under write" hazards by going through load_u32 for
+        # each word. This is rare, so we don't mind it being slow.
+        if self._pending_overlaps(addr, 32):
+            ret_data = 0
+            valid = True
+            for i in range(256 // 32):
+                data_32, valid_32 = self.load_u32(addr + 4 * i)
+                ret_data = ret_data | (data_32 << (i * 32))
+                valid = valid and valid_32
+            return (ret_data, valid)
+
+        value = int.from_bytes(self.view[addr:addr + 32], byteorder='little')
+        return (value, self.valid[addr >> 5] == 0xff)
 
     def store_u256(self, addr: int, value: int) -> None:
         '''Write a u256 little-endian value to an aligned address'''
@@ -193,7 +265,7 @@ class Dmem:
         if addr & 3:
             return False
 
-        if (addr + 3) // 4 >= len(self.data):
+        if addr + 4 > len(self.data):
             return False
 
         return True
@@ -208,14 +280,19 @@ class Dmem:
         assert addr >= 0
         assert self.is_valid_32b_addr(addr)
 
-        idx = addr // 4
-
-        # Handle "read under write" hazards properly
-        pending_val = self.pending.get(idx)
-        if pending_val is not None:
-            return (pending_val, True)
+        # Handle "read under write" hazards properly. Later stores win, so
+        # search backwards.
+        for item in reversed(self.pending):
+            if item.is_wide:
+                if item.addr <= addr < item.addr + 32:
+                    shift = 8 * (addr - item.addr)
+                    return ((item.value >> shift) & 0xffffffff, True)
+            elif item.addr == addr:
+                return (item.value, True)
 
-        return self.data[addr // 4]
+        value = int.from_bytes(self.view[addr:addr + 4], byteorder='little')
+        valid = (self.valid[addr >> 5] >> ((addr >> 2) & 7)) & 1
+        return (value, valid != 0)
 
     def store_u32(self, addr: int, value: int) -> None:
         '''Store a 32-bit unsigned value to memory.
@@ -232,34 +309,33 @@ class Dmem:
     def changes(self) -> Sequence[Trace]:
         return self.trace
 
-    def _commit_trace_entry(self, item: TraceDmemStore) -> None:
-        '''Apply a trace entry to self.pending'''
+    @staticmethod
+    def _apply_store(data: bytearray,
+                     valid: bytearray,
+                     item: TraceDmemStore) -> None:
+        '''Write a store to data, marking the words it writes as valid'''
         if item.is_wide:
             assert 0 <= item.value < (1 << 256)
-            mask = (1 << 32) - 1
-            for i in range(256 // 32):
-                wr_data = (item.value >> (i * 32)) & mask
-                self.pending[(item.addr // 4) + i] = wr_data
-
+            data[item.addr:item.addr + 32] = \
+                item.value.to_bytes(32, byteorder='little')
+            valid[item.addr >> 5] = 0xff
         else:
             assert 0 <= item.value <= (1 << 32) - 1
-            self.pending[item.addr // 4] = item.value
+            data[item.addr:item.addr + 4] = \
+                item.value.to_bytes(4, byteorder='little')
+            valid[item.addr >> 5] |= 1 << ((item.addr >> 2) & 7)
 
     def commit(self) -> None:
         # Move items from self.pending to self.data
-        for idx, value in self.pending.items():
-            self.data[idx] = (value, True)
-        self.pending = {}
+        for item in self.pending:
+            self._apply_store(self.data, self.valid, item)
 
-        # Apply trace entries to self.pending
-        for item in self.trace:
-            self._commit_trace_entry(item)
+        # Trace entries become pending stores
+        self.pending = self.trace
         self.trace = []
 
     def abort(self) -> None:
         self.trace = []
 
     def invalidate_dmem(self) -> None:
-        for idx in range(len(self.data)):
-            u32, _ = self.data[idx]
-            self.data[idx] = (u32, False)
+        self.valid[:] = bytes(len(self.valid))
@@ -150,6 +150,17 @@ class EdnClient:
 
         return (data, retry, fips_err, rep_err)
 
+    def is_requesting(self) -> bool:
+        '''Return true if we are waiting for data from the EDN'''
+        return self._acc is not None and self._cdc_counter is None
+
+    def cdc_in_progress(self) -> bool:
+        '''Return true if we have all our data and are waiting for CDC
+
+        This is the only situation where step() has anything to do.
+        '''
+        return self._cdc_counter is not None
+
     def step(self) -> None:
         '''Called on each main clock cycle. Increment and check CDC counter'''
         if self._cdc_counter is not None:
@@ -236,6 +236,9 @@ class RndReq(RGReg):
         '''Called on each main clock cycle. Step the client'''
         self._client.step()
 
+    def cdc_in_progress(self) -> bool:
+        return self._client.cdc_in_progress()
+
 
 def make_flag_reg(name: str, double_flopped: bool) -> RGReg:
     return RGReg([RGField(name, 32, 0, 0, 'ro')], double_flopped)
@@ -355,6 +358,13 @@ class OTBNExtRegs:
             reg.abort()
         self._dirty = 0
 
+    def is_settled(self) -> bool:
+        '''Return true if no writes are waiting to land, except to INSN_CNT
+
+        (INSN_CNT gets committed on every cycle anyway)
+        '''
+        return self._dirty == 0
+
     def rnd_request(self) -> None:
         if self._rnd_req.request():
             self._dirty = 2
@@ -377,3 +387,7 @@ class OTBNExtRegs:
 
     def rnd_forget(self) -> None:
         self._rnd_req.forget()
+
+    def rnd_cdc_in_progress(self) -> bool:
+        '''Return true if the RND client is waiting for CDC to complete'''
+        return self._rnd_req.cdc_in_progress()
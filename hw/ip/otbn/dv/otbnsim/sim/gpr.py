@@ -2,10 +2,10 @@
 # Licensed under the Apache License, Version 2.0, see LICENSE for details.
 # SPDX-License-Identifier: Apache-2.0
 
-from typing import List
+from typing import List, Optional
 
 from .constants import ErrBits
-from .reg import Reg, RegFile
+from .reg import Reg, RegFile, TraceRegister
 
 
 class CallStackReg(Reg):
@@ -15,7 +15,11 @@ class CallStackReg(Reg):
     stack_depth = 8
 
     def __init__(self, parent: 'GPRs'):
-        super().__init__(parent, 1, 32, 0)
+        # We don't pass the parent to the base class: writes to x1 push onto
+        # the call stack rather than going through the register file's journal
+        # (and register 1 in the file itself is unused).
+        super().__init__(None, 1, 32, 0)
+        self._next_uval: Optional[int] = None
         self.stack = []  # type: List[int]
         self.saw_read = False
         self.gpr_parent = parent
@@ -37,6 +41,13 @@ class CallStackReg(Reg):
         self.saw_read = True
         return self.stack[-1]
 
+    def write_unsigned(self, uval: int) -> None:
+        assert 0 <= uval < (1 << 32)
+        self._next_uval = uval
+
+    def write_invalid(self) -> None:
+        self._next_uval = None
+
     def post_insn(self) -> None:
         if self._next_uval is not None:
             if not self.saw_read and len(self.stack) == 8:
@@ -53,12 +64,16 @@ class CallStackReg(Reg):
             # stack in post_insn().
             assert len(self.stack) <= 8
             self.stack.append(self._next_uval)
-
-        super().commit()
+            self._next_uval = None
 
     def abort(self) -> None:
         self.saw_read = False
-        super().abort()
+        self._next_uval = None
+
+    def changes(self) -> List[TraceRegister]:
+        if self._next_uval is None:
+            return []
+        return [TraceRegister('x01', 32, self._next_uval)]
 
     def start(self) -> None:
         '''Executed on start of operation.'''
@@ -71,15 +86,15 @@ class GPRs(RegFile):
 
     def __init__(self) -> None:
         super().__init__('x', 32, 32)
+        # x0 is a zeros register that ignores writes. A Reg with no parent
+        # drops anything written to it, so we can share a single one.
+        self._x0 = Reg(None, 0, 32, 0)
         self._x1 = CallStackReg(self)
         self.call_stack_err = False
 
     def get_reg(self, idx: int) -> Reg:
         if idx == 0:
-            # If idx == 0, this is a zeros register that should ignore writes.
-            # Return a fresh Reg with no parent, so writes to it have no
-            # effect.
-            return Reg(None, 0, 32, 0)
+            return self._x0
         elif idx == 1:
             # If idx == 1, we return self._x1: element 1 of the underlying
             # register file is not actually used.
@@ -94,6 +109,10 @@ class GPRs(RegFile):
     def post_insn(self) -> None:
         return self._x1.post_insn()
 
+    def changes(self) -> List[TraceRegister]:
+        # x1 sorts before the other registers that can be written.
+        return self._x1.changes() + super().changes()
+
     def err_bits(self) -> int:
         return ErrBits.CALL_STACK if self.call_stack_err else 0
 
@@ -9,8 +9,10 @@ from .flags import FlagReg
 from .isa import (OTBNInsn, RV32RegReg, RV32RegImm,
                   RV32ImmShift, BnVecVecAdd, BnVecVecMul, BnVecVecTrn,
                   insn_for_mnemonic, logical_byte_shift,
-                  extract_quarter_word, extract_vec_elem, element_length_in_bits,
-                  shift_vec_elem, map_elems, montgomery_mul_no_cond_subtraction)
+                  extract_quarter_word, element_length_in_bits)
+from .lanes import (add_lanes, add_mod_lanes, sub_lanes, sub_mod_lanes,
+                    mul_lanes, mul_by_lane, mont_mul_lanes, mont_mul_by_lane,
+                    trn_lanes, shift_lanes, unpack_24b, pack_24b)
 from .state import OTBNState
 
 
@@ -1304,11 +1306,6 @@ class BNADDV(BnVecVecAdd):
     insn = insn_for_mnemonic('bn.addv', 4)
 
     def execute(self, state: OTBNState) -> None:
-        # The operation performed on the element pairs.
-        def op(a: int, b: int) -> int:
-            c = a + b
-            return c
-
         vec_a = state.wdrs.get_reg(self.wrs1).read_unsigned()
         vec_b = state.wdrs.get_reg(self.wrs2).read_unsigned()
         size = element_length_in_bits(self.elen)
@@ -1318,7 +1315,7 @@ class BNADDV(BnVecVecAdd):
             state.stop_at_end_of_cycle(ErrBits.ILLEGAL_INSN)
             return None
 
-        result = map_elems(op, size, vec_a, vec_b)
+        result = add_lanes(vec_a, vec_b, size)
 
         state.wdrs.get_reg(self.wrd).write_unsigned(result)
 
@@ -1327,13 +1324,6 @@ class BNADDVM(BnVecVecAdd):
     insn = insn_for_mnemonic('bn.addvm', 4)
 
     def execute(self, state: OTBNState) -> None:
-        # The operation performed on the element pairs.
-        def op(mod_val: int, a: int, b: int) -> int:
-            c = a + b
-            if c >= mod_val:
-                c -= mod_val
-            return c
-
         vec_a = state.wdrs.get_reg(self.wrs1).read_unsigned()
         vec_b = state.wdrs.get_reg(self.wrs2).read_unsigned()
         size = element_length_in_bits(self.elen)
@@ -1347,7 +1337,7 @@ class BNADDVM(BnVecVecAdd):
         # Montgomery constant.
         mod_val = state.wsrs.MOD.read_unsigned() & ((1 << size) - 1)
 
-        result = map_elems(lambda a, b: op(mod_val, a, b), size, vec_a, vec_b)
+        result = add_mod_lanes(vec_a, vec_b, mod_val, size)
 
         state.wdrs.get_reg(self.wrd).write_unsigned(result)
 
@@ -1356,11 +1346,6 @@ class BNSUBV(BnVecVecAdd):
     insn = insn_for_mnemonic('bn.subv', 4)
 
     def execute(self, state: OTBNState) -> None:
-        # The operation performed on the element pairs.
-        def op(a: int, b: int) -> int:
-            c = a - b
-            return c
-
         vec_a = state.wdrs.get_reg(self.wrs1).read_unsigned()
         vec_b = state.wdrs.get_reg(self.wrs2).read_unsigned()
         size = element_length_in_bits(self.elen)
@@ -1370,7 +1355,7 @@ class BNSUBV(BnVecVecAdd):
             state.stop_at_end_of_cycle(ErrBits.ILLEGAL_INSN)
             return None
 
-        result = map_elems(op, size, vec_a, vec_b)
+        result = sub_lanes(vec_a, vec_b, size)
 
         state.wdrs.get_reg(self.wrd).write_unsigned(result)
 
@@ -1379,13 +1364,6 @@ class BNSUBVM(BnVecVecAdd):
     insn = insn_for_mnemonic('bn.subvm', 4)
 
     def execute(self, state: OTBNState) -> None:
-        # The operation performed on the element pairs.
-        def op(mod_val: int, a: int, b: int) -> int:
-            c = a - b
-            if c < 0:
-                c += mod_val
-            return c
-
         vec_a = state.wdrs.get_reg(self.wrs1).read_unsigned()
         vec_b = state.wdrs.get_reg(self.wrs2).read_unsigned()
         size = element_length_in_bits(self.elen)
@@ -1398,7 +1376,7 @@ class BNSUBVM(BnVecVecAdd):
         # Extract the modulus from WSR MOD.
         mod_val = state.wsrs.MOD.read_unsigned() & ((1 << size) - 1)
 
-        result = map_elems(lambda a, b: op(mod_val, a, b), size, vec_a, vec_b)
+        result = sub_mod_lanes(vec_a, vec_b, mod_val, size)
 
         state.wdrs.get_reg(self.wrd).write_unsigned(result)
 
@@ -1407,11 +1385,6 @@ class BNMULV(BnVecVecMul):
     insn = insn_for_mnemonic('bn.mulv', 4)
 
     def execute(self, state: OTBNState) -> Optional[Iterator[None]]:
-        # The operation performed on the element pairs.
-        def op(a: int, b: int) -> int:
-            c = a * b
-            return c
-
         vec_a = state.wdrs.get_reg(self.wrs1).read_unsigned()
         vec_b = state.wdrs.get_reg(self.wrs2).read_unsigned()
         size = element_length_in_bits(self.elen)
@@ -1423,7 +1396,7 @@ class BNMULV(BnVecVecMul):
 
         # This instruction operates over 4 cycles. In each cycle 64b of the 256b vector are
         # processed. We first compute the results and then emulate the register updates.
-        result = map_elems(op, size, vec_a, vec_b)
+        result = mul_lanes(vec_a, vec_b, size)
 
         # Emulate the register updates by reading the ACC and write current quarter word result to
         # it. In the last cycle ACC is cleared and the result is written to the destination WDR.
@@ -1448,11 +1421,6 @@ class BNMULVL(BnVecVecMul):
         self.lane = op_vals['lane']
 
     def execute(self, state: OTBNState) -> Optional[Iterator[None]]:
-        # The operation performed on the element pairs.
-        def op(a: int, b: int) -> int:
-            c = a * b
-            return c
-
         vec_a = state.wdrs.get_reg(self.wrs1).read_unsigned()
         vec_b = state.wdrs.get_reg(self.wrs2).read_unsigned()
         size = element_length_in_bits(self.elen)
@@ -1464,14 +1432,7 @@ class BNMULVL(BnVecVecMul):
 
         # This instruction operates over 4 cycles. In each cycle 64b of the 256b vector are
         # processed. We first compute the results and then emulate the register updates.
-
-        # Replicate lane element to generate a 256b vector with 256/size elements.
-        lane_elem = extract_vec_elem(vec_b, self.lane, size)
-        lane_vec = 0
-        for i in range(256 // size):
-            lane_vec |= (lane_elem << (i * size))
-
-        result = map_elems(op, size, vec_a, lane_vec)
+        result = mul_by_lane(vec_a, vec_b, self.lane, size)
 
         # Emulate the register updates by reading the ACC and write current quarter word result to
         # it. In the last cycle ACC is cleared and the result is written to the destination WDR.
@@ -1530,10 +1491,6 @@ class BNMULVM(BnVecVecMul):
     # The required constants q and mu are expected to be in the MOD WSR at following locations:
     # For .8s: q @ [31:0], mu @ [63:32]
     def execute(self, state: OTBNState) -> Optional[Iterator[None]]:
-        # The operation performed on the element pairs.
-        def op(a: int, b: int, q: int, mu: int, size: int) -> int:
-            return montgomery_mul_no_cond_subtraction(a, b, q, mu, size)
-
         vec_a = state.wdrs.get_reg(self.wrs1).read_unsigned()
         vec_b = state.wdrs.get_reg(self.wrs2).read_unsigned()
         size = element_length_in_bits(self.elen)
@@ -1551,7 +1508,7 @@ class BNMULVM(BnVecVecMul):
 
         # We first compute the result and then emulate the register update sequence. We do model
         # only the ACC updates. We do not model the MAC's internal registers.
-        result = map_elems(lambda a, b: op(a, b, mod_q, mod_mu, size), size, vec_a, vec_b)
+        result = mont_mul_lanes(vec_a, vec_b, mod_q, mod_mu, size)
 
         # Emulate the ACC register updates.
         # One 64b chunk computation requires 3 cycles. We perform the following register accesses
@@ -1588,9 +1545,6 @@ class BNMULVML(BnVecVecMul):
 
     # See BNMULVM for detailed explanation of instruction
     def execute(self, state: OTBNState) -> Optional[Iterator[None]]:
-        def op(a: int, b: int, q: int, mu: int, size: int) -> int:
-            return montgomery_mul_no_cond_subtraction(a, b, q, mu, size)
-
         vec_a = state.wdrs.get_reg(self.wrs1).read_unsigned()
         vec_b = state.wdrs.get_reg(self.wrs2).read_unsigned()
         size = element_length_in_bits(self.elen)
@@ -1608,14 +1562,7 @@ class BNMULVML(BnVecVecMul):
 
         # This instruction operates over 12 cycles. We first compute the results and then emulate
         # the register updates.
-
-        # Replicate lane element to generate a 256b vector with 256/size elements.
-        lane_elem = extract_vec_elem(vec_b, self.lane, size)
-        lane_vec = 0
-        for i in range(256 // size):
-            lane_vec |= (lane_elem << (i * size))
-
-        result = map_elems(lambda a, b: op(a, b, mod_q, mod_mu, size), size, vec_a, lane_vec)
+        result = mont_mul_by_lane(vec_a, vec_b, self.lane, mod_q, mod_mu, size)
 
         # Emulate the register updates. See BN.MULVM for details.
         qword_mask = (1 << 64) - 1
@@ -1649,13 +1596,7 @@ class BNTRN1(BnVecVecTrn):
             state.stop_at_end_of_cycle(ErrBits.ILLEGAL_INSN)
             return None
 
-        vec_c = 0
-        for elem in range(0, 256 // size, 2):
-            elem_a = extract_vec_elem(vec_a, elem, size)
-            elem_b = extract_vec_elem(vec_b, elem, size)
-
-            vec_c = vec_c | ((elem_a) << (elem * size))
-            vec_c = vec_c | ((elem_b) << ((elem + 1) * size))
+        vec_c = trn_lanes(vec_a, vec_b, size, odd=False)
 
         state.wdrs.get_reg(self.wrd).write_unsigned(vec_c)
 
@@ -1673,13 +1614,7 @@ class BNTRN2(BnVecVecTrn):
             state.stop_at_end_of_cycle(ErrBits.ILLEGAL_INSN)
             return None
 
-        vec_c = 0
-        for elem in range(0, 256 // size, 2):
-            elem_a = extract_vec_elem(vec_a, elem + 1, size)
-            elem_b = extract_vec_elem(vec_b, elem + 1, size)
-
-            vec_c = vec_c | ((elem_a) << (elem * size))
-            vec_c = vec_c | ((elem_b) << ((elem + 1) * size))
+        vec_c = trn_lanes(vec_a, vec_b, size, odd=True)
 
         state.wdrs.get_reg(self.wrd).write_unsigned(vec_c)
 
@@ -1705,11 +1640,7 @@ class BNSHV(OTBNInsn):
             state.stop_at_end_of_cycle(ErrBits.ILLEGAL_INSN)
             return None
 
-        vec_c = 0
-        for elem in range(256 // size):
-            elem_a = extract_vec_elem(vec_a, elem, size)
-            elem_a_shifted = shift_vec_elem(elem_a, size, self.shift_type, self.shift_bits)
-            vec_c = vec_c | (elem_a_shifted << (elem * size))
+        vec_c = shift_lanes(vec_a, size, self.shift_type, self.shift_bits)
 
         state.wdrs.get_reg(self.wrd).write_unsigned(vec_c)
 
@@ -1728,15 +1659,9 @@ class BNUNPK(OTBNInsn):
         vec_a = state.wdrs.get_reg(self.wrs1).read_unsigned()
         vec_b = state.wdrs.get_reg(self.wrs2).read_unsigned()
 
-        # Concatenate to 512 bits and shift
-        combined = (vec_a << 256) | (vec_b)
-        shifted = combined >> self.shift
-
-        # Unpack 8 24-bit elements into 32-bit elements
-        unpacked = 0
-        for elem in range(256 // 32):
-            chunk = (shifted >> (elem * 24)) & ((1 << 24) - 1)
-            unpacked = unpacked | (chunk << (elem * 32))
+        # Concatenate to 512 bits, shift and unpack 8 24-bit elements into
+        # 32-bit elements
+        unpacked = unpack_24b(vec_a, vec_b, self.shift)
 
         state.wdrs.get_reg(self.wrd).write_unsigned(unpacked)
 
@@ -1755,21 +1680,9 @@ class BNPACK(OTBNInsn):
         vec_a = state.wdrs.get_reg(self.wrs1).read_unsigned()
         vec_b = state.wdrs.get_reg(self.wrs2).read_unsigned()
 
-        # Pack 8 24b elements from 256b string into 192b string
-        def pack_24b_elems(vec: int) -> int:
-            dense = 0
-            for elem in range(256 // 32):
-                elem_a = (vec >> (elem * 32)) & ((1 << 24) - 1)
-                dense = dense | (elem_a << (elem * 24))
-            return dense
-
-        dense_a = pack_24b_elems(vec_a)
-        dense_b = pack_24b_elems(vec_b)
-
-        # Concatenate and append 64 zeros to the right.
-        combined = (dense_a << (192 + 64)) | (dense_b << 64)
-        shifted = combined >> self.shift
-        packed = shifted & ((1 << 256) - 1)
+        # Pack 8 24b elements from each 256b string into 192b strings,
+        # concatenate them, append 64 zeros to the right and shift.
+        packed = pack_24b(vec_a, vec_b, self.shift)
 
         state.wdrs.get_reg(self.wrd).write_unsigned(packed)
 
@@ -2,8 +2,10 @@
 # Licensed under the Apache License, Version 2.0, see LICENSE for details.
 # SPDX-License-Identifier: Apache-2.0
 
+import copy
+import sys
 from dataclasses import dataclass
-from typing import Any, Optional
+from typing import Any, Dict, Optional
 from enum import Enum, auto, unique
 from Crypto.Hash import SHAKE128, SHAKE256, SHA3_224, SHA3_256, SHA3_384, SHA3_512
 import secrets
@@ -95,6 +97,15 @@ class KmacState(Enum):
     SQUEEZING = auto()
 
 
+# The value that _step_fsm writes to KMAC_STATUS in each FSM state where it
+# waits for software.
+_STABLE_STATUS = {
+    KmacState.IDLE: 1,
+    KmacState.MSG_FEED: 2,
+    KmacState.ABSORBED: 4,
+}
+
+
 class Counter():
     """A hardware-like counter model with separate Next (D) and Current (Q) states.
 
@@ -160,6 +171,7 @@ class Kmac():
     _keccak_absorbed_cnt: Counter
     _keccak_squeezed_cnt: Counter
     _sha3_digest: bytes
+    _msg_buf: bytearray
     _keccak_state: Any
     _keccak_rate_words: int
     _keccak_cap_bits: int
@@ -175,9 +187,33 @@ class Kmac():
         self._csrs = csrs
         self._wsrs = wsrs
 
+    def __deepcopy__(self, memo: Dict[int, Any]) -> 'Kmac':
+        """Deep copy the model (used by OTBNState.snapshot).
+
+        The Keccak state object from pycryptodome wraps a C pointer, which
+        deepcopy can't handle, so we copy it with its own copy() method.
+        """
+        ret = Kmac.__new__(Kmac)
+        memo[id(self)] = ret
+        for name, value in self.__dict__.items():
+            if name == '_keccak_state':
+                value = None if value is None else value.copy()
+            else:
+                value = copy.deepcopy(value, memo)
+            setattr(ret, name, value)
+        return ret
+
     def step(self) -> None:
         """Advance the KMAC state by one cycle."""
 
+        # Most cycles of a KMAC operation are spent waiting for the Keccak
+        # rounds to finish or for software to read the digest. Skip the full
+        # model for these.
+        if self._is_quiet():
+            if self._keccak_round_ctr.value:
+                self._keccak_round_ctr.decrement()
+            return
+
         # Check if KMAC_DATA_S0/1 were accessed in the last cycle.
         self._step_kmac_data()
 
@@ -221,6 +257,95 @@ class Kmac():
 
         return
 
+    def is_idle(self) -> bool:
+        """Returns whether step() has nothing to do.
+
+        This is true when the KMAC FSM is waiting in a stable state (IDLE,
+        MSG_FEED or ABSORBED, with KMAC_STATUS and KMAC_IF_STATUS already
+        showing that), the Keccak core isn't running, no command or message
+        is pending, there is no digest word to squeeze and there has been no
+        access to KMAC_DATA that step() would react to. This covers the time
+        that software spends between sending message blocks or between
+        reading digest words, so it doesn't have to be simulated cycle by
+        cycle.
+        """
+        return self._is_quiet() and not self._keccak_round_ctr.value
+
+    def quiet_cycles(self) -> int:
+        """Returns how many cycles step() can be skipped for.
+
+        This is the number of cycles (starting with the next one) where the
+        only thing step() would do is count down the Keccak round counter, or
+        sys.maxsize if there is no limit. The result is only valid if nothing
+        else touches the KMAC CSRs or WSRs in those cycles. After skipping
+        some cycles, call skip_cycles to catch up.
+        """
+        if not self._is_quiet():
+            return 0
+
+        # Once the Keccak core is done, we need to absorb any pending
+        # message words or move on from PROCESSING. Otherwise there's
+        # nothing to do until software does something.
+        rounds_left = self._keccak_round_ctr.value
+        if rounds_left and (self._kmac_msg_send_words_left.value or
+                            self._state == KmacState.PROCESSING):
+            return rounds_left
+        return sys.maxsize
+
+    def skip_cycles(self, cycles: int) -> None:
+        """Account for cycles where step() wasn't called.
+
+        cycles must be at most the result of quiet_cycles() before they
+        started. This has the same effect as calling step() and end_cycle()
+        for each of them.
+        """
+        ctr = self._keccak_round_ctr
+        if ctr.value:
+            ctr.set_next(max(0, ctr.value - cycles))
+            ctr.end_cycle()
+
+    def _is_quiet(self) -> bool:
+        """Returns whether step() would only count down the Keccak rounds.
+
+        The FSM state and KMAC_STATUS and KMAC_IF_STATUS must already be
+        what step() would set them to, so that skipping it makes no
+        difference.
+        """
+        state = self._state
+        if state != self._state_next or self._flush_cycle:
+            return False
+
+        csrs = self._csrs
+        if (csrs.KMAC_CMD.read_unsigned() or
+                csrs.KMAC_MSG_SEND.read_unsigned()):
+            return False
+
+        data = self._wsrs.KMAC_DATA
+        if data.shares_dirty() or data.all_shares_read():
+            return False
+
+        # A message word gets absorbed as soon as the Keccak core is free.
+        keccak_busy = bool(self._keccak_round_ctr.value)
+        words_left = self._kmac_msg_send_words_left.value
+        if words_left and not keccak_busy:
+            return False
+
+        status = csrs.KMAC_STATUS.read_unsigned()
+        if state == KmacState.PROCESSING:
+            # _step_fsm moves to ABSORBED once the Keccak core is done, but
+            # doesn't touch KMAC_STATUS before that.
+            if not keccak_busy:
+                return False
+        elif status != _STABLE_STATUS.get(state):
+            return False
+
+        msg_write_rdy = state == KmacState.MSG_FEED and not words_left
+        if csrs.KMAC_IF_STATUS.get_msg_write_rdy() != msg_write_rdy:
+            return False
+
+        return not (csrs.KMAC_STATUS.is_squeezing() and
+                    self._can_squeeze())
+
     def end_cycle(self) -> None:
         # Commit state transition
         self._state = self._state_next
@@ -347,28 +472,49 @@ class Kmac():
         data_unmasked = share0 ^ share1
         data_word = (data_unmasked >> shift) & word_mask
 
-        # Convert to bytes (little-endian) and absorb.
-        data_bytes = data_word.to_bytes(num_bytes, byteorder="little")
-        self._keccak_state.update(data_bytes)
+        # Convert to bytes (little-endian), keeping just the bytes that the
+        # strobe marks as valid. Rather than passing every word to the Keccak
+        # state on its own, collect them and absorb them in one go when we
+        # need some output (see _flush_msg).
+        data_bytes = data_word.to_bytes(KMAC_WORD_BYTES, byteorder="little")
+        self._msg_buf += data_bytes[:num_bytes]
 
         # Track absorbed words and trigger Keccak round when rate is full.
         if self._keccak_absorbed_cnt.increment() >= self._keccak_rate_words:
             self._keccak_round_ctr.set_next(KECCAK_ROUND_CYCLES)
             self._keccak_absorbed_cnt.set_next(0)
 
-    def _squeeze(self) -> None:
-        """Squeeze one 64-bit word of output into KMAC_DATA."""
+    def _flush_msg(self) -> None:
+        """Absorb any message bytes collected by _absorb."""
+        if self._msg_buf:
+            self._keccak_state.update(self._msg_buf)
+            self._msg_buf = bytearray()
+
+    def _can_squeeze(self) -> bool:
+        """Returns whether _squeeze would write a digest word."""
 
         # Stop if KMAC_DATA is already valid.
         if self._csrs.KMAC_IF_STATUS.get_digest_valid():
+            return False
+
+        if KmacMode(self._csrs.KMAC_CFG.get_mode()) == KmacMode.SHA3:
+            # Stop if we've already squeezed the maximum number of bits.
+            return self._keccak_squeezed_cnt.value < self._keccak_cap_bits
+
+        # Stop if a run command is needed for more digest data.
+        return (self._keccak_squeezed_cnt.value <
+                self._keccak_rate_words * KMAC_WORD_BITS)
+
+    def _squeeze(self) -> None:
+        """Squeeze one 64-bit word of output into KMAC_DATA."""
+
+        if not self._can_squeeze():
             return
 
+        self._flush_msg()
+
         mode = KmacMode(self._csrs.KMAC_CFG.get_mode())
         if mode == KmacMode.SHA3:
-            # Stop if we've already squeezed the maximum number of bits.
-            if self._keccak_squeezed_cnt.value >= self._keccak_cap_bits:
-                return
-
             # Initialize digest on first squeeze.
             if not self._keccak_squeezed_cnt.value:
                 digest = self._keccak_state.digest()
@@ -378,17 +524,16 @@ class Kmac():
                     digest += b'\x00' * (KMAC_WORD_BYTES - rem)
                 self._sha3_digest = digest
 
-            # Pop the next 64-bit word from the digest.
-            chunk = self._sha3_digest[:KMAC_WORD_BYTES]
-            self._sha3_digest = self._sha3_digest[KMAC_WORD_BYTES:]
-
-        else:
-            # Stop if a run command is needed for more digest data.
-            if self._keccak_squeezed_cnt.value >= self._keccak_rate_words * KMAC_WORD_BITS:
-                return
+        elif len(self._sha3_digest) < KMAC_WORD_BYTES:
+            # Read a whole rate block of XOF output at once and hand it out a
+            # word at a time. Anything left over if software sends RUN early
+            # is still the next part of the output stream, so keep it.
+            self._sha3_digest += self._keccak_state.read(
+                self._keccak_rate_words * KMAC_WORD_BYTES)
 
-            # Generic squeeze path: read directly from _state.
-            chunk = self._keccak_state.read(KMAC_WORD_BYTES)
+        # Pop the next 64-bit word from the digest.
+        chunk = self._sha3_digest[:KMAC_WORD_BYTES]
+        self._sha3_digest = self._sha3_digest[KMAC_WORD_BYTES:]
 
         # Write the word into the masked data registers.
         value = int.from_bytes(chunk, byteorder="little")
@@ -503,8 +648,12 @@ class Kmac():
         # Count of squeezed words, used to determine how much data is left to squeeze.
         self._keccak_squeezed_cnt = Counter()
         # In SHA3 mode, Crypto.Hash returns the whole digest at once.
-        # This variable stores the whole digest.
+        # This variable stores the whole digest. In the XOF modes, it holds
+        # output that has been read from the Keccak state but not squeezed.
         self._sha3_digest = bytes()
+        # Message bytes that have been sent but not passed to the Keccak
+        # state yet.
+        self._msg_buf = bytearray()
         # Instance of a Keccak-based hash (SHA3, SHAKE, or cSHAKE) from the crypto.hash library.
         self._keccak_state = None
         # Rate of the Keccak sponge in 64 bit words.
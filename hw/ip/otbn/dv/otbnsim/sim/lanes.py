@@ -0,0 +1,312 @@
+# Copyright lowRISC contributors (OpenTitan project).
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Bulk operations on the lanes of 256-bit vectors
+
+The vector (SIMD) instructions in the bignum ISA treat a WDR as a vector of
+32, 64 or 128-bit elements (lanes). Splitting a 256-bit integer into lanes
+with a shift and a mask for each lane and then putting the results back
+together again costs more than the arithmetic itself. This module has two
+faster ways to work on all the lanes at once:
+
+  - Operations that don't mix bits across lanes in complicated ways (such as
+    addition, subtraction, shifts and transposes) are done on the whole
+    256-bit integer, using masks that stop carries, borrows and shifted bits
+    from crossing a lane boundary.
+
+  - Modular addition and subtraction and multiplication by a single lane
+    split the vector into its even and odd lanes, each in a slot that is
+    twice as wide as a lane. The slots have room for any carries, so the
+    operation can be done on all the slots at once with integer arithmetic.
+
+  - Other operations (multiplications of two vectors) unpack the vector to a
+    tuple of lane values with struct, which does the splitting in C, apply
+    the operation to every lane in one comprehension and pack the result
+    again.
+
+A LaneFormat describes a lane width and holds the masks and struct formats
+for it. The functions here match the per-element definitions in isa.py (see
+map_elems) and take element sizes as returned by element_length_in_bits.
+
+'''
+
+import struct
+from typing import Dict, Sequence, Tuple
+
+_MASK256 = (1 << 256) - 1
+
+
+def _repeat(value: int, size: int) -> int:
+    '''Return a 256-bit value with value in every size-bit lane'''
+    ret = 0
+    for lane in range(256 // size):
+        ret |= value << (lane * size)
+    return ret
+
+
+class LaneFormat:
+    '''The masks and packing for one lane width'''
+    def __init__(self, size: int) -> None:
+        assert size in [32, 64, 128]
+        self.size = size
+        self.count = 256 // size
+        self.lane_mask = (1 << size) - 1
+
+        # All bits but the top one in each lane, and just the top bits.
+        self.low_bits = _repeat((1 << (size - 1)) - 1, size)
+        self.top_bits = _repeat(1 << (size - 1), size)
+
+        # The even lanes (0, 2, ...) and the odd lanes.
+        self.even_lanes = _repeat(self.lane_mask, 2 * size)
+        self.odd_lanes = self.even_lanes << size
+
+        # A one at the bottom of each double-width slot (see split).
+        self.slot_ones = _repeat(1, 2 * size)
+
+        # There's no struct format for a 128-bit lane, so we unpack those as
+        # pairs of 64-bit words.
+        self._words_per_lane = max(1, size // 64)
+        word_fmt = 'I' if size == 32 else 'Q'
+        num_words = self.count * self._words_per_lane
+        self._struct = struct.Struct('<{}{}'.format(num_words, word_fmt))
+
+    def unpack(self, vec: int) -> Tuple[int, ...]:
+        '''Split a 256-bit vector into its lanes, lane 0 first'''
+        words = self._struct.unpack(vec.to_bytes(32, 'little'))
+        if self._words_per_lane == 1:
+            return words
+        return tuple(lo | (hi << 64)
+                     for lo, hi in zip(words[0::2], words[1::2]))
+
+    def pack(self, lanes: Sequence[int]) -> int:
+        '''Join lane values (which must fit in a lane) into a 256-bit vector'''
+        if self._words_per_lane != 1:
+            lanes = [word
+                     for lane in lanes
+                     for word in (lane & ((1 << 64) - 1), lane >> 64)]
+        return int.from_bytes(self._struct.pack(*lanes), 'little')
+
+    def repeat(self, value: int) -> int:
+        '''Return a vector with value (which must fit a lane) in every lane'''
+        return value * _repeat(1, self.size)
+
+    def split(self, vec: int) -> Tuple[int, int]:
+        '''Split a vector into its even and odd lanes
+
+        Each is returned with a lane in the bottom half of each 2*size-bit
+        slot, so that there are size bits of space above each value.
+
+        '''
+        return (vec & self.even_lanes, (vec >> self.size) & self.even_lanes)
+
+    def join(self, even: int, odd: int) -> int:
+        '''The inverse of split, truncating each slot to a lane'''
+        return ((even & self.even_lanes) |
+                ((odd & self.even_lanes) << self.size))
+
+
+LANE_FORMATS: Dict[int, LaneFormat] = {
+    size: LaneFormat(size) for size in [32, 64, 128]
+}
+
+
+def add_lanes(vec_a: int, vec_b: int, size: int) -> int:
+    '''Add each pair of lanes, modulo 2^size'''
+    fmt = LANE_FORMATS[size]
+    # Add everything but the top bit of each lane, so that no carry leaves
+    # a lane, then fix up the top bits (where a carry in is just an XOR).
+    low = (vec_a & fmt.low_bits) + (vec_b & fmt.low_bits)
+    return low ^ ((vec_a ^ vec_b) & fmt.top_bits)
+
+
+def sub_lanes(vec_a: int, vec_b: int, size: int) -> int:
+    '''Subtract each lane of vec_b from vec_a, modulo 2^size'''
+    fmt = LANE_FORMATS[size]
+    # Set the top bit of each lane of vec_a, so that a borrow never leaves a
+    # lane, then fix up the top bits.
+    diff = (vec_a | fmt.top_bits) - (vec_b & fmt.low_bits)
+    return diff ^ ((vec_a ^ vec_b ^ fmt.top_bits) & fmt.top_bits)
+
+
+def add_mod_lanes(vec_a: int, vec_b: int, mod: int, size: int) -> int:
+    '''Add each pair of lanes, subtracting mod if the sum is at least mod
+
+    This is the operation for BN.ADDVM. As in the hardware, the result is
+    truncated to size bits (which only matters if the inputs aren't already
+    reduced).
+
+    '''
+    fmt = LANE_FORMATS[size]
+    # Adding 2^(size+1) - mod to a sum (which is less than 2^(size+1)) sets
+    # bit size+1 exactly when the sum is at least mod.
+    bias = fmt.slot_ones * ((1 << (size + 1)) - mod)
+
+    def add_slots(a: int, b: int) -> int:
+        sums = a + b
+        ge = ((sums + bias) >> (size + 1)) & fmt.slot_ones
+        return sums - ge * mod
+
+    a_even, a_odd = fmt.split(vec_a)
+    b_even, b_odd = fmt.split(vec_b)
+    return fmt.join(add_slots(a_even, b_even), add_slots(a_odd, b_odd))
+
+
+def sub_mod_lanes(vec_a: int, vec_b: int, mod: int, size: int) -> int:
+    '''Subtract each lane of vec_b from vec_a, adding mod if that goes
+    negative
+
+    This is the operation for BN.SUBVM.
+
+    '''
+    fmt = LANE_FORMATS[size]
+    # Setting bit size of each slot of vec_a means that the subtraction never
+    # borrows from the next slot, and that bit is still set afterwards
+    # exactly when the lane of vec_a was at least the lane of vec_b.
+    guard = fmt.slot_ones << size
+
+    def sub_slots(a: int, b: int) -> int:
+        diffs = (a | guard) - b
+        lt = ((diffs >> size) & fmt.slot_ones) ^ fmt.slot_ones
+        return diffs + lt * mod
+
+    a_even, a_odd = fmt.split(vec_a)
+    b_even, b_odd = fmt.split(vec_b)
+    return fmt.join(sub_slots(a_even, b_even), sub_slots(a_odd, b_odd))
+
+
+def mul_lanes(vec_a: int, vec_b: int, size: int) -> int:
+    '''Multiply each pair of lanes, keeping the low size bits'''
+    fmt = LANE_FORMATS[size]
+    mask = fmt.lane_mask
+    return fmt.pack([(a * b) & mask
+                     for a, b in zip(fmt.unpack(vec_a), fmt.unpack(vec_b))])
+
+
+def mul_by_lane(vec_a: int, vec_b: int, lane: int, size: int) -> int:
+    '''Multiply each lane of vec_a by lane lane of vec_b
+
+    This is the operation for BN.MULVL.
+
+    '''
+    fmt = LANE_FORMATS[size]
+    b = (vec_b >> (lane * size)) & fmt.lane_mask
+    # The product of a lane and b fits in a double-width slot, so multiplying
+    # all the slots by b at once doesn't mix them up.
+    a_even, a_odd = fmt.split(vec_a)
+    return fmt.join(a_even * b, a_odd * b)
+
+
+def _mont_mul_lanes(a_lanes: Sequence[int], b_lanes: Sequence[int],
+                    q: int, mu: int, size: int) -> int:
+    fmt = LANE_FORMATS[size]
+    mask = fmt.lane_mask
+    # This is montgomery_mul_no_cond_subtraction from isa.py for each lane.
+    # The final mask isn't needed there because the inputs are in range, but
+    # this might see any value and must truncate to a lane like map_elems.
+    return fmt.pack([(((c + (((c & mask) * mu) & mask) * q) >> size) & mask)
+                     for c in map(int.__mul__, a_lanes, b_lanes)])
+
+
+def mont_mul_lanes(vec_a: int, vec_b: int, q: int, mu: int,
+                   size: int) -> int:
+    '''Montgomery multiply each pair of lanes, without the final subtraction
+
+    This is the operation for BN.MULVM. See montgomery_mul_no_cond_subtraction
+    in isa.py.
+
+    '''
+    fmt = LANE_FORMATS[size]
+    return _mont_mul_lanes(fmt.unpack(vec_a), fmt.unpack(vec_b), q, mu, size)
+
+
+def mont_mul_by_lane(vec_a: int, vec_b: int, lane: int, q: int, mu: int,
+                     size: int) -> int:
+    '''Montgomery multiply each lane of vec_a by lane lane of vec_b
+
+    This is the operation for BN.MULVML.
+
+    '''
+    fmt = LANE_FORMATS[size]
+    b = (vec_b >> (lane * size)) & fmt.lane_mask
+    lows = fmt.even_lanes
+
+    # As in mul_by_lane, do the steps of _mont_mul_lanes on double-width
+    # slots. Every product is of two numbers that fit in a lane, so fits in a
+    # slot. The sum c + tmp * q might not fit, so add its low and high halves
+    # separately and carry from one to the other by hand.
+    def mont_slots(a: int) -> int:
+        c = a * b
+        tmp = ((c & lows) * mu) & lows
+        tmp_q = tmp * q
+        carry = ((c & lows) + (tmp_q & lows)) >> size
+        return ((c >> size) & lows) + ((tmp_q >> size) & lows) + carry
+
+    a_even, a_odd = fmt.split(vec_a)
+    return fmt.join(mont_slots(a_even), mont_slots(a_odd))
+
+
+def trn_lanes(vec_a: int, vec_b: int, size: int, odd: bool) -> int:
+    '''Interleave the even (or odd) lanes of vec_a and vec_b
+
+    With odd false, this is BN.TRN1: lane 2i of the result is lane 2i of
+    vec_a and lane 2i+1 is lane 2i of vec_b. With odd true, this is BN.TRN2,
+    which takes lane 2i+1 of each input instead.
+
+    '''
+    fmt = LANE_FORMATS[size]
+    if odd:
+        return ((vec_a >> size) & fmt.even_lanes) | (vec_b & fmt.odd_lanes)
+    return (vec_a & fmt.even_lanes) | ((vec_b & fmt.even_lanes) << size)
+
+
+def shift_lanes(vec: int, size: int, shift_type: int, shift_bits: int) -> int:
+    '''Shift each lane left (shift_type 0) or right (1) by shift_bits
+
+    Bits shifted out of a lane are dropped. See shift_vec_elem in isa.py.
+
+    '''
+    assert 0 <= shift_type <= 1
+    assert 0 <= shift_bits
+    if shift_bits >= size:
+        return 0
+
+    fmt = LANE_FORMATS[size]
+    if shift_type == 0:
+        keep = fmt.repeat((fmt.lane_mask << shift_bits) & fmt.lane_mask)
+        return (vec << shift_bits) & keep
+    return (vec >> shift_bits) & fmt.repeat(fmt.lane_mask >> shift_bits)
+
+
+def unpack_24b(vec_a: int, vec_b: int, shift: int) -> int:
+    '''The operation for BN.UNPK
+
+    Shift the 512-bit concatenation {vec_a, vec_b} right by shift and then
+    zero-extend the bottom 8 24-bit elements to 32 bits each.
+
+    '''
+    shifted = (((vec_a << 256) | vec_b) >> shift) & ((1 << 192) - 1)
+    dense = shifted.to_bytes(24, 'little')
+    sparse = bytearray(32)
+    for i in range(3):
+        sparse[i::4] = dense[i::3]
+    return int.from_bytes(sparse, 'little')
+
+
+def pack_24b(vec_a: int, vec_b: int, shift: int) -> int:
+    '''The operation for BN.PACK
+
+    Take the bottom 24 bits of each 32-bit element of vec_a and vec_b, join
+    them into two 192-bit strings and then shift the concatenation of those
+    (with 64 zero bits at the bottom) right by shift, keeping 256 bits.
+
+    '''
+    def dense(vec: int) -> int:
+        sparse = vec.to_bytes(32, 'little')
+        ret = bytearray(24)
+        for i in range(3):
+            ret[i::3] = sparse[i::4]
+        return int.from_bytes(ret, 'little')
+
+    combined = (dense(vec_a) << (192 + 64)) | (dense(vec_b) << 64)
+    return (combined >> shift) & _MASK256
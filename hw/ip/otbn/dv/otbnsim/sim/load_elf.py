@@ -4,16 +4,38 @@
 
 '''OTBN ELF file handling'''
 
+import glob
+import os
 import re
 import struct
-from typing import Optional, Dict
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional
 
+from shared.disk_cache import DiskCache, file_digest, files_digest
 from shared.elf import read_elf
 
 from .decode import decode_words
+from .isa import OTBNInsn
 from .sim import LoopWarps, OTBNSim
 
 
+@dataclass
+class ElfImage:
+    '''The decoded contents of an OTBN ELF file
+
+    This can be loaded into any number of simulators with load_elf_image,
+    which avoids reading and decoding the ELF file for each one.
+
+    '''
+    program: List[OTBNInsn]
+    loop_warps: LoopWarps
+    dmem_bytes: bytes
+    symbols: Dict[str, int]
+    exp_end_addr: Optional[int]
+
+
 def _get_exp_end_addr(symbols: Dict[str, int]) -> Optional[int]:
     '''Get the expected end address for a run of this binary
 
@@ -69,12 +91,8 @@ def _get_loop_warps(symbols: Dict[str, int]) -> LoopWarps:
     return ret
 
 
-def load_elf(sim: OTBNSim, path: str) -> Optional[int]:
-    '''Load ELF file at path and inject its contents into sim
-
-    Returns the expected end address, if set, otherwise None.
-
-    '''
+def _decode_elf_image(path: str) -> ElfImage:
+    '''Read and decode the ELF file at path, without using any cache'''
     (imem_bytes, dmem_bytes, symbols) = read_elf(path)
 
     # Collect imem bytes into 32-bit words and set the validity bit for each
@@ -82,13 +100,93 @@ def load_elf(sim: OTBNSim, path: str) -> Optional[int]:
     imem_words = [(True, w32s[0])
                   for w32s in struct.iter_unpack('<I', imem_bytes)]
 
-    imem_insns = decode_words(0, imem_words)
-    loop_warps = _get_loop_warps(symbols)
-    exp_end = _get_exp_end_addr(symbols)
+    return ElfImage(program=decode_words(0, imem_words),
+                    loop_warps=_get_loop_warps(symbols),
+                    dmem_bytes=dmem_bytes,
+                    symbols=symbols,
+                    exp_end_addr=_get_exp_end_addr(symbols))
+
+
+# Recently decoded ELF files, keyed by a hash of their contents. This means
+# that reloading an ELF file (as the stepped interface does when running a
+# sequence of tests with the same binary) doesn't need to decode it again.
+_IMAGE_CACHE: 'OrderedDict[str, ElfImage]' = OrderedDict()
+_IMAGE_CACHE_SIZE = 16
+
+
+@lru_cache(maxsize=None)
+def _disk_cache_version() -> str:
+    '''The version for ElfImages in a disk cache
+
+    A cached ElfImage contains pickled instruction objects, so it is only
+    valid for the instruction definitions and simulator code that made it.
+    Rather than trying to keep track of that by hand, we use a hash of the
+    YAML files that define the instructions and the simulator's source code.
+
+    '''
+    sim_dir = os.path.dirname(__file__)
+    data_dir = os.path.normpath(os.path.join(sim_dir, '..', '..', '..',
+                                             'data'))
+    paths = (sorted(glob.glob(os.path.join(data_dir, '*.yml'))) +
+             sorted(glob.glob(os.path.join(sim_dir, '*.py'))))
+    return files_digest(paths)
+
+
+def read_elf_image(path: str, cache_dir: Optional[str] = None) -> ElfImage:
+    '''Read and decode the ELF file at path
 
-    sim.load_program(imem_insns)
-    sim.loop_warps = loop_warps
-    sim.load_data(dmem_bytes, has_validity=False)
-    sim.symbols = symbols
+    If we have decoded a file with the same contents recently, this returns
+    the same ElfImage as before. If cache_dir is not None, it names a
+    directory where decoded ELF files are stored between runs.
 
-    return exp_end
+    '''
+    digest = file_digest(path)
+    image = _IMAGE_CACHE.get(digest)
+    if image is not None:
+        _IMAGE_CACHE.move_to_end(digest)
+        return image
+
+    disk_cache = None
+    if cache_dir is not None:
+        disk_cache = DiskCache(cache_dir, 'elf-image', _disk_cache_version())
+        image = disk_cache.get(digest)
+
+    if image is None:
+        image = _decode_elf_image(path)
+        if disk_cache is not None:
+            disk_cache.put(digest, image)
+
+    _IMAGE_CACHE[digest] = image
+    if len(_IMAGE_CACHE) > _IMAGE_CACHE_SIZE:
+        _IMAGE_CACHE.popitem(last=False)
+
+    return image
+
+
+def load_elf_image(sim: OTBNSim, image: ElfImage) -> Optional[int]:
+    '''Inject the contents of a decoded ELF file into sim
+
+    Returns the expected end address, if set, otherwise None.
+
+    '''
+    sim.load_program(image.program)
+    # Copy the loop warps (which add_loop_warp might modify) so that sims
+    # loaded from the same image don't affect each other.
+    sim.loop_warps = {addr: dict(warps)
+                      for addr, warps in image.loop_warps.items()}
+    sim.load_data(image.dmem_bytes, has_validity=False)
+    sim.symbols = image.symbols
+
+    return image.exp_end_addr
+
+
+def load_elf(sim: OTBNSim,
+             path: str,
+             cache_dir: Optional[str] = None) -> Optional[int]:
+    '''Load ELF file at path and inject its contents into sim
+
+    Returns the expected end address, if set, otherwise None. See
+    read_elf_image for cache_dir.
+
+    '''
+    return load_elf_image(sim, read_elf_image(path, cache_dir))
@@ -277,6 +277,15 @@ class MaskingAcceleratorInterface:
         '''Returns whether the MAI is currently busy processing an operation.'''
         return self.csrs.MAI_STATUS.is_busy()
 
+    def is_idle(self) -> bool:
+        '''Returns whether step() has nothing to do.
+
+        This is true when there is no operation running or about to start and
+        the pipeline of the selected accelerator is empty.'''
+        return not (self.is_dispatching or
+                    self.csrs.MAI_CTRL.is_start_bit_set() or
+                    self._accelerator().is_busy())
+
     def is_ready(self) -> bool:
         '''Returns whether the MAI is ready to accept new inputs.'''
         return self.csrs.MAI_STATUS.is_ready()
@@ -2,7 +2,7 @@
 # Licensed under the Apache License, Version 2.0, see LICENSE for details.
 # SPDX-License-Identifier: Apache-2.0
 
-from typing import List, Optional, Set
+from typing import List, Optional, Tuple
 
 from .trace import Trace
 
@@ -26,6 +26,14 @@ class TraceRegister(Trace):
 
 
 class Reg:
+    '''A single register in a register file
+
+    Reads see the value that was committed at the end of the previous cycle.
+    Writes don't touch the register: they get appended to the journal of the
+    parent register file, which applies them when it commits. A register with
+    no parent (like x0) ignores writes.
+
+    '''
     def __init__(self,
                  parent: Optional['RegFile'],
                  idx: int,
@@ -39,22 +47,18 @@ class Reg:
         self._width = width
 
         self._uval = uval
-        self._next_uval: Optional[int] = None
+
+        # A reference to the parent's journal (which is never replaced, just
+        # cleared), so that writes don't need a method call on the parent.
+        self._journal = parent._journal if parent is not None else None
 
     def read_unsigned(self, backdoor: bool = False) -> int:
         return self._uval
 
-    def _mark_written(self) -> None:
-        if self._parent is not None:
-            self._parent.mark_written(self._idx)
-
     def write_unsigned(self, uval: int) -> None:
         assert 0 <= uval < (1 << self._width)
-        self._next_uval = uval
-        self._mark_written()
-
-    def read_next(self) -> Optional[int]:
-        return self._next_uval
+        if self._journal is not None:
+            self._journal.append((self._idx, uval))
 
     def read_signed(self) -> int:
         uval = self.read_unsigned()
@@ -70,16 +74,8 @@ class Reg:
         self.write_unsigned(uval)
 
     def write_invalid(self) -> None:
-        self._next_uval = None
-        self._mark_written()
-
-    def commit(self) -> None:
-        if self._next_uval is not None:
-            self._uval = self._next_uval
-        self._next_uval = None
-
-    def abort(self) -> None:
-        self._next_uval = None
+        if self._parent is not None:
+            self._parent.write_invalid(self._idx)
 
 
 class RegFile:
@@ -88,6 +84,11 @@ class RegFile:
     For GPRs, we override it (see gpr.py) to support our magic x0 and x1
     behaviour.
 
+    Writes in a cycle are appended to a journal of (idx, value) pairs, where
+    value is None for an invalid write. commit() applies the journal in order,
+    so the last write to a register wins, and abort() throws it away. The
+    trace entries for changes() are only built when someone asks for them.
+
     '''
     def __init__(self,
                  name_pfx: str,
@@ -98,39 +99,43 @@ class RegFile:
 
         self._name_pfx = name_pfx
         self._width = width
+        self._journal: List[Tuple[int, Optional[int]]] = []
         self._registers = [Reg(self, i, width, 0) for i in range(depth)]
-        self._pending_writes: Set[int] = set()
 
-    def mark_written(self, idx: int) -> None:
-        '''Mark a register as having been written'''
+    def write_invalid(self, idx: int) -> None:
+        '''Mark a register as having been written with an invalid value
+
+        This leaves the register's value unchanged, so drops any earlier
+        write to the register in this cycle. Invalid writes only happen when
+        wiping, so it doesn't matter that this is slow.
+
+        '''
         assert 0 <= idx < len(self._registers)
-        self._pending_writes.add(idx)
+        self._journal[:] = [entry for entry in self._journal
+                            if entry[0] != idx]
+        self._journal.append((idx, None))
 
     def get_reg(self, idx: int) -> Reg:
         assert 0 <= idx < len(self._registers)
         return self._registers[idx]
 
     def changes(self) -> List[TraceRegister]:
-        ret = []
-        for idx in sorted(self._pending_writes):
-            assert 0 <= idx < len(self._registers)
-            next_val = self.get_reg(idx).read_next()
-            ret.append(TraceRegister('{}{:02}'.format(self._name_pfx, idx),
-                                     self._width,
-                                     next_val))
-        return ret
+        # Only the last write to each register in the cycle is visible.
+        next_vals = dict(self._journal)
+        return [TraceRegister('{}{:02}'.format(self._name_pfx, idx),
+                              self._width,
+                              next_vals[idx])
+                for idx in sorted(next_vals)]
 
     def commit(self) -> None:
-        for idx in self._pending_writes:
-            assert 0 <= idx < len(self._registers)
-            self._registers[idx].commit()
-        self._pending_writes.clear()
+        registers = self._registers
+        for idx, uval in self._journal:
+            if uval is not None:
+                registers[idx]._uval = uval
+        self._journal.clear()
 
     def abort(self) -> None:
-        for idx in self._pending_writes:
-            assert 0 <= idx < len(self._registers)
-            self._registers[idx].abort()
-        self._pending_writes.clear()
+        self._journal.clear()
 
     def peek_unsigned_values(self) -> List[int]:
         '''Get a list of the (unsigned) values of the registers'''
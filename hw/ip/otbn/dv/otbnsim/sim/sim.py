@@ -2,13 +2,16 @@
 # Licensed under the Apache License, Version 2.0, see LICENSE for details.
 # SPDX-License-Identifier: Apache-2.0
 
+import copy
+from time import perf_counter
 from typing import Dict, Iterator, List, Optional, Tuple
 
 from .constants import ErrBits, LcTx, Status, read_lc_tx_t
 from .decode import EmptyInsn
 from .isa import OTBNInsn
+from .sim_profile import SimProfile
 from .state import OTBNState, FsmState
-from .stats import ExecutionStats
+from .stats import ExecutionStats, ProfilingStats
 from .trace import Trace
 
 # A dictionary that defines a function of the form "address -> from -> to". If
@@ -22,8 +25,31 @@ LoopWarps = Dict[int, Dict[int, int]]
 StepRes = Tuple[Optional[OTBNInsn], List[Trace]]
 
 
+class SimSnapshot:
+    '''A saved copy of the state of a simulation
+
+    These are made by OTBNSim.snapshot. A snapshot isn't changed by restoring
+    it, so it can be restored any number of times (to fork several runs from
+    one point).
+
+    '''
+    def __init__(self,
+                 state: OTBNState,
+                 next_insn: Optional[OTBNInsn],
+                 loop_warps: LoopWarps,
+                 stats: Optional[ExecutionStats],
+                 env: object) -> None:
+        self.state = state
+        self.next_insn = next_insn
+        self.loop_warps = loop_warps
+        self.stats = stats
+        # Any state of the environment driving the simulation (see
+        # OTBNSim._save_env)
+        self.env = env
+
+
 class OTBNSim:
-    def __init__(self) -> None:
+    def __init__(self, tracing: bool = True) -> None:
         self.state = OTBNState()
         self.program: List[OTBNInsn] = []
         self.loop_warps: LoopWarps = {}
@@ -32,10 +58,72 @@ class OTBNSim:
         self._execute_generator: Optional[Iterator[None]] = None
         self._next_insn: Optional[OTBNInsn] = None
 
+        # If tracing is false, we don't collect the architectural changes that
+        # happen on each cycle and step() returns an empty list of changes
+        # (unless it is asked for a verbose trace). This is much faster, but
+        # is only appropriate if nothing looks at the changes (the stepped
+        # interface needs them to compare against the RTL).
+        self.tracing = tracing
+
+        # If this is not None, time spent in each phase of simulation gets
+        # recorded here (see sim_profile.py).
+        self.sim_profile: Optional[SimProfile] = None
+
     def load_program(self, program: List[OTBNInsn]) -> None:
         self.program = program.copy()
         self.state.clear_imem_invalidation()
 
+    def _copy_stats(self,
+                    stats: Optional[ExecutionStats]) -> Optional[ExecutionStats]:
+        '''Deep copy stats, sharing the (read-only) program'''
+        if stats is None:
+            return None
+        return copy.deepcopy(stats, {id(self.program): self.program})
+
+    def snapshot(self) -> SimSnapshot:
+        '''Save the current state of the simulation
+
+        This can be restored later with restore(). The snapshot doesn't
+        include the program itself (IMEM), which restore() leaves alone.
+
+        A multi-cycle instruction is modelled with a Python generator, which
+        can't be copied, so this raises a RuntimeError if an instruction is
+        part-way through.
+
+        '''
+        if self._execute_generator is not None:
+            raise RuntimeError('Cannot take a snapshot of the simulation in '
+                               'the middle of a multi-cycle instruction.')
+
+        return SimSnapshot(self.state.snapshot(),
+                           self._next_insn,
+                           copy.deepcopy(self.loop_warps),
+                           self._copy_stats(self.stats),
+                           self._save_env())
+
+    def restore(self, snapshot: SimSnapshot) -> None:
+        '''Restore the simulation to a state saved with snapshot()'''
+        self.state = snapshot.state.snapshot()
+        self._execute_generator = None
+        self._next_insn = snapshot.next_insn
+        self.loop_warps = copy.deepcopy(snapshot.loop_warps)
+        self.stats = self._copy_stats(snapshot.stats)
+        self._restore_env(snapshot.env)
+
+    def _save_env(self) -> object:
+        '''Return the state of the environment for a snapshot
+
+        Subclasses that model part of OTBN's environment (such as
+        StandaloneSim, which supplies RND data) should override this and
+        _restore_env so that a restored snapshot sees the same environment.
+
+        '''
+        return None
+
+    def _restore_env(self, env: object) -> None:
+        '''Restore the environment from a value returned by _save_env'''
+        return
+
     def add_loop_warp(self, addr: int, from_cnt: int, to_cnt: int) -> None:
         '''Add a new loop warp to the simulation'''
         self.loop_warps.setdefault(addr, {})[from_cnt] = to_cnt
@@ -52,13 +140,21 @@ class OTBNSim:
         '''
         self.state.dmem.load_le_words(data, has_validity, word_offset=0)
 
-    def start(self, collect_stats: bool) -> None:
+    def start(self, collect_stats: bool, profile: bool = False) -> None:
         '''Prepare to start the execution.
 
-        Use run() or step() to actually execute the program.
+        Use run() or step() to actually execute the program. If profile is
+        true, collect statistics with a ProfilingStats object (which also
+        attributes each cycle to a PC and call stack), even if collect_stats
+        is false.
 
         '''
-        self.stats = ExecutionStats(self.program) if collect_stats else None
+        if profile:
+            self.stats = ProfilingStats(self.program)
+        elif collect_stats:
+            self.stats = ExecutionStats(self.program)
+        else:
+            self.stats = None
         self._execute_generator = None
         self._next_insn = None
         self.state.start()
@@ -94,17 +190,44 @@ class OTBNSim:
 
         return self.program[word_pc]
 
+    def _changes(self, verbose: bool) -> List[Trace]:
+        '''Return the pending architectural changes if anyone wants them'''
+        if not (self.tracing or verbose):
+            return []
+
+        if self.sim_profile is None:
+            return self.state.changes()
+
+        start = perf_counter()
+        changes = self.state.changes()
+        self.sim_profile.add('changes', start)
+        return changes
+
+    def _commit(self, sim_stalled: bool) -> None:
+        '''Commit the state at the end of a cycle, timing it if profiling'''
+        if self.sim_profile is None:
+            self.state.commit(sim_stalled)
+        else:
+            start = perf_counter()
+            self.state.commit(sim_stalled)
+            self.sim_profile.add('commit', start)
+
     def _on_stall(self,
                   verbose: bool,
                   fetch_next: bool) -> List[Trace]:
         '''This is run on a stall cycle'''
         self.state.stop_if_pending_halt()
-        changes = self.state.changes()
-        self.state.commit(sim_stalled=True)
+        changes = self._changes(verbose)
+        self._commit(sim_stalled=True)
         if fetch_next:
             self._next_insn = self._fetch(self.state.pc)
         if self.stats is not None and not self.state.wiping():
-            self.stats.record_stall()
+            if self.sim_profile is None:
+                self.stats.record_stall(self.state)
+            else:
+                start = perf_counter()
+                self.stats.record_stall(self.state)
+                self.sim_profile.add('stats', start)
         if verbose:
             self._print_trace(self.state.pc, '(stall)', changes)
 
@@ -118,23 +241,27 @@ class OTBNSim:
         self.state.post_insn(self.loop_warps.get(self.state.pc, {}))
 
         if self.stats is not None:
-            self.stats.record_insn(insn, self.state)
+            if self.sim_profile is None:
+                self.stats.record_insn(insn, self.state)
+            else:
+                start = perf_counter()
+                self.stats.record_insn(insn, self.state)
+                self.sim_profile.add('stats', start)
 
         halting = self.state.stop_if_pending_halt()
-        changes = self.state.changes()
+        changes = self._changes(verbose)
 
         # Program counter before commit
         pc_before = self.state.pc
-        self.state.commit(sim_stalled=False)
+        self._commit(sim_stalled=False)
 
         # Fetch the next instruction unless we're done or this instruction had
         # `has_fetch_stall` set (in which case we inject a single cycle stall).
         no_fetch = halting or insn.has_fetch_stall
         self._next_insn = None if no_fetch else self._fetch(self.state.pc)
 
-        disasm = insn.disassemble(pc_before)
         if verbose:
-            self._print_trace(pc_before, disasm, changes)
+            self._print_trace(pc_before, insn.disassemble(pc_before), changes)
 
         return changes
 
@@ -199,10 +326,44 @@ class OTBNSim:
         }
 
         stepper, handles_injected_err = steppers[fsm_state]
+
+        prof = self.sim_profile
+        if prof is None:
+            self.state.take_pending_err_bits()
+            self.state.step(not handles_injected_err)
+            return stepper(verbose)
+
+        # If we are profiling the simulator, the time for the cycle that
+        # isn't spent in one of the phases timed by the stepper (or by
+        # OTBNState.step) is counted as "step".
+        start = perf_counter()
+        accounted = prof.accounted
         self.state.take_pending_err_bits()
-        self.state.step(not handles_injected_err)
+        self.state.step(not handles_injected_err, prof)
+        ret = stepper(verbose)
+        prof.add_rest('step', start, accounted)
+        return ret
+
+    def skip_idle_cycles(self) -> int:
+        '''Jump over cycles where nothing can happen
 
-        return stepper(verbose)
+        This finds the next cycle where stepping might have some effect other
+        than counting down an internal timer and moves the simulation straight
+        to the start of that cycle. It returns the number of cycles skipped,
+        which is zero if the next cycle might do something.
+
+        The skipped cycles don't appear in any trace, so this should only be
+        used when nobody is looking at each cycle (as in a standalone run).
+        Cycle counts are unchanged: the caller should add the return value to
+        its count of cycles.
+
+        At the moment, the only cycles that we skip are the ones in the middle
+        of a secure wipe round.
+
+        '''
+        if self.state.get_fsm_state() == FsmState.WIPING:
+            return self.state.skip_quiet_wipe_cycles()
+        return 0
 
     def _step_idle(self, verbose: bool) -> StepRes:
         '''Step the simulation when OTBN is IDLE or LOCKED'''
@@ -262,15 +423,15 @@ class OTBNSim:
                     if is_locked:
                         self.state.lock_after_wipe = True
 
-        changes = self.state.changes()
-        self.state.commit(sim_stalled=True)
+        changes = self._changes(verbose)
+        self._commit(sim_stalled=True)
         return (None, changes)
 
     def _step_ext_wipe(self, verbose: bool) -> StepRes:
         '''Step the simulation DMEM/IMEM wipe operation'''
         self.state.stop_if_pending_halt()
-        changes = self.state.changes()
-        self.state.commit(sim_stalled=True)
+        changes = self._changes(verbose)
+        self._commit(sim_stalled=True)
         return (None, changes)
 
     def _step_pre_exec(self, verbose: bool) -> StepRes:
@@ -331,6 +492,9 @@ class OTBNSim:
         if not insn.has_bits:
             self._execute_generator = None
 
+        if self.sim_profile is not None:
+            exec_start = perf_counter()
+
         if self._execute_generator is None:
             # This is the first cycle for an instruction. Run any setup for
             # the state object and then start running the instruction
@@ -351,6 +515,9 @@ class OTBNSim:
             except StopIteration:
                 self._execute_generator = None
 
+        if self.sim_profile is not None:
+            self.sim_profile.add_insn(insn.insn.mnemonic, exec_start)
+
         if (self.state.wsrs.RND.rep_err_escalate):
             self.state.stop_at_end_of_cycle(ErrBits.RND_REP_CHK_FAIL)
         if (self.state.wsrs.RND.fips_err_escalate):
@@ -540,8 +707,15 @@ class OTBNSim:
 
     def _print_trace(self, pc: int, disasm: str, changes: List[Trace]) -> None:
         '''Print a trace of the current instruction'''
+        if self.sim_profile is None:
+            changes_str = ', '.join([t.trace() for t in changes])
+            print('{:08x} | {:45} | [{}]'.format(pc, disasm, changes_str))
+            return
+
+        start = perf_counter()
         changes_str = ', '.join([t.trace() for t in changes])
         print('{:08x} | {:45} | [{}]'.format(pc, disasm, changes_str))
+        self.sim_profile.add('trace', start)
 
     def on_otp_cdc_done(self) -> None:
         '''Signifies when the scrambling key request gets processed'''
@@ -0,0 +1,123 @@
+# Copyright lowRISC contributors (OpenTitan project).
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Wall-clock timers for the simulator itself
+
+A SimProfile measures where the Python model spends its time, rather than
+where the simulated program spends its cycles (which is what ProfilingStats
+in stats.py does). It is filled in by OTBNSim, OTBNState, the block engine and
+the stepped/standalone front ends when OTBNSim.sim_profile is set. When it is
+None (the default), the only cost is a check of that attribute in a few
+places per cycle.
+
+Each phase is timed separately and the phases don't overlap: time spent in a
+nested phase (such as KMAC stepping inside a cycle) isn't counted again by the
+phase around it. The "execute" phase is also broken down by instruction
+mnemonic.
+
+'''
+
+from time import perf_counter
+from typing import Dict, List
+
+from tabulate import tabulate
+
+
+class SimProfile:
+    '''Time and call counts for each phase of the simulator'''
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        '''Clear all the timers and counters'''
+        self.phase_times: Dict[str, float] = {}
+        self.phase_counts: Dict[str, int] = {}
+        self.insn_times: Dict[str, float] = {}
+        self.insn_counts: Dict[str, int] = {}
+
+        # The total time that has been added to some phase. This is used by
+        # add_rest to avoid counting nested phases twice.
+        self.accounted = 0.0
+        self.start_time = perf_counter()
+
+    def _add_time(self, phase: str, elapsed: float, count: int) -> None:
+        self.phase_times[phase] = self.phase_times.get(phase, 0.0) + elapsed
+        self.phase_counts[phase] = self.phase_counts.get(phase, 0) + count
+        self.accounted += elapsed
+
+    def add(self, phase: str, start: float, count: int = 1) -> float:
+        '''Add the time since start to phase
+
+        Returns the current time, which can be used as the start time of
+        another phase.
+
+        '''
+        now = perf_counter()
+        self._add_time(phase, now - start, count)
+        return now
+
+    def add_rest(self,
+                 phase: str,
+                 start: float,
+                 accounted_at_start: float,
+                 count: int = 1) -> float:
+        '''Add the time since start to phase, less any nested phases
+
+        accounted_at_start should be the value of self.accounted at start.
+
+        '''
+        now = perf_counter()
+        nested = self.accounted - accounted_at_start
+        self._add_time(phase, now - start - nested, count)
+        return now
+
+    def add_insn(self, mnemonic: str, start: float) -> float:
+        '''Add the time since start to the execute phase for mnemonic'''
+        now = perf_counter()
+        elapsed = now - start
+        self.insn_times[mnemonic] = \
+            self.insn_times.get(mnemonic, 0.0) + elapsed
+        self.insn_counts[mnemonic] = self.insn_counts.get(mnemonic, 0) + 1
+        self._add_time('execute', elapsed, 1)
+        return now
+
+    @staticmethod
+    def _table(times: Dict[str, float],
+               counts: Dict[str, int],
+               total: float,
+               count_hdr: str) -> str:
+        rows = []
+        for name, secs in sorted(times.items(), key=lambda kv: -kv[1]):
+            count = counts.get(name, 0)
+            per_call = 1e6 * secs / count if count else 0.0
+            pct = 100 * secs / total if total else 0.0
+            rows.append((name, count, secs, pct, per_call))
+
+        return tabulate(rows,
+                        headers=['', count_hdr, 'seconds', '%', 'us each'],
+                        floatfmt=('', '', '.3f', '.1f', '.2f'))
+
+    def dump(self) -> str:
+        '''Return a human-readable report of the timers'''
+        wall = perf_counter() - self.start_time
+
+        # Anything that wasn't in a phase was spent in the code driving the
+        # simulation (the stepped command loop, for example).
+        times = dict(self.phase_times)
+        times['(outside the model)'] = max(0.0, wall - self.accounted)
+
+        out: List[str] = []
+        out.append(f'Wall-clock time: {wall:.3f}s')
+        out.append('')
+        out.append('Time per phase')
+        out.append('--------------')
+        out.append(self._table(times, self.phase_counts, wall, 'calls'))
+        out.append('')
+        out.append('Execute time per instruction')
+        out.append('----------------------------')
+        out.append(self._table(self.insn_times, self.insn_counts,
+                               self.phase_times.get('execute', 0.0),
+                               'cycles'))
+        out.append('')
+        return '\n'.join(out)
@@ -2,15 +2,18 @@
 # Licensed under the Apache License, Version 2.0, see LICENSE for details.
 # SPDX-License-Identifier: Apache-2.0
 
-from itertools import cycle
-from typing import Dict, Optional, TextIO
+from time import perf_counter
+from typing import Dict, List, Optional, TextIO
+from .blocks import BlockEngine
+from .isa import OTBNInsn
 from .sim import OTBNSim
 from .state import FsmState
 
-_TEST_RND_DATA = cycle([
+# The values that we supply for RND requests, in turn.
+_TEST_RND_DATA = [
     0xAAAAAAAA_99999999_AAAAAAAA_99999999_AAAAAAAA_99999999_AAAAAAAA_99999999,
     0xCCCCCCCC_BBBBBBBB_CCCCCCCC_BBBBBBBB_CCCCCCCC_BBBBBBBB_CCCCCCCC_BBBBBBBB,
-])
+]
 
 
 # This is the default seed for URND PRNG. Note that the actualy URND value will
@@ -20,15 +23,68 @@ _TEST_URND_DATA = [
     0x25a4fe335d095f1e, 0x2cba89acbe4a07e9
 ]
 
+# The sideload keys that we supply to a program.
+_TEST_SIDELOAD_KEY0 = int('deadbeef' * 12, 16)
+_TEST_SIDELOAD_KEY1 = int('baadf00d' * 12, 16)
+
 
 class StandaloneSim(OTBNSim):
-    def run(self, verbose: bool, dump_file: Optional[TextIO]) -> int:
+    def __init__(self, tracing: bool = True, use_blocks: bool = True) -> None:
+        super().__init__(tracing)
+        # The block engine skips the per-cycle trace, so we only use it if
+        # nobody will want to see that.
+        self.use_blocks = use_blocks and not tracing
+        self.blocks = BlockEngine(self.program)
+        # The number of RND requests that we have responded to
+        self.rnd_count = 0
+
+    def load_program(self, program: List[OTBNInsn]) -> None:
+        super().load_program(program)
+        self.blocks = BlockEngine(self.program)
+
+    def _save_env(self) -> object:
+        return self.rnd_count
+
+    def _restore_env(self, env: object) -> None:
+        assert isinstance(env, int)
+        self.rnd_count = env
+
+    def _run_fast(self) -> int:
+        '''Run a basic block or skip idle cycles, returning the cycle count'''
+        prof = self.sim_profile
+        if prof is None:
+            return self.blocks.try_run(self) or self.skip_idle_cycles()
+
+        # When profiling the simulator, count the time spent running blocks
+        # (other than executing their instructions) as a phase of its own.
+        start = perf_counter()
+        accounted = prof.accounted
+        cycles = self.blocks.try_run(self)
+        if cycles:
+            prof.add_rest('blocks', start, accounted, cycles)
+            return cycles
+
+        return self.skip_idle_cycles()
+
+    def run(self,
+            verbose: bool,
+            dump_file: Optional[TextIO],
+            stop_pc: Optional[int] = None) -> int:
         '''Run until ECALL.
 
+        If stop_pc is not None, stop early (without dumping registers) if we
+        are about to start executing the instruction at stop_pc. This is a
+        point where snapshot() can save the state. Calling run() again will
+        continue the simulation.
+
         Return the number of cycles taken.
 
         '''
         insn_count = 0
+        # Blocks might run straight past stop_pc, so don't use them if it is
+        # set. The same flag controls skipping idle cycles (which doesn't
+        # matter for stop_pc, but would leave gaps in a verbose trace).
+        use_blocks = self.use_blocks and not verbose and stop_pc is None
 
         # Skip the initial secure wipe
         self.state.complete_init_sec_wipe()
@@ -36,8 +92,9 @@ class StandaloneSim(OTBNSim):
         while True:
             # If there's a RND request, respond immediately
             if self.state.ext_regs.read('RND_REQ', True):
-                self.state.wsrs.RND.set_unsigned(next(_TEST_RND_DATA), False,
-                                                 False)
+                rnd_data = _TEST_RND_DATA[self.rnd_count % len(_TEST_RND_DATA)]
+                self.state.wsrs.RND.set_unsigned(rnd_data, False, False)
+                self.rnd_count += 1
             # If there's a URND request, respond immediately.
             if not self.state.wsrs.URND.running:
                 self.state.wsrs.URND.set_seed(_TEST_URND_DATA)
@@ -47,8 +104,19 @@ class StandaloneSim(OTBNSim):
             if not self.state.wsrs.URND.running:
                 self.state.wsrs.URND.set_seed(_TEST_URND_DATA)
 
-            self.step(verbose)
-            insn_count += 1
+            # Run a whole basic block or skip over some idle cycles if we
+            # can. If not, step a single cycle. While there is a RND request,
+            # we answer it on every cycle (above), which moves rnd_count on,
+            # so we have to step one cycle at a time to see the same RND
+            # values as we would without blocks.
+            fast_cycles = 0
+            if use_blocks and not self.state.ext_regs.read('RND_REQ', True):
+                fast_cycles = self._run_fast()
+            if fast_cycles:
+                insn_count += fast_cycles
+            else:
+                self.step(verbose)
+                insn_count += 1
 
             # Dump registers on the first wipe cycle. This makes sure that we
             # dump them before zeroing.
@@ -57,8 +125,20 @@ class StandaloneSim(OTBNSim):
                     self.dump_regs(dump_file)
                 break
 
+            if (stop_pc is not None and
+                    self.state.pc == stop_pc and
+                    self._next_insn is not None and
+                    self._execute_generator is None and
+                    self.state.get_fsm_state() == FsmState.EXEC):
+                break
+
         return insn_count
 
+    def load_test_sideload_keys(self) -> None:
+        '''Supply the fixed sideload keys that we use for standalone runs'''
+        self.state.wsrs.set_sideload_keys(_TEST_SIDELOAD_KEY0,
+                                          _TEST_SIDELOAD_KEY1)
+
     def load_dmem_vars(self, dmem_vars: Dict[str, bytes]) -> None:
         for label, value in dmem_vars.items():
             offset = self.symbols.get(label)
@@ -2,7 +2,9 @@
 # Licensed under the Apache License, Version 2.0, see LICENSE for details.
 # SPDX-License-Identifier: Apache-2.0
 
+import copy
 from enum import IntEnum
+from time import perf_counter
 from typing import Dict, List, Optional
 
 from shared.mem_layout import get_memory_layout
@@ -18,6 +20,7 @@ from .kmac import Kmac
 from .loop import LoopStack
 from .mai import MaskingAcceleratorInterface
 from .reg import RegFile
+from .sim_profile import SimProfile
 from .trace import Trace, TracePC
 from .wsr import WSRFile
 
@@ -309,13 +312,123 @@ class OTBNState:
             return True
         return False
 
-    def step(self, handle_injected_error: bool) -> None:
+    def step(self,
+             handle_injected_error: bool,
+             profile: Optional[SimProfile] = None) -> None:
         if handle_injected_error:
             self.take_injected_err_bits()
+
+        if profile is None:
+            self.ext_regs.step()
+            self._urnd_client.step()
+            self.kmac.step()
+            self.mai.step()
+            return
+
+        # The same as above, but timing each of the blocks that we step
+        start = perf_counter()
         self.ext_regs.step()
         self._urnd_client.step()
+        start = profile.add('edn', start)
         self.kmac.step()
+        start = profile.add('kmac', start)
         self.mai.step()
+        profile.add('mai', start)
+
+    def _is_quiescent_but_kmac(self) -> bool:
+        '''Like is_quiescent, but ignoring KMAC'''
+        return (not self.pending_halt and
+                not self._pending_err_bits and
+                not self.injected_err_bits and
+                not self._stall_requested and
+                self.rma_req != LcTx.ON and
+                self._time_to_imem_invalidation is None and
+                not self.invalidated_imem and
+                not self.wsrs.RND.rep_err_escalate and
+                not self.wsrs.RND.fips_err_escalate and
+                not self.ext_regs.rnd_cdc_in_progress() and
+                not self._urnd_client.cdc_in_progress() and
+                self.mai.is_idle())
+
+    def is_quiescent(self) -> bool:
+        '''Return true if nothing outside the core needs attention
+
+        This is true if step() would have no effect (the EDN clients, KMAC and
+        the MAI have nothing to do) and there are no pending errors, stall
+        requests, RMA requests or IMEM invalidations that would need handling
+        on the next cycle.
+        '''
+        return self._is_quiescent_but_kmac() and self.kmac.is_idle()
+
+    def quiet_cycles(self) -> int:
+        '''Return how many cycles step() can be skipped for
+
+        This is like is_quiescent, except that KMAC is allowed to be part-way
+        through a Keccak computation, which doesn't need stepping until it
+        finishes: see Kmac.quiet_cycles. The result is the number of cycles,
+        starting with the next one, that don't need stepping as long as they
+        don't access any CSRs or WSRs (zero if the next cycle needs stepping
+        and sys.maxsize if there is no limit). Call skip_quiet_cycles
+        afterwards to catch up.
+        '''
+        if not self._is_quiescent_but_kmac():
+            return 0
+        return self.kmac.quiet_cycles()
+
+    def skip_quiet_cycles(self, cycles: int) -> None:
+        '''Catch up after not calling step() for some quiet cycles'''
+        self.kmac.skip_cycles(cycles)
+
+    def skip_quiet_wipe_cycles(self) -> int:
+        '''Skip the cycles in a wipe round where nothing happens
+
+        A wipe round takes _WIPE_CYCLES cycles, but OTBNSim._step_wiping only
+        does something on the first cycle and the last two. If nothing outside
+        the core needs attention, the only effect of the other cycles is to
+        count down wipe_cycles. This jumps straight past them, returning the
+        number of cycles skipped (which might be zero).
+
+        This should be called between cycles. It only skips cycles once a
+        cycle in the WIPING state has been committed, so that any writes from
+        starting the round have landed.
+
+        '''
+        if not (self._fsm_state == FsmState.WIPING and
+                self._next_fsm_state == FsmState.WIPING and
+                self.old_state == FsmState.WIPING and
+                self.time_to_insn_cnt_zero is None and
+                (not self.lock_after_wipe or
+                 self.ext_regs.read('INSN_CNT', True) == 0) and
+                self.ext_regs.is_settled() and
+                self.is_quiescent()):
+            return 0
+
+        # _step_wiping decrements wipe_cycles at the start of the cycle and
+        # does the end-of-round work once it gets to 1, so stop when it is 2.
+        skip = max(0, self.wipe_cycles - 2)
+        self.wipe_cycles -= skip
+        self.cycles_in_this_state += skip
+        return skip
+
+    def urnd_requesting(self) -> bool:
+        '''Return true if we are waiting for URND seed data from the EDN'''
+        return self._urnd_client.is_requesting()
+
+    def has_pending_err_bits(self) -> bool:
+        '''Return true if there are delayed error bits for the next cycle'''
+        return self._pending_err_bits != 0
+
+    def snapshot(self) -> 'OTBNState':
+        '''Return an independent copy of the current state
+
+        This covers everything in the model: registers, DMEM, the loop and
+        call stacks, WSRs and CSRs (including the URND PRNG, KMAC and MAI),
+        external registers, EDN clients and the FSM state, together with any
+        changes that haven't been committed yet. Use OTBNSim.snapshot to save
+        the state of a whole simulation.
+
+        '''
+        return copy.deepcopy(self)
 
     def commit(self, sim_stalled: bool) -> None:
         if self._time_to_imem_invalidation is not None:
@@ -2,19 +2,38 @@
 # Licensed under the Apache License, Version 2.0, see LICENSE for details.
 # SPDX-License-Identifier: Apache-2.0
 
+import heapq
+from bisect import bisect_right
 from collections import Counter, defaultdict, namedtuple
-from typing import Dict, Iterator, List, Optional
+from typing import (Dict, Iterator, List, Mapping, NamedTuple, Optional,
+                    Tuple)
 
 from elftools.dwarf.dwarfinfo import DWARFInfo  # type: ignore
 from elftools.elf.elffile import ELFFile  # type: ignore
 from elftools.elf.sections import SymbolTableSection  # type: ignore
 from tabulate import tabulate
 
+from shared.disk_cache import DiskCache, file_digest
+
 from .insn import BEQ, BNE, ECALL, JAL, JALR, LOOP, LOOPI
 from .isa import OTBNInsn
 from .state import OTBNState
 
 
+class FuncCall(NamedTuple):
+    '''A function call, as counted in ExecutionStats.func_calls'''
+    call_site: int
+    caller_func: int
+    callee_func: int
+
+
+class LoopEntry(NamedTuple):
+    '''A loop entry, as counted in ExecutionStats.loops'''
+    loop_addr: int
+    loop_len: int
+    iterations: int
+
+
 class ExecutionStats:
     def __init__(self, program: List[OTBNInsn]) -> None:
         # Executed program (the contents of the instruction memory).
@@ -22,8 +41,14 @@ class ExecutionStats:
 
         self.stall_count = 0
         self.insn_histo: Counter[str] = Counter()
-        self.func_calls: List[Dict[str, int]] = []
-        self.loops: List[Dict[str, int]] = []
+
+        # Function calls and loop entries. Rather than keeping a list entry
+        # for each one (which grows without bound on a long run), we count
+        # how many times each distinct call or loop entry happened. A Counter
+        # keeps keys in the order they were first seen, which is all the
+        # analysis needs.
+        self.func_calls: Counter[FuncCall] = Counter()
+        self.loops: Counter[LoopEntry] = Counter()
 
         # Histogram indexed by the length of the (extended) basic block.
         self.basic_block_histo: Counter[int] = Counter()
@@ -39,8 +64,12 @@ class ExecutionStats:
         '''Get the number of executed instructions.'''
         return sum(self.insn_histo.values())
 
-    def record_stall(self) -> None:
-        '''Record a single stall cycle.'''
+    def record_stall(self, state: OTBNState) -> None:
+        '''Record a single stall cycle.
+
+        state is the state of OTBN after the cycle has been committed.
+
+        '''
         self.stall_count += 1
 
     def _insn_at_addr(self, addr: int) -> Optional[OTBNInsn]:
@@ -78,21 +107,17 @@ class ExecutionStats:
             else:
                 caller_func = 0  # (start address)
 
-            self.func_calls.append({
-                'call_site': pc,
-                'caller_func': caller_func,
-                'callee_func': state_bc.get_next_pc(),
-            })
+            self.func_calls[FuncCall(call_site=pc,
+                                     caller_func=caller_func,
+                                     callee_func=state_bc.get_next_pc())] += 1
 
         # Loops
         if isinstance(insn, LOOP) or isinstance(insn, LOOPI):
             assert state_bc.in_loop()
             iterations = state_bc.loop_stack.stack[-1].loop_count
-            self.loops.append({
-                'loop_addr': pc,
-                'loop_len': insn.bodysize,
-                'iterations': iterations,
-            })
+            self.loops[LoopEntry(loop_addr=pc,
+                                 loop_len=insn.bodysize,
+                                 iterations=iterations)] += 1
 
         last_in_loop_body = state_bc.loop_stack.is_last_insn_in_loop_body(pc)
 
@@ -131,6 +156,108 @@ class ExecutionStats:
             self._current_ext_basic_block_len = 0
 
 
+# A frame in a profiled call stack: either ('func', entry_addr) for a function
+# or ('loop', loop_insn_addr) for a loop.
+Frame = Tuple[str, int]
+
+
+class ProfilingStats(ExecutionStats):
+    '''Execution statistics that also attribute each cycle to a call stack
+
+    As well as everything that ExecutionStats collects, this counts the
+    cycles spent at each PC (with stall cycles counted separately) and in each
+    stack of functions and loops. The stack is made from the functions that
+    have been called (tracked by following calls and returns, like the
+    function call statistics) and the levels of the loop stack, in the order
+    they were entered. The bottom of each stack is the function where
+    execution started.
+
+    '''
+    def __init__(self, program: List[OTBNInsn]) -> None:
+        super().__init__(program)
+
+        # Cycles (including stalls) and stall cycles, indexed by PC
+        self.pc_cycles: Counter[int] = Counter()
+        self.pc_stalls: Counter[int] = Counter()
+
+        # Cycles (including stalls), indexed by stack
+        self.stack_cycles: Counter[Tuple[Frame, ...]] = Counter()
+
+        # The functions that we are in, bottom-first, as pairs (entry_addr,
+        # loop_depth) where loop_depth is the depth of the loop stack when the
+        # function was called. This is empty until the first instruction.
+        self._funcs: List[Tuple[int, int]] = []
+
+        # The stack that we computed last time, together with the function
+        # stack depth and the top of the loop stack that it was computed for.
+        self._stack: Tuple[Frame, ...] = ()
+        self._stack_funcs = -1
+        self._stack_loop_depth = -1
+        self._stack_loop_top: object = None
+
+    def _get_stack(self,
+                   state: OTBNState,
+                   skip_top_loop: bool) -> Tuple[Frame, ...]:
+        '''Get the current stack of functions and loops'''
+        if not self._funcs:
+            self._funcs.append((state.pc, 0))
+
+        loops = state.loop_stack.stack
+        if skip_top_loop:
+            loops = loops[:-1]
+
+        loop_top = loops[-1] if loops else None
+        if (self._stack_funcs == len(self._funcs) and
+                self._stack_loop_depth == len(loops) and
+                self._stack_loop_top is loop_top):
+            return self._stack
+
+        frames: List[Frame] = []
+        next_loop = 0
+        for func_addr, loop_depth in self._funcs:
+            while next_loop < min(loop_depth, len(loops)):
+                frames.append(('loop',
+                               loops[next_loop].get_loop_insn_addr()))
+                next_loop += 1
+            frames.append(('func', func_addr))
+        for loop in loops[next_loop:]:
+            frames.append(('loop', loop.get_loop_insn_addr()))
+
+        self._stack = tuple(frames)
+        self._stack_funcs = len(self._funcs)
+        self._stack_loop_depth = len(loops)
+        self._stack_loop_top = loop_top
+        return self._stack
+
+    def record_stall(self, state: OTBNState) -> None:
+        super().record_stall(state)
+        self.pc_cycles[state.pc] += 1
+        self.pc_stalls[state.pc] += 1
+        self.stack_cycles[self._get_stack(state, False)] += 1
+
+    def record_insn(self,
+                    insn: OTBNInsn,
+                    state_bc: OTBNState) -> None:
+        super().record_insn(insn, state_bc)
+        pc = state_bc.pc
+        self.pc_cycles[pc] += 1
+
+        # A LOOP or LOOPI instruction has already pushed its loop, but we want
+        # to count it in the enclosing code.
+        is_loop = isinstance(insn, LOOP) or isinstance(insn, LOOPI)
+        self.stack_cycles[self._get_stack(state_bc, is_loop)] += 1
+
+        # Update the function stack for calls (which write x1) and returns
+        # (jumps to the address in x1).
+        if isinstance(insn, JAL) or isinstance(insn, JALR):
+            if insn.grd == 1:
+                self._funcs.append((state_bc.get_next_pc(),
+                                    len(state_bc.loop_stack.stack)))
+            elif (isinstance(insn, JALR) and insn.grs1 == 1 and
+                  len(self._funcs) > 1):
+                self._funcs.pop()
+
+
 SourceLine = namedtuple('SourceLine', ['addr', 'path', 'lineno'])
 
 
@@ -160,16 +287,112 @@ def _dwarf_iter_file_line(dwarf_info: DWARFInfo,
             yield SourceLine(state.address, path, state.line)
 
 
-def _dwarf_decode_file_line(dwarf_info: DWARFInfo, address: int) -> Optional[SourceLine]:
-    # Go over all the line programs in the DWARF information, looking for
-    # one that describes the given address.
-    lines = list(_dwarf_iter_file_line(dwarf_info, full_path=False))
-    for before, after in zip(lines, lines[1:]):
-        if before is None or after is None:
-            continue
-        if before.addr <= address < after.addr:
-            return before
-    return None
+# A table mapping addresses to source lines, as built by _dwarf_line_table.
+LineTable = Tuple[List[int], List[Optional[SourceLine]]]
+
+
+def _dwarf_line_table(dwarf_info: DWARFInfo) -> LineTable:
+    '''Build a table mapping addresses to source lines
+
+    Each pair of consecutive entries in the line programs (with no end of
+    sequence between them) describes a half-open address range. Ranges from
+    different line programs might overlap, in which case an address belongs to
+    the first range that contains it.
+
+    The table is returned as a pair of lists (starts, lines). starts is sorted
+    and lines[i] is the source line for addresses in [starts[i],
+    starts[i + 1]) (or None if there isn't one). Use _lookup_line_table to find
+    the source line for an address.
+
+    '''
+    ranges = []
+    prev = None
+    for line in _dwarf_iter_file_line(dwarf_info, full_path=False):
+        if prev is not None and line is not None and prev.addr < line.addr:
+            ranges.append((prev.addr, line.addr, prev))
+        prev = line
+
+    # Sweep over the start and end points of the ranges in address order,
+    # keeping a heap of the ranges that have started, ordered by position in
+    # the line programs. Ranges that have finished are only removed once they
+    # get to the top of the heap, but that's fine because we only ever look at
+    # the top.
+    points = sorted({addr for start, end, _ in ranges for addr in (start, end)})
+    by_start = sorted(range(len(ranges)), key=lambda idx: ranges[idx][0])
+    open_ranges: List[Tuple[int, int]] = []
+    next_range = 0
+
+    starts: List[int] = []
+    lines: List[Optional[SourceLine]] = []
+    for point in points:
+        while (next_range < len(by_start) and
+               ranges[by_start[next_range]][0] == point):
+            idx = by_start[next_range]
+            heapq.heappush(open_ranges, (idx, ranges[idx][1]))
+            next_range += 1
+
+        while open_ranges and open_ranges[0][1] <= point:
+            heapq.heappop(open_ranges)
+
+        line = ranges[open_ranges[0][0]][2] if open_ranges else None
+        if not lines or lines[-1] != line:
+            starts.append(point)
+            lines.append(line)
+
+    return (starts, lines)
+
+
+def _lookup_line_table(table: LineTable, address: int) -> Optional[SourceLine]:
+    '''Look up the source line for an address in a table from _dwarf_line_table'''
+    starts, lines = table
+    idx = bisect_right(starts, address) - 1
+    return lines[idx] if idx >= 0 else None
+
+
+def lcov_source_lines(elf_file: ELFFile) -> List[SourceLine]:
+    '''Return the source lines that an lcov report for elf_file describes
+
+    These are the entries in the DWARF line programs, in order, with full
+    paths. Returns an empty list if there is no debug information.
+
+    '''
+    if not elf_file.has_dwarf_info():
+        return []
+    dwarf_info = elf_file.get_dwarf_info()
+    return [info
+            for info in _dwarf_iter_file_line(dwarf_info, full_path=True)
+            if info is not None]
+
+
+# Hit counts for an lcov report, indexed by path and then line number.
+LineHits = Dict[str, Dict[int, int]]
+
+
+def lcov_line_hits(lines: List[SourceLine],
+                   coverage: Mapping[int, int]) -> LineHits:
+    '''Find the hit count for each source line
+
+    lines is a list from lcov_source_lines and coverage maps PCs to the number
+    of times they were executed. If several entries in lines have the same
+    path and line number, the last one wins.
+
+    '''
+    hits_by_path: defaultdict[str, Dict[int, int]] = defaultdict(dict)
+    for info in lines:
+        hits_by_path[info.path][info.lineno] = coverage.get(info.addr, 0)
+    return hits_by_path
+
+
+def format_lcov(hits_by_path: LineHits) -> str:
+    '''Format hit counts from lcov_line_hits as an lcov tracefile'''
+    out = []
+    for path, hits in hits_by_path.items():
+        out.append(f'SF:{path}')
+        for line, hit in hits.items():
+            out.append(f'DA:{line},{hit}')
+        out.append('end_of_record')
+
+    return '\n'.join(out) + '\n'
 
 
 def _get_addr_symbol_map(elf_file: ELFFile) -> Dict[int, str]:
@@ -185,29 +408,62 @@ class ExecutionStatAnalyzer:
     # Assumed clock frequency of OTBN, in MHz.
     FREQ_MHZ = 100
 
-    def __init__(self, stats: ExecutionStats, elf_file_path: str):
+    # Version of the address index stored in the disk cache. Bump this if the
+    # format changes.
+    _CACHE_VERSION = '1'
+
+    def __init__(self,
+                 stats: ExecutionStats,
+                 elf_file_path: str,
+                 cache_dir: Optional[str] = None):
         self._elf_file = ELFFile(open(elf_file_path, 'rb'))
         self._stats = stats
-        self._addr_symbol_map = _get_addr_symbol_map(self._elf_file)
 
-    def _describe_imem_addr(self, address: int) -> str:
-        symbol_name = None
+        # The symbol map and line table are derived from the ELF file alone,
+        # so we can reuse them from an earlier run if there is a cache.
+        cache = None
+        digest = ''
+        index = None
+        if cache_dir is not None:
+            cache = DiskCache(cache_dir, 'stats-index', self._CACHE_VERSION)
+            digest = file_digest(elf_file_path)
+            index = cache.get(digest)
+
+        if index is None:
+            line_table: LineTable = ([], [])
+            if self._elf_file.has_dwarf_info():
+                dwarf_info = self._elf_file.get_dwarf_info()
+                line_table = _dwarf_line_table(dwarf_info)
+            index = (_get_addr_symbol_map(self._elf_file), line_table)
+            if cache is not None:
+                cache.put(digest, index)
+
+        self._addr_symbol_map: Dict[int, str] = index[0]
+        self._line_table: LineTable = index[1]
+        self._sorted_symbol_addrs = sorted(self._addr_symbol_map)
+
+    def _imem_symbol(self, address: int) -> str:
+        '''Describe an address as a symbol name plus an optional offset
+
+        Returns an empty string if there is no symbol at or below address.
+
+        '''
         if address in self._addr_symbol_map:
-            symbol_name = self._addr_symbol_map[address]
-        else:
-            # |func_addr| is the largest possible |sym_addr| which is at most
-            # |address|.
-            func_addr = 0
-            for sym_addr in self._addr_symbol_map.keys():
-                if sym_addr <= address and sym_addr > func_addr:
-                    func_addr = sym_addr
-            func_name = self._addr_symbol_map[func_addr]
-            symbol_name = func_name + f"+{address - func_addr:#x}"
-
-        file_line = None
-        if self._elf_file.has_dwarf_info():
-            dwarf_info = self._elf_file.get_dwarf_info()
-            file_line = _dwarf_decode_file_line(dwarf_info, address)
+            return self._addr_symbol_map[address]
+
+        # |func_addr| is the largest possible |sym_addr| which is at most
+        # |address|.
+        idx = bisect_right(self._sorted_symbol_addrs, address) - 1
+        if idx < 0:
+            return ''
+        func_addr = self._sorted_symbol_addrs[idx]
+        func_name = self._addr_symbol_map[func_addr]
+        return func_name + f"+{address - func_addr:#x}"
+
+    def _describe_imem_addr(self, address: int) -> str:
+        symbol_name = self._imem_symbol(address)
+
+        file_line = _lookup_line_table(self._line_table, address)
 
         add_info = []
         if symbol_name:
@@ -294,18 +550,18 @@ class ExecutionStatAnalyzer:
         callgraph: Dict[int, Counter[int]] = {}  # type
         rev_callgraph: Dict[int, Counter[int]] = {}
         rev_callsites: Dict[int, Counter[int]] = {}
-        for c in self._stats.func_calls:
-            if c['caller_func'] not in callgraph:
-                callgraph[c['caller_func']] = Counter()
-            callgraph[c['caller_func']][c['callee_func']] += 1
+        for c, cnt in self._stats.func_calls.items():
+            if c.caller_func not in callgraph:
+                callgraph[c.caller_func] = Counter()
+            callgraph[c.caller_func][c.callee_func] += cnt
 
-            if c['callee_func'] not in rev_callgraph:
-                rev_callgraph[c['callee_func']] = Counter()
-            rev_callgraph[c['callee_func']][c['caller_func']] += 1
+            if c.callee_func not in rev_callgraph:
+                rev_callgraph[c.callee_func] = Counter()
+            rev_callgraph[c.callee_func][c.caller_func] += cnt
 
-            if c['callee_func'] not in rev_callsites:
-                rev_callsites[c['callee_func']] = Counter()
-            rev_callsites[c['callee_func']][c['call_site']] += 1
+            if c.callee_func not in rev_callsites:
+                rev_callsites[c.callee_func] = Counter()
+            rev_callsites[c.callee_func][c.call_site] += cnt
 
         total_leaf_calls = 0
         total_calls_to_funcs_with_one_callsite = 0
@@ -365,20 +621,20 @@ class ExecutionStatAnalyzer:
 
     def _dump_loop_stats(self) -> str:
         loops = self._stats.loops
-        loop_cnt = len(loops)
+        loop_cnt = sum(loops.values())
 
         out = f"Loops: {loop_cnt}\n"
 
         if loop_cnt != 0:
-            loop_len_values = [loop['loop_len'] for loop in loops]
-            loop_len_min = min(loop_len_values)
-            loop_len_max = max(loop_len_values)
-            loop_len_avg = sum(loop_len_values) / loop_cnt
+            loop_len_min = min(loop.loop_len for loop in loops)
+            loop_len_max = max(loop.loop_len for loop in loops)
+            loop_len_avg = sum(loop.loop_len * cnt
+                               for loop, cnt in loops.items()) / loop_cnt
 
-            loop_iterations_values = [loop['iterations'] for loop in loops]
-            loop_iterations_min = min(loop_iterations_values)
-            loop_iterations_max = max(loop_iterations_values)
-            loop_iterations_avg = sum(loop_iterations_values) / loop_cnt
+            loop_iterations_min = min(loop.iterations for loop in loops)
+            loop_iterations_max = max(loop.iterations for loop in loops)
+            loop_iterations_avg = sum(loop.iterations * cnt
+                                      for loop, cnt in loops.items()) / loop_cnt
 
             out += "Loop body length (instructions): "
             out += f"min: {loop_len_min}, max: {loop_len_max}, "
@@ -393,20 +649,53 @@ class ExecutionStatAnalyzer:
     def dump_lcov_coverage(self) -> str:
         if not self._elf_file.has_dwarf_info():
             return ''
-        dwarf_info = self._elf_file.get_dwarf_info()
+        lines = lcov_source_lines(self._elf_file)
+        return format_lcov(lcov_line_hits(lines, self._stats.coverage))
 
-        hits_by_path: defaultdict[str, Dict[int, int]] = defaultdict(dict)
-        for info in _dwarf_iter_file_line(dwarf_info, full_path=True):
-            if info is None:
-                continue
-            hit = self._stats.coverage.get(info.addr, 0)
-            hits_by_path[info.path][info.lineno] = hit
+    def _frame_name(self, frame: Frame) -> str:
+        kind, address = frame
+        name = self._imem_symbol(address) or f"{address:#x}"
+        return name if kind == 'func' else f"loop@{name}"
 
-        out = []
-        for path, hits in hits_by_path.items():
-            out.append(f'SF:{path}')
-            for line, hit in hits.items():
-                out.append(f'DA:{line},{hit}')
-            out.append('end_of_record')
+    def dump_collapsed_stacks(self) -> str:
+        '''Dump cycle counts per stack in the "collapsed stack" format
+
+        This is the format read by flamegraph.pl (and other flame graph
+        tools): one line per stack, with the frames separated by semicolons,
+        followed by a space and the number of cycles spent in that stack.
 
-        return '\n'.join(out) + '\n'
+        '''
+        assert isinstance(self._stats, ProfilingStats)
+
+        lines = []
+        for stack, cycles in self._stats.stack_cycles.items():
+            names = ';'.join(self._frame_name(frame) for frame in stack)
+            lines.append(f"{names} {cycles}")
+
+        return ''.join(line + '\n' for line in sorted(lines))
+
+    def dump_pc_profile(self) -> str:
+        '''Dump a table of the cycles spent at each PC, hottest first'''
+        assert isinstance(self._stats, ProfilingStats)
+        stats = self._stats
+
+        total = sum(stats.pc_cycles.values())
+        if not total:
+            return "No cycles recorded.\n"
+
+        rows = []
+        for pc, cycles in stats.pc_cycles.most_common():
+            insn = stats.program[pc >> 2] if pc >> 2 < len(stats.program) else None
+            rows.append([f"{pc:#x}",
+                         cycles,
+                         f"{cycles / total * 100:.02f}",
+                         stats.pc_stalls[pc],
+                         stats.coverage[pc],
+                         insn.disassemble(pc) if insn is not None else '',
+                         self._describe_imem_addr(pc)])
+
+        return tabulate(rows,
+                        headers=['pc', 'cycles', '%', 'stalls', 'executions',
+                                 'instruction', 'location'],
+                        colalign=('right', 'right', 'right', 'right',
+                                  'right', 'left', 'left')) + '\n'
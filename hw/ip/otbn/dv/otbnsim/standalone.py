@@ -6,8 +6,11 @@
 import argparse
 import os
 import sys
+from time import perf_counter
 
+from sim.coverage_db import CoverageDB
 from sim.load_elf import load_elf
+from sim.sim_profile import SimProfile
 from sim.standalonesim import StandaloneSim
 from sim.stats import ExecutionStatAnalyzer
 from shared.testcase import OtbnTestCase
@@ -44,26 +47,87 @@ def main() -> int:
         help=("after execution, write execution statistics to this file. "
               "Use '-' to write to STDOUT.")
     )
+    parser.add_argument(
+        '--profile-stacks',
+        metavar="FILE",
+        type=argparse.FileType('w'),
+        help=("after execution, write the number of cycles spent in each "
+              "stack of functions and loops to this file, in the collapsed "
+              "stack format used by flamegraph.pl. Use '-' to write to "
+              "STDOUT.")
+    )
+    parser.add_argument(
+        '--profile-pcs',
+        metavar="FILE",
+        type=argparse.FileType('w'),
+        help=("after execution, write a table of the number of cycles spent "
+              "at each PC, hottest first, to this file. Use '-' to write to "
+              "STDOUT.")
+    )
+    parser.add_argument(
+        '--sim-profile',
+        metavar="FILE",
+        type=argparse.FileType('w'),
+        help=("after execution, write a report of the wall-clock time that "
+              "the simulator spent in each phase of simulation (loading the "
+              "ELF, executing each kind of instruction, committing state, "
+              "stepping KMAC and so on) to this file. Use '-' to write to "
+              "STDOUT.")
+    )
+    parser.add_argument(
+        '--no-blocks',
+        action='store_true',
+        help=("step the simulation one cycle at a time, rather than running "
+              "straight-line basic blocks in one go and skipping idle "
+              "cycles. This is slower but might help when debugging the "
+              "simulator.")
+    )
+    parser.add_argument(
+        '--coverage-db',
+        metavar="FILE",
+        help=("after execution, add the number of times each instruction "
+              "ran to the coverage database in this file (creating it if "
+              "necessary). Many runs, including concurrent ones, can share "
+              "a database. Use coverage_report.py to turn it into an lcov "
+              "report.")
+    )
+    parser.add_argument(
+        '--cache-dir',
+        metavar="DIR",
+        help=("cache data derived from the ELF file (the decoded program "
+              "and the address to source line table used for execution "
+              "statistics) in this directory, keyed by a hash of the file.")
+    )
 
     args = parser.parse_args()
 
-    collect_stats = args.dump_stats is not None
+    collect_stats = (args.dump_stats is not None or
+                     args.coverage_db is not None)
+    profile = (args.profile_stacks is not None or
+               args.profile_pcs is not None)
 
     # Check if Bazel is requesting coverage output
     coverage_dat = os.environ.get('COVERAGE_OUTPUT_FILE', None)
     if coverage_dat:
         collect_stats = True
 
-    sim = StandaloneSim()
-    exp_end_addr = load_elf(sim, args.elf)
+    # Nothing reads the per-cycle list of architectural changes in a
+    # standalone run (the verbose trace collects them anyway), so don't
+    # bother building it.
+    sim = StandaloneSim(tracing=False, use_blocks=not args.no_blocks)
+    if args.sim_profile is not None:
+        sim.sim_profile = SimProfile()
+
+    load_start = perf_counter()
+    exp_end_addr = load_elf(sim, args.elf, args.cache_dir)
+    if sim.sim_profile is not None:
+        sim.sim_profile.add('load_elf', load_start)
 
     testcase = None
     if args.testcase:
         testcase = OtbnTestCase.from_hjson(args.testcase.read(), sim.symbols)
 
-    key0 = int((str("deadbeef") * 12), 16)
-    key1 = int((str("baadf00d") * 12), 16)
-    sim.state.wsrs.set_sideload_keys(key0, key1)
+    sim.load_test_sideload_keys()
 
     if testcase:
         sim.load_dmem_vars(testcase.input.dmem)
@@ -71,7 +135,7 @@ def main() -> int:
 
     sim.state.ext_regs.commit()
 
-    sim.start(collect_stats)
+    sim.start(collect_stats, profile)
 
     if testcase and testcase.entrypoint:
         sim.state.pc = testcase.entrypoint
@@ -88,11 +152,24 @@ def main() -> int:
     if args.dump_dmem is not None:
         args.dump_dmem.write(sim.dump_data())
 
-    if collect_stats:
+    if sim.sim_profile is not None:
+        args.sim_profile.write(sim.sim_profile.dump())
+
+    if args.coverage_db is not None:
+        assert sim.stats is not None
+        with CoverageDB(args.coverage_db) as coverage_db:
+            coverage_db.add_run(args.elf, sim.stats.coverage)
+
+    if args.dump_stats or profile or coverage_dat:
         assert sim.stats is not None
-        stat_analyzer = ExecutionStatAnalyzer(sim.stats, args.elf)
+        stat_analyzer = ExecutionStatAnalyzer(sim.stats, args.elf,
+                                              args.cache_dir)
         if args.dump_stats:
             args.dump_stats.write(stat_analyzer.dump())
+        if args.profile_stacks:
+            args.profile_stacks.write(stat_analyzer.dump_collapsed_stacks())
+        if args.profile_pcs:
+            args.profile_pcs.write(stat_analyzer.dump_pc_profile())
         if coverage_dat:
             with open(coverage_dat, 'w') as f:
                 f.write(stat_analyzer.dump_lcov_coverage())
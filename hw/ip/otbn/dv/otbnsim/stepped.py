@@ -14,8 +14,28 @@ prefixed with "0x" if they are hexadecimal.
 
     start_operation         Start an execution or DMEM/IMEM secure wipe
 
-    step                    Run one instruction. Print trace information to
-                            stdout.
+    step [<n>]              Run one cycle. Print trace information to
+                            stdout. If <n> is given, run up to <n> cycles,
+                            printing the trace for each cycle in turn and
+                            then "STEPPED <count>" with the number of cycles
+                            that actually ran. This stops early after a cycle
+                            that needs attention from the environment: one
+                            where a mirrored external register (see
+                            _MIRRORED_EXT_REGS) other than INSN_CNT changes
+                            or where the model starts waiting for URND seed
+                            data.
+
+    run_until <event> [<max_cycles>]
+
+                            Run without generating a trace until <event>
+                            happens or <max_cycles> cycles (default: one
+                            million) have run. <event> is "done" (the current
+                            operation finishes) or "attention" (the same
+                            stopping rule as "step <n>"). Prints
+                            "RUN_UNTIL <count> <reason>", where reason is the
+                            event or "max_cycles", followed by a trace line
+                            for each mirrored external register that has a
+                            different value from when the command started.
 
     load_elf <path>         Load the ELF file at <path>, replacing current
                             contents of DMEM and IMEM.
@@ -35,9 +55,13 @@ prefixed with "0x" if they are hexadecimal.
                             (read as an array of 32-bit little-endian words)
 
     dump_d <path>           Write the current contents of DMEM to <path> (same
-                            format as for load).
+                            format as for load). If <path> is "-", write it
+                            to stdout with binary framing (see below).
 
-    print_regs              Write the hex contents of all registers to stdout
+    print_regs [binary]     Write the hex contents of all registers to stdout.
+                            With "binary", write the 32 GPRs as 32-bit words
+                            then the 32 WDRs as 256-bit words, all
+                            little-endian, with binary framing.
 
     edn_rnd_step            Send 32b RND Data to the model.
 
@@ -74,15 +98,108 @@ prefixed with "0x" if they are hexadecimal.
                             stall request is ignored except if it is enforced.
 
     set_software_errs_fatal Set software_errs_fatal bit.
+
+    save_snapshot <name>    Save the current state of the simulation with the
+                            given name. This fails if a multi-cycle
+                            instruction is part-way through.
+
+    restore_snapshot <name> Restore the simulation to the state saved with
+                            the given name. A snapshot can be restored any
+                            number of times.
+
+    sim_profile <action>    Profile the simulator itself. <action> is
+                            "start" (start timing each phase of simulation,
+                            clearing any previous timings), "stop" (stop
+                            timing and discard the timings) or "print"
+                            (write a report of the time spent in each phase
+                            and executing each kind of instruction to
+                            stdout).
+
+Commands that use binary framing print a line "BINARY <len>", followed by
+exactly <len> bytes of raw data and then the usual end-of-command line.
+
+If the OTBN_SIM_CACHE_DIR environment variable is set, load_elf keeps decoded
+ELF files in that directory, keyed by a hash of their contents. This makes
+loading the same binary in another process much faster.
+
+If the OTBN_SIM_COVERAGE_DB environment variable is set, the number of times
+each instruction ran in each execution of a program loaded with load_elf is
+added to the coverage database in that file (see sim/coverage_db.py).
 '''
 
 import binascii
+import os
 import sys
-from typing import List, Optional
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
 
+from sim.coverage_db import CoverageDB
 from sim.decode import decode_file
 from sim.load_elf import load_elf
-from sim.sim import OTBNSim
+from sim.ext_regs import TraceExtRegChange
+from sim.sim import OTBNSim, SimSnapshot
+from sim.sim_profile import SimProfile
+from sim.state import FsmState
+from shared.disk_cache import file_digest
+
+# Snapshots saved with save_snapshot, keyed by name
+_SNAPSHOTS: Dict[str, SimSnapshot] = {}
+
+# Directory for decoded ELF files (see the docstring above)
+_CACHE_DIR = os.environ.get('OTBN_SIM_CACHE_DIR')
+
+
+class _CoverageRecorder:
+    '''Add the coverage of each execution to a CoverageDB'''
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+        self._db: Optional[CoverageDB] = None
+
+        # The path and hash of the ELF file that was loaded into IMEM, or
+        # None if the IMEM contents didn't come from an ELF file.
+        self._elf: Optional[Tuple[str, str]] = None
+
+    def set_elf(self, path: Optional[str]) -> None:
+        self._elf = (path, file_digest(path)) if path is not None else None
+
+    def wants_stats(self) -> bool:
+        '''Should the next execution collect statistics?'''
+        return self._elf is not None
+
+    def record(self, sim: OTBNSim) -> None:
+        '''Add the coverage of the current execution if it has finished
+
+        This is called after stepping. The environment might kill us without
+        warning once the operation is done, so we can't wait until exit.
+
+        '''
+        if sim.stats is None or sim.state.get_fsm_state() not in [
+                FsmState.IDLE, FsmState.LOCKED]:
+            return
+
+        stats = sim.stats
+        sim.stats = None
+        if self._elf is None:
+            return
+
+        if self._db is None:
+            self._db = CoverageDB(self.db_path)
+        path, digest = self._elf
+        self._db.add_run(path, stats.coverage, digest)
+
+
+_COVERAGE_DB = os.environ.get('OTBN_SIM_COVERAGE_DB')
+_COVERAGE = (_CoverageRecorder(_COVERAGE_DB)
+             if _COVERAGE_DB is not None else None)
+
+# The external registers that are mirrored by the environment (ISSWrapper in
+# iss_wrapper.cc). A change to any of these except INSN_CNT (which changes on
+# every instruction) stops "step <n>" and "run_until attention".
+_MIRRORED_EXT_REGS = ['STATUS', 'INSN_CNT', 'ERR_BITS', 'STOP_PC',
+                      'RND_REQ', 'WIPE_START']
+
+# The default cycle limit for run_until
+_RUN_UNTIL_MAX_CYCLES = 1000000
 
 
 def read_word(arg_name: str, word_data: str, bits: int) -> int:
@@ -101,6 +218,14 @@ def read_word(arg_name: str, word_data: str, bits: int) -> int:
     return value
 
 
+def write_binary(data: bytes) -> None:
+    '''Write data to stdout with binary framing'''
+    print('BINARY {}'.format(len(data)))
+    sys.stdout.flush()
+    sys.stdout.buffer.write(data)
+    sys.stdout.buffer.flush()
+
+
 def end_command() -> None:
     '''Print a single '.' to stdout and flush, ending the output for command'''
     print('.')
@@ -125,7 +250,8 @@ def on_start_operation(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
 
     if command == 'Execute':
         print('START')
-        sim.start(collect_stats=False)
+        sim.start(collect_stats=(_COVERAGE is not None and
+                                 _COVERAGE.wants_stats()))
     elif command == 'DmemWipe':
         sim.start_mem_wipe(False)
     elif command == 'ImemWipe':
@@ -136,17 +262,24 @@ def on_start_operation(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
     return None
 
 
-def on_step(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
-    '''Step one instruction'''
-    check_arg_count('step', 0, args)
+def _step_cycle(sim: OTBNSim) -> Tuple[List[str], bool]:
+    '''Step one cycle
 
+    Returns the lines of trace for the cycle and a flag that is true if the
+    cycle needs attention from the environment (see "step <n>" above).
+
+    '''
     pc = sim.state.pc
     assert 0 == pc & 3
 
     was_wiping = sim.state.wiping()
+    was_requesting_urnd = sim.state.urnd_requesting()
 
     insn, changes = sim.step(verbose=False)
 
+    # Time spent turning the changes into RTL trace lines
+    trace_start = perf_counter()
+
     if insn is not None:
         hdr = insn.rtl_trace(pc)  # type: Optional[str]
     elif was_wiping:
@@ -163,11 +296,16 @@ def on_step(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
     if sim.state.lock_immediately and hdr in ['V ', 'STALL']:
         hdr = None
 
+    attention = sim.state.urnd_requesting() and not was_requesting_urnd
+
     rtl_changes = []
     for c in changes:
         rt = c.rtl_trace()
         if rt is not None:
             rtl_changes.append(rt)
+        if (isinstance(c, TraceExtRegChange) and
+                c.name != 'INSN_CNT' and c.name in _MIRRORED_EXT_REGS):
+            attention = True
 
     # This is a bit of a hack. Very occasionally, we'll see traced changes when
     # there's not actually an instruction in flight. For example, this happens
@@ -178,10 +316,106 @@ def on_step(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
     if hdr is None and rtl_changes:
         hdr = 'STALL'
 
-    if hdr is not None:
-        print(hdr)
-        for rt in rtl_changes:
-            print(rt)
+    if sim.sim_profile is not None:
+        sim.sim_profile.add('trace', trace_start)
+
+    if hdr is None:
+        return ([], attention)
+
+    return ([hdr] + rtl_changes, attention)
+
+
+def on_step(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
+    '''Step one cycle, or up to N cycles'''
+    if len(args) > 1:
+        raise ValueError(f'step expects at most one argument. Got {args}.')
+
+    if not args:
+        lines, _ = _step_cycle(sim)
+        if lines:
+            print('\n'.join(lines))
+        if _COVERAGE is not None:
+            _COVERAGE.record(sim)
+        return None
+
+    max_cycles = read_word('n', args[0], 32)
+
+    # Collect the trace for all the cycles and print it in one go at the end.
+    lines = []
+    count = 0
+    while count < max_cycles:
+        cycle_lines, attention = _step_cycle(sim)
+        lines += cycle_lines
+        count += 1
+        if attention:
+            break
+
+    lines.append('STEPPED {}'.format(count))
+    print('\n'.join(lines))
+    if _COVERAGE is not None:
+        _COVERAGE.record(sim)
+    return None
+
+
+def _read_mirrored_regs(sim: OTBNSim) -> List[int]:
+    return [sim.state.ext_regs.read(name, True)
+            for name in _MIRRORED_EXT_REGS]
+
+
+def on_run_until(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
+    '''Run without tracing until an event happens'''
+    if not 1 <= len(args) <= 2:
+        raise ValueError('run_until expects one or two arguments. '
+                         f'Got {args}.')
+
+    event = args[0]
+    if event not in ['done', 'attention']:
+        raise ValueError(f'Unknown event for run_until: {event!r}.')
+
+    max_cycles = (read_word('max_cycles', args[1], 32)
+                  if len(args) > 1 else _RUN_UNTIL_MAX_CYCLES)
+
+    start_vals = _read_mirrored_regs(sim)
+    last_vals = start_vals
+
+    # Nothing looks at the trace for these cycles, so don't generate it.
+    was_tracing = sim.tracing
+    sim.tracing = False
+
+    reason = 'max_cycles'
+    count = 0
+    try:
+        while count < max_cycles:
+            was_requesting_urnd = sim.state.urnd_requesting()
+            sim.step(verbose=False)
+            count += 1
+
+            if event == 'done':
+                if sim.state.get_fsm_state() in [FsmState.IDLE,
+                                                 FsmState.LOCKED]:
+                    reason = event
+                    break
+            else:
+                if sim.state.urnd_requesting() and not was_requesting_urnd:
+                    reason = event
+                    break
+                vals = _read_mirrored_regs(sim)
+                # Ignore INSN_CNT (the second entry)
+                if vals[:1] + vals[2:] != last_vals[:1] + last_vals[2:]:
+                    reason = event
+                    break
+                last_vals = vals
+    finally:
+        sim.tracing = was_tracing
+
+    if _COVERAGE is not None:
+        _COVERAGE.record(sim)
+
+    print('RUN_UNTIL {} {}'.format(count, reason))
+    end_vals = _read_mirrored_regs(sim)
+    for name, start, end in zip(_MIRRORED_EXT_REGS, start_vals, end_vals):
+        if start != end:
+            print('! otbn.{}: {:#010x}'.format(name, end))
 
     return None
 
@@ -193,7 +427,12 @@ def on_load_elf(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
     path = args[0]
 
     print('LOAD_ELF {!r}'.format(path))
-    load_elf(sim, path)
+    load_start = perf_counter()
+    load_elf(sim, path, _CACHE_DIR)
+    if sim.sim_profile is not None:
+        sim.sim_profile.add('load_elf', load_start)
+    if _COVERAGE is not None:
+        _COVERAGE.set_elf(path)
 
     return None
 
@@ -252,6 +491,8 @@ def on_load_i(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
 
     print('LOAD_I {!r}'.format(path))
     sim.load_program(decode_file(0, path))
+    if _COVERAGE is not None:
+        _COVERAGE.set_elf(None)
 
     return None
 
@@ -264,6 +505,10 @@ def on_dump_d(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
 
     print('DUMP_D {!r}'.format(path))
 
+    if path == '-':
+        write_binary(sim.state.dmem.dump_le_words())
+        return None
+
     with open(path, 'wb') as handle:
         handle.write(sim.state.dmem.dump_le_words())
 
@@ -272,9 +517,19 @@ def on_dump_d(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
 
 def on_print_regs(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
     '''Print registers to stdout'''
-    check_arg_count('print_regs', 0, args)
+    if args not in [[], ['binary']]:
+        raise ValueError('print_regs expects no arguments or "binary". '
+                         f'Got {args}.')
 
     print('PRINT_REGS')
+    if args:
+        data = b''.join(value.to_bytes(4, 'little')
+                        for value in sim.state.gprs.peek_unsigned_values())
+        data += b''.join(value.to_bytes(32, 'little')
+                         for value in sim.state.wdrs.peek_unsigned_values())
+        write_binary(data)
+        return None
+
     for idx, value in enumerate(sim.state.gprs.peek_unsigned_values()):
         print(' x{:<2} = 0x{:08x}'.format(idx, value))
     for idx, value in enumerate(sim.state.wdrs.peek_unsigned_values()):
@@ -296,7 +551,12 @@ def on_print_call_stack(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
 
 def on_reset(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
     check_arg_count('reset', 0, args)
-    return OTBNSim()
+    new_sim = OTBNSim()
+    # Keep profiling the simulator across a reset
+    new_sim.sim_profile = sim.sim_profile
+    if _COVERAGE is not None:
+        _COVERAGE.set_elf(None)
+    return new_sim
 
 
 def on_edn_rnd_step(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
@@ -414,10 +674,45 @@ def on_otp_cdc_done(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
     return None
 
 
+def on_save_snapshot(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
+    check_arg_count('save_snapshot', 1, args)
+    _SNAPSHOTS[args[0]] = sim.snapshot()
+    return None
+
+
+def on_restore_snapshot(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
+    check_arg_count('restore_snapshot', 1, args)
+    snapshot = _SNAPSHOTS.get(args[0])
+    if snapshot is None:
+        raise ValueError(f'No snapshot called {args[0]!r}.')
+    sim.restore(snapshot)
+    return None
+
+
+def on_sim_profile(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
+    check_arg_count('sim_profile', 1, args)
+    action = args[0]
+
+    if action == 'start':
+        sim.sim_profile = SimProfile()
+    elif action == 'stop':
+        sim.sim_profile = None
+    elif action == 'print':
+        if sim.sim_profile is None:
+            raise ValueError('The simulator is not being profiled.')
+        print('SIM_PROFILE')
+        print(sim.sim_profile.dump(), end='')
+    else:
+        raise ValueError(f'Invalid action for sim_profile: {action!r}.')
+
+    return None
+
+
 _HANDLERS = {
     'start_operation': on_start_operation,
     'otp_key_cdc_done': on_otp_cdc_done,
     'step': on_step,
+    'run_until': on_run_until,
     'load_elf': on_load_elf,
     'add_loop_warp': on_add_loop_warp,
     'clear_loop_warps': on_clear_loop_warps,
@@ -440,7 +735,10 @@ _HANDLERS = {
     'send_stall_request': on_send_stall_request,
     'set_rma_req': on_set_rma_req,
     'initial_secure_wipe': on_initial_secure_wipe,
-    'set_software_errs_fatal': on_set_software_errs_fatal
+    'set_software_errs_fatal': on_set_software_errs_fatal,
+    'save_snapshot': on_save_snapshot,
+    'restore_snapshot': on_restore_snapshot,
+    'sim_profile': on_sim_profile
 }
 
 
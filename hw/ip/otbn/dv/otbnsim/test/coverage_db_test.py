@@ -0,0 +1,63 @@
+# Copyright lowRISC contributors (OpenTitan project).
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import tempfile
+from collections import Counter
+
+import py
+
+from sim.coverage_db import CoverageDB
+from sim.load_elf import load_elf
+from sim.standalonesim import StandaloneSim
+from shared.disk_cache import file_digest
+import testutil
+
+_ASM = """
+  addi x2, x0, 3
+  loop x2, 1
+    addi x3, x3, 1
+  ecall
+"""
+
+
+def _run_for_coverage(elf_path: str) -> Counter[int]:
+    sim = StandaloneSim()
+    load_elf(sim, elf_path)
+    sim.state.ext_regs.commit()
+    sim.start(collect_stats=True)
+    sim.run(verbose=False, dump_file=None)
+    assert sim.stats is not None
+    return sim.stats.coverage
+
+
+def test_merge_runs(tmpdir: py.path.local) -> None:
+    '''Check that coverage from several runs and connections is summed.'''
+
+    with tempfile.NamedTemporaryFile('w', dir=tmpdir) as fp:
+        fp.write(_ASM)
+        fp.flush()
+        elf_path = testutil.asm_and_link_one_file(fp.name, tmpdir)
+
+    # The loop instruction at PC 4 runs once and its body at PC 8 runs three
+    # times.
+    coverage = _run_for_coverage(elf_path)
+    assert coverage[4] == 1
+    assert coverage[8] == 3
+
+    db_path = os.path.join(tmpdir, 'coverage.db')
+    with CoverageDB(db_path) as db:
+        db.add_run(elf_path, coverage)
+
+    # Runs from other processes open the database again. Use two
+    # connections at once, which is what concurrent runs look like.
+    with CoverageDB(db_path) as db0, CoverageDB(db_path) as db1:
+        db0.add_run(elf_path, coverage)
+        db1.add_run(elf_path, coverage)
+
+    with CoverageDB(db_path) as db:
+        digest = file_digest(elf_path)
+        assert db.get_runs() == {digest: 3}
+        assert db.get_hits(digest) == {pc: 3 * count
+                                       for pc, count in coverage.items()}
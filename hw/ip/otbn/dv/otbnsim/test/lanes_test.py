@@ -0,0 +1,54 @@
+# Copyright lowRISC contributors (OpenTitan project).
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+import random
+from typing import List
+
+import pytest
+
+from sim.lanes import LANE_FORMATS
+from vec_benchmark import VECTOR_OPS, Inputs, VecOp, random_inputs
+
+
+def _edge_inputs() -> List[Inputs]:
+    '''Inputs with all-zero, all-one and top-bit-only lanes'''
+    ret = []
+    patterns = [0, (1 << 256) - 1]
+    for size in [32, 64, 128]:
+        patterns.append(LANE_FORMATS[size].top_bits)
+        patterns.append(LANE_FORMATS[size].low_bits)
+    # The moduli are in the bottom 32 bits, with mu above them.
+    mods = [0, 1, 0xffffffff, (0xffffffff << 32) | 0x7fe001, 8380417]
+    for vec_a in patterns:
+        for vec_b in patterns:
+            for mod in mods:
+                for imm in [0, 0xffffffff]:
+                    ret.append((vec_a, vec_b, mod, imm))
+    return ret
+
+
+@pytest.mark.parametrize('op', VECTOR_OPS,
+                         ids=['{}-{}'.format(op.name, op.size)
+                              for op in VECTOR_OPS])
+def test_lanes_match_reference(op: VecOp) -> None:
+    '''Check each lane operation against the per-element version'''
+    rng = random.Random(op.name)
+    inputs = _edge_inputs() + [random_inputs(rng) for _ in range(2000)]
+    for vec_a, vec_b, mod, imm in inputs:
+        expected = op.ref(vec_a, vec_b, mod, imm)
+        assert op.fast(vec_a, vec_b, mod, imm) == expected, \
+            (vec_a, vec_b, mod, imm)
+
+
+@pytest.mark.parametrize('size', [32, 64, 128])
+def test_pack_unpack(size: int) -> None:
+    '''LaneFormat.unpack and pack should be inverses'''
+    fmt = LANE_FORMATS[size]
+    rng = random.Random(size)
+    for _ in range(100):
+        vec = rng.getrandbits(256)
+        lanes = fmt.unpack(vec)
+        assert len(lanes) == fmt.count
+        assert lanes[1] == (vec >> size) & fmt.lane_mask
+        assert fmt.pack(lanes) == vec
@@ -0,0 +1,34 @@
+# Copyright lowRISC contributors (OpenTitan project).
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import subprocess
+import sys
+from typing import List
+
+import pytest
+
+from testutil import SIM_DIR
+
+
+@pytest.mark.parametrize('script, args', [
+    ('batch.py', ['--help']),
+    ('coverage_report.py', ['--help']),
+    ('server.py', ['--help']),
+    ('standalone.py', ['--help']),
+    ('stepped.py', []),
+    ('testgen_batch.py', ['--help']),
+])
+def test_run_directly(script: str, args: List[str]) -> None:
+    '''Check that each script can be run on its own.
+
+    The scripts get run without PYTHONPATH (which is how iss_wrapper.cc runs
+    stepped.py), so this checks that they manage to import everything they
+    need. stepped.py has no --help, but exits on an empty input.
+
+    '''
+    env = dict(os.environ)
+    env.pop('PYTHONPATH', None)
+    subprocess.run([sys.executable, os.path.join(SIM_DIR, script)] + args,
+                   input=b'', stdout=subprocess.DEVNULL, env=env, check=True)
@@ -0,0 +1,137 @@
+# Copyright lowRISC contributors (OpenTitan project).
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+import io
+import struct
+import threading
+from typing import Dict, Iterator, List
+
+import py
+import pytest
+
+from client import OTBNClient, OTBNServerError
+from server import SimServer
+from sim.load_elf import load_elf
+from sim.standalonesim import StandaloneSim
+import testutil
+
+_ASM = """
+  /* Sum the first x3 words of buf into x4 and store the result after them. */
+  la x2, buf
+  addi x4, x0, 0
+  loop x3, 3
+    lw x5, 0(x2)
+    add x4, x4, x5
+    addi x2, x2, 4
+  sw x4, 0(x2)
+  ecall
+
+.data
+.balign 4
+buf:
+  .zero 64
+"""
+
+
+@pytest.fixture(params=[1, 2], ids=['in-process', 'pool'])
+def server(request: pytest.FixtureRequest,
+           tmpdir: py.path.local) -> Iterator[SimServer]:
+    '''Run a SimServer in a thread, with or without a worker pool'''
+    server = SimServer(str(tmpdir.join('otbn.sock')), request.param)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+def _build_elf(tmpdir: py.path.local) -> str:
+    asm_path = str(tmpdir.join('sum.s'))
+    with open(asm_path, 'w') as asm_file:
+        asm_file.write(_ASM)
+    return testutil.asm_and_link_one_file(asm_path, tmpdir)
+
+
+def _sum_dmem(words: List[int]) -> bytes:
+    return struct.pack('<{}I'.format(len(words)), *words)
+
+
+def test_matches_standalone(server: SimServer, tmpdir: py.path.local) -> None:
+    '''A run on the server should match one in StandaloneSim'''
+    elf_path = _build_elf(tmpdir)
+
+    sim = StandaloneSim()
+    load_elf(sim, elf_path)
+    sim.load_test_sideload_keys()
+    sim.state.dmem.load_le_words(_sum_dmem([1, 2, 3]), False,
+                                 sim.symbols['buf'] // 4)
+    sim.load_regs_vars({'x3': 3})
+    sim.state.ext_regs.commit()
+    sim.start(collect_stats=False)
+    exp_regs = io.StringIO()
+    exp_cycles = sim.run(verbose=False, dump_file=exp_regs)
+
+    with OTBNClient(server.socket_path) as client:
+        client.load_elf(elf_path)
+        client.load_dmem(_sum_dmem([1, 2, 3]), at='buf')
+        client.set_regs({'x3': 3})
+        result = client.run()
+
+        assert result.cycles == exp_cycles
+        assert result.err_bits == 0
+        assert result.end_addr_ok
+        assert client.dump_regs() == exp_regs.getvalue()
+        assert client.dump_dmem() == sim.dump_data()
+
+
+def test_concurrent_clients(server: SimServer,
+                            tmpdir: py.path.local) -> None:
+    '''Several clients should be able to use the server at once'''
+    elf_path = _build_elf(tmpdir)
+    sums: Dict[int, bytes] = {}
+
+    def run_client(idx: int) -> None:
+        with OTBNClient(server.socket_path) as client:
+            client.load_elf(elf_path)
+            client.load_dmem(_sum_dmem([idx] * 4), at='buf')
+            client.set_regs({'x3': 4})
+            for _ in range(3):
+                assert client.run().err_bits == 0
+            sums[idx] = client.dump_dmem()
+
+    threads = [threading.Thread(target=run_client, args=(idx,))
+               for idx in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Each client's result should only depend on its own inputs.
+    assert len(sums) == 4
+    assert len(set(sums.values())) == 4
+
+
+def test_errors(server: SimServer, tmpdir: py.path.local) -> None:
+    '''Bad requests should fail without breaking the session'''
+    elf_path = _build_elf(tmpdir)
+
+    with OTBNClient(server.socket_path) as client:
+        with pytest.raises(OTBNServerError):
+            client.run()
+        with pytest.raises(OTBNServerError):
+            client.load_elf(str(tmpdir.join('no-such-file')))
+
+        client.load_elf(elf_path)
+        client.load_dmem(b'\x00' * 4, at='no_such_symbol')
+        with pytest.raises(OTBNServerError):
+            client.run()
+
+        # Loading the ELF again drops the bad DMEM input, after which a run
+        # should work. The registers get cleared too, so set the loop count.
+        client.load_elf(elf_path)
+        client.set_regs({'x3': 3})
+        result = client.run()
+        assert result.err_bits == 0
+        assert result.end_addr_ok
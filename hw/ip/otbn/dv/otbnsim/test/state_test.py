@@ -4,9 +4,13 @@
 
 '''Test the implementation of OTBNState.'''
 
+import io
+from typing import Tuple
+
 import py
 
 from sim.constants import ErrBits, Status
+from sim.standalonesim import StandaloneSim
 from testutil import prepare_sim_for_asm_str
 
 
@@ -48,3 +52,113 @@ def test_ext_regs_err_bits_bad(tmpdir: py.path.local) -> None:
     assert sim.state.ext_regs.read('ERR_BITS', False) == ErrBits.BAD_INSN_ADDR
 
     assert sim.state.ext_regs.read('FATAL_ALERT_CAUSE', False) == 0
+
+
+def test_snapshot_restore(tmpdir: py.path.local) -> None:
+    '''Check that a run forked from a snapshot matches an unbroken run.'''
+
+    asm = """
+    addi x2, x0, 5
+    addi x3, x0, 0
+    addi x5, x0, 1
+    bn.xor w1, w1, w1
+    loop x2, 3
+      addi x3, x3, 7
+      bn.addi w1, w1, 3
+      bn.sid x5, 0(x0)
+    fork_point:
+    add x4, x3, x2
+    bn.lid x0, 0(x0)
+    ecall
+    """
+
+    def dump(sim: StandaloneSim) -> Tuple[int, str, bytes]:
+        regs = io.StringIO()
+        cycles = sim.run(verbose=False, dump_file=regs)
+        return (cycles, regs.getvalue(), sim.dump_data())
+
+    sim = prepare_sim_for_asm_str(asm, tmpdir, False)
+    ref_cycles, ref_regs, ref_dmem = dump(sim)
+
+    sim = prepare_sim_for_asm_str(asm, tmpdir, False)
+    fork_point = sim.symbols['fork_point']
+    prefix_cycles = sim.run(verbose=False, dump_file=None, stop_pc=fork_point)
+    assert sim.state.pc == fork_point
+    snapshot = sim.snapshot()
+
+    # Run to the end from the snapshot twice. Both runs should match the
+    # unbroken run.
+    for _ in range(2):
+        sim.restore(snapshot)
+        cycles, regs, dmem = dump(sim)
+        assert prefix_cycles + cycles == ref_cycles
+        assert regs == ref_regs
+        assert dmem == ref_dmem
+
+    # A change to the state after restoring shouldn't affect the snapshot
+    sim.restore(snapshot)
+    sim.state.gprs.get_reg(3).write_unsigned(1)
+    sim.state.gprs.commit()
+    _, regs, _ = dump(sim)
+    assert regs != ref_regs
+
+    sim.restore(snapshot)
+    _, regs, _ = dump(sim)
+    assert regs == ref_regs
+
+
+def test_skip_idle_cycles(tmpdir: py.path.local) -> None:
+    '''Check that skipping quiet wipe cycles doesn't change a run.'''
+
+    asm = """
+    addi x2, x0, 3
+    loopi 4, 1
+      add x3, x3, x2
+    ecall
+    """
+
+    results = []
+    for fast in [False, True]:
+        sim = prepare_sim_for_asm_str(asm, tmpdir, False)
+        sim.use_blocks = fast
+        regs = io.StringIO()
+        cycles = sim.run(verbose=False, dump_file=regs)
+        results.append((cycles,
+                        regs.getvalue(),
+                        sim.state.ext_regs.read('STATUS', False),
+                        sim.state.cycles_in_this_state))
+
+    assert results[0] == results[1]
+
+
+def test_blocks_with_rnd_prefetch(tmpdir: py.path.local) -> None:
+    '''Check that running blocks doesn't change the RND values we read.
+
+    After a prefetch, StandaloneSim answers the RND request on every cycle
+    until the value gets used, so a block running while the request is
+    pending would change which value a later RND read sees.
+
+    '''
+
+    asm = """
+    csrrw x0, rnd_prefetch, x0
+    .rept 32
+      addi x3, x3, 1
+    .endr
+    bn.wsrr w1, RND
+    .rept 32
+      addi x3, x3, 1
+    .endr
+    bn.wsrr w2, RND
+    ecall
+    """
+
+    results = []
+    for fast in [False, True]:
+        sim = prepare_sim_for_asm_str(asm, tmpdir, False)
+        sim.use_blocks = fast
+        regs = io.StringIO()
+        cycles = sim.run(verbose=False, dump_file=regs)
+        results.append((cycles, regs.getvalue()))
+
+    assert results[0] == results[1]
@@ -4,9 +4,11 @@
 
 import py
 import os
+import pytest
 
+from sim.sim_profile import SimProfile
 from sim.standalonesim import StandaloneSim
-from sim.stats import ExecutionStats
+from sim.stats import ExecutionStats, FuncCall, LoopEntry, ProfilingStats
 import testutil
 
 
@@ -140,19 +142,16 @@ def test_general_and_loop(tmpdir: py.path.local) -> None:
     assert stats.stall_count == 4
     assert stats.get_insn_count() == 28
     assert stats.insn_histo == {'addi': 22, 'loop': 4, 'loopi': 1, 'ecall': 1}
-    assert stats.func_calls == []
+    assert not stats.func_calls
 
     # Loop statistics.
-    exp = [
+    exp = {
         # Outer LOOPI
-        {'iterations': 4, 'loop_addr': 8, 'loop_len': 4},
+        LoopEntry(iterations=4, loop_addr=8, loop_len=4): 1,
 
         # Inner LOOP
-        {'iterations': 3, 'loop_addr': 16, 'loop_len': 1},
-        {'iterations': 3, 'loop_addr': 16, 'loop_len': 1},
-        {'iterations': 3, 'loop_addr': 16, 'loop_len': 1},
-        {'iterations': 3, 'loop_addr': 16, 'loop_len': 1}
-    ]
+        LoopEntry(iterations=3, loop_addr=16, loop_len=1): 4
+    }
     assert stats.loops == exp
 
 
@@ -163,7 +162,7 @@ def test_func_call_direct(tmpdir: py.path.local) -> None:
                             'simple', 'subroutines', 'direct-call.s')
     stats = _simulate_asm_file(asm_file, tmpdir)
 
-    exp = [{'call_site': 4, 'callee_func': 12, 'caller_func': 0}]
+    exp = {FuncCall(call_site=4, callee_func=12, caller_func=0): 1}
     assert stats.func_calls == exp
 
 
@@ -174,5 +173,71 @@ def test_func_call_indirect(tmpdir: py.path.local) -> None:
                             'simple', 'subroutines', 'indirect-call.s')
     stats = _simulate_asm_file(asm_file, tmpdir)
 
-    exp = [{'call_site': 8, 'callee_func': 16, 'caller_func': 0}]
+    exp = {FuncCall(call_site=8, callee_func=16, caller_func=0): 1}
     assert stats.func_calls == exp
+
+
+def test_profile(tmpdir: py.path.local) -> None:
+    '''Check that the profiler attributes every cycle to a stack and PC.'''
+
+    asm = """
+    /* Call func three times from a loop. */
+    addi x2, x0, 3
+    loop x2, 2
+      jal x1, func
+      addi x3, x3, 1
+    ecall
+
+    func:
+      loopi 2, 1
+        addi x4, x4, 1
+      jalr x0, x1, 0
+    """
+
+    sim = testutil.prepare_sim_for_asm_str(asm, tmpdir, False)
+    sim.start(False, profile=True)
+    stats = _run_sim_for_stats(sim)
+    assert isinstance(stats, ProfilingStats)
+
+    total = stats.get_insn_count() + stats.stall_count
+    assert sum(stats.stack_cycles.values()) == total
+    assert sum(stats.pc_cycles.values()) == total
+    assert sum(stats.pc_stalls.values()) == stats.stall_count
+
+    func = sim.symbols['func']
+    outer = (('func', 0), ('loop', 4))
+    inner = outer + (('func', func), ('loop', func))
+
+    # The ADDI in the inner loop runs twice for each of the three calls.
+    assert stats.stack_cycles[inner] == 6
+    assert stats.pc_cycles[func + 4] == 6
+
+    # The LOOPI instruction counts as part of func, not of its own loop.
+    assert stats.stack_cycles[outer + (('func', func),)] >= 3 * 2
+
+
+def test_sim_profile(tmpdir: py.path.local) -> None:
+    '''Check that the simulator's own phase timers get filled in.'''
+
+    asm = """
+    addi x2, x0, 3
+    loop x2, 1
+      addi x3, x3, 1
+    ecall
+    """
+
+    sim = testutil.prepare_sim_for_asm_str(asm, tmpdir, False)
+    sim.sim_profile = SimProfile()
+    sim.run(verbose=False, dump_file=None)
+    prof = sim.sim_profile
+
+    # Each cycle of an instruction is timed as part of the execute phase and
+    # under the instruction's mnemonic.
+    assert prof.insn_counts == {'addi': 4, 'loop': 1, 'ecall': 1}
+    assert prof.phase_counts['execute'] == 6
+    assert prof.phase_counts['commit'] > 0
+
+    # Nested phases are not counted twice, so the phases can't add up to more
+    # than the total time.
+    assert sum(prof.phase_times.values()) == pytest.approx(prof.accounted)
+    assert 'Execute time per instruction' in prof.dump()
@@ -0,0 +1,75 @@
+# Copyright lowRISC contributors (OpenTitan project).
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+
+import py
+
+from batch import run_testcases
+from shared.testgen import write_test_data
+from shared.testgen_batch import generate_testcases, load_testgen
+from sim.load_elf import read_elf_image
+import testutil
+
+_TESTGEN = '''
+import random
+from typing import Optional
+
+from shared.testgen import Expectation, expectation
+
+
+@expectation
+def gen_copy_test(seed: Optional[int], nbytes: int = 32) -> Expectation:
+    x = random.getrandbits(8 * nbytes).to_bytes(nbytes, 'little')
+    return {'x': x}, {'w0': x[:32]}
+'''
+
+_ASM = '''
+  la     x2, x
+  li     x3, 0
+  bn.lid x3, 0(x2)
+  ecall
+'''
+
+
+def test_generate_and_run(tmpdir: py.path.local) -> None:
+    '''Check that many generated tests can be run on a single ELF file.'''
+
+    testgen_path = os.path.join(tmpdir, 'copy_testgen.py')
+    with open(testgen_path, 'w') as handle:
+        handle.write(_TESTGEN)
+
+    # Build the program with the data file for one seed, as Bazel does.
+    inputs, _ = load_testgen(testgen_path).generate(0)
+    asm_path = os.path.join(tmpdir, 'copy_test.s')
+    with open(asm_path, 'w') as handle:
+        handle.write(_ASM)
+        write_test_data(inputs, handle)
+    elf_path = testutil.asm_and_link_one_file(asm_path, tmpdir)
+
+    seeds = list(range(20))
+    cache_dir = os.path.join(tmpdir, 'cache')
+    cases = list(generate_testcases(testgen_path, seeds,
+                                    jobs=2, cache_dir=cache_dir))
+    assert [seed for seed, _ in cases] == seeds
+
+    # Generating the tests again (this time from the cache) should give the
+    # same results.
+    assert list(generate_testcases(testgen_path, seeds,
+                                   cache_dir=cache_dir)) == cases
+
+    image = read_elf_image(elf_path)
+    named_cases = [(str(seed), case) for seed, case in cases]
+    results = list(run_testcases(image, named_cases, jobs=2))
+    assert [result[0] for result in results] == [str(s) for s in seeds]
+    assert [result[4] for result in results] == [''] * len(seeds)
+
+    # Now break the expected value for one of the tests, which should make
+    # just that test fail.
+    good_case = cases[3][1]
+    bad_case = dict(good_case, output={'regs': {'w0': '0x1'}})
+    results = list(run_testcases(image, [('good', good_case),
+                                         ('bad', bad_case)]))
+    assert results[0][4] == ''
+    assert 'Mismatch for register w0' in results[1][4]
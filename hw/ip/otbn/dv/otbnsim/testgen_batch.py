@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# Copyright lowRISC contributors (OpenTitan project).
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Run an OTBN test program on many randomly generated tests
+
+TESTGEN is a test generator script, such as those in
+sw/otbn/crypto/tests/generated, and ELF is the test program that it generates
+tests for. For a test generator that writes a data file and an expected-values
+file, build the ELF with the data file from any one seed: every test from the
+generator has the same DMEM layout, so its inputs can be loaded on top.
+
+This generates tests for COUNT consecutive seeds, starting at --seed, in a pool
+of worker processes (see shared/testgen_batch.py). If there is a cache
+directory (--cache-dir, which defaults to $OTBN_UTIL_CACHE_DIR), tests that
+have been generated before are loaded from there. The tests are then run on
+the ELF file with batch.py, again in a pool of worker processes.
+
+For each failing test, the details get written to stderr. With --failures-dir,
+the failing tests also get written to that directory as testcase HJSON files,
+which can be passed to standalone.py's --testcase to debug them.
+
+'''
+
+import argparse
+import json
+import os
+import sys
+from time import perf_counter
+from typing import Any, Dict, List
+
+from batch import run_testcases
+from sim.load_elf import read_elf_image
+from shared.insn_yaml import get_cache_dir
+from shared.testgen_batch import generate_testcases
+
+
+def _parse_params(params: List[str]) -> Dict[str, Any]:
+    '''Parse NAME=VALUE arguments, where each VALUE is JSON'''
+    ret = {}
+    for param in params:
+        name, sep, value = param.partition('=')
+        if not sep:
+            raise ValueError(f'Parameter {param!r} is not of the form '
+                             'NAME=VALUE.')
+        try:
+            ret[name] = json.loads(value)
+        except json.JSONDecodeError:
+            raise ValueError(f'The value for parameter {name} is not '
+                             f'valid JSON: {value!r}') from None
+    return ret
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('testgen', metavar='TESTGEN',
+                        help='the test generator script.')
+    parser.add_argument('elf', metavar='ELF',
+                        help='the test program.')
+    parser.add_argument('-n', '--count', type=int, default=1000,
+                        help='number of tests to run. Defaults to 1000.')
+    parser.add_argument('-s', '--seed', type=int, default=0,
+                        help=("seed for the first test. The other tests use "
+                              "the seeds after it. Defaults to 0."))
+    parser.add_argument('-p', '--param', action='append', default=[],
+                        metavar='NAME=VALUE',
+                        help=("pass a keyword argument to the generator, "
+                              "with a value in JSON (for example "
+                              "mod_sizes=[512,1024]). Can be given more "
+                              "than once."))
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help=("number of worker processes. Defaults to the "
+                              "number of CPUs."))
+    parser.add_argument('--cache-dir', metavar='DIR', default=get_cache_dir(),
+                        help=("directory for cached tests. Defaults to "
+                              "$OTBN_UTIL_CACHE_DIR (if set)."))
+    parser.add_argument('--failures-dir',
+                        help="directory to write failing tests to.")
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help=("print a line for each test, rather than "
+                              "just for failures."))
+
+    args = parser.parse_args()
+
+    if args.jobs is None or args.jobs < 1:
+        args.jobs = 1
+
+    try:
+        params = _parse_params(args.param)
+    except ValueError as err:
+        print(err, file=sys.stderr)
+        return 1
+
+    image = read_elf_image(args.elf)
+    name = os.path.splitext(os.path.basename(args.testgen))[0]
+    seeds = list(range(args.seed, args.seed + args.count))
+
+    # Generate all the tests before running any of them, so that the two
+    # pools of workers don't compete for CPUs.
+    gen_start = perf_counter()
+    testcases = {f'{name}-{seed}': case
+                 for seed, case in generate_testcases(args.testgen, seeds,
+                                                      params, args.jobs,
+                                                      args.cache_dir)}
+    gen_time = perf_counter() - gen_start
+
+    run_start = perf_counter()
+    failures = 0
+    for test_name, cycles, err_bits, stop_pc, report in \
+            run_testcases(image, testcases.items(), args.jobs):
+        if args.verbose or report:
+            print('{}\t{}\t{:#x}\t{:#x}\t{}'
+                  .format(test_name, cycles, err_bits, stop_pc,
+                          'FAIL' if report else 'PASS'))
+        if not report:
+            continue
+
+        failures += 1
+        print(f'{test_name}:\n{report}', file=sys.stderr)
+        if args.failures_dir is not None:
+            os.makedirs(args.failures_dir, exist_ok=True)
+            path = os.path.join(args.failures_dir, test_name + '.hjson')
+            with open(path, 'w') as handle:
+                json.dump(testcases[test_name], handle, indent=2)
+    run_time = perf_counter() - run_start
+
+    print(f'{len(seeds) - failures}/{len(seeds)} tests passed '
+          f'(generated in {gen_time:.2f}s, ran in {run_time:.2f}s).')
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
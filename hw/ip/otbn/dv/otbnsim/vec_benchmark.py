@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# Copyright lowRISC contributors (OpenTitan project).
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Measure the speed of the lane operations behind the BN vector instructions
+
+The vector (SIMD) instructions use the bulk lane operations in sim/lanes.py.
+For each instruction, this times that operation and a reference version that
+works one element at a time with the helpers in sim/isa.py (which is how the
+instructions used to be implemented), on the same random inputs. It doesn't
+need any ELF files.
+
+The reference versions are also used by test/lanes_test.py to check the lane
+operations.
+
+'''
+
+import argparse
+import random
+import sys
+import time
+from typing import Callable, List, NamedTuple, Tuple
+
+from tabulate import tabulate
+
+from sim.isa import (extract_vec_elem, map_elems,
+                     montgomery_mul_no_cond_subtraction, shift_vec_elem)
+from sim.lanes import (add_lanes, add_mod_lanes, sub_lanes, sub_mod_lanes,
+                       mul_lanes, mul_by_lane, mont_mul_lanes,
+                       mont_mul_by_lane, trn_lanes, shift_lanes, unpack_24b,
+                       pack_24b)
+
+# The inputs for an operation: (vec_a, vec_b, mod, imm). vec_a and vec_b are
+# 256-bit vectors and mod is the value of the MOD WSR. imm is a random 32-bit
+# number that the operation uses for any immediate (lane index, shift
+# amount).
+Inputs = Tuple[int, int, int, int]
+VecFn = Callable[[int, int, int, int], int]
+
+
+class VecOp(NamedTuple):
+    '''A lane operation and a reference implementation'''
+    name: str
+    size: int
+    fast: VecFn
+    ref: VecFn
+
+
+def _mask(size: int) -> int:
+    return (1 << size) - 1
+
+
+def _ref_trn(vec_a: int, vec_b: int, size: int, odd: bool) -> int:
+    vec_c = 0
+    for elem in range(0, 256 // size, 2):
+        elem_a = extract_vec_elem(vec_a, elem + int(odd), size)
+        elem_b = extract_vec_elem(vec_b, elem + int(odd), size)
+        vec_c |= elem_a << (elem * size)
+        vec_c |= elem_b << ((elem + 1) * size)
+    return vec_c
+
+
+def _ref_shv(vec_a: int, size: int, shift_type: int, shift_bits: int) -> int:
+    vec_c = 0
+    for elem in range(256 // size):
+        elem_a = extract_vec_elem(vec_a, elem, size)
+        shifted = shift_vec_elem(elem_a, size, shift_type, shift_bits)
+        vec_c |= shifted << (elem * size)
+    return vec_c
+
+
+def _ref_unpk(vec_a: int, vec_b: int, shift: int) -> int:
+    shifted = ((vec_a << 256) | vec_b) >> shift
+    unpacked = 0
+    for elem in range(8):
+        chunk = (shifted >> (elem * 24)) & _mask(24)
+        unpacked |= chunk << (elem * 32)
+    return unpacked
+
+
+def _ref_pack(vec_a: int, vec_b: int, shift: int) -> int:
+    def dense(vec: int) -> int:
+        ret = 0
+        for elem in range(8):
+            ret |= ((vec >> (elem * 32)) & _mask(24)) << (elem * 24)
+        return ret
+
+    combined = (dense(vec_a) << (192 + 64)) | (dense(vec_b) << 64)
+    return (combined >> shift) & _mask(256)
+
+
+def _ref_mont(vec_a: int, vec_b: int, mod: int, size: int) -> int:
+    q = mod & _mask(size)
+    mu = (mod >> size) & _mask(size)
+    return map_elems(lambda a, b:
+                     montgomery_mul_no_cond_subtraction(a, b, q, mu, size),
+                     size, vec_a, vec_b)
+
+
+def _ref_broadcast(vec: int, lane: int, size: int) -> int:
+    elem = extract_vec_elem(vec, lane, size)
+    ret = 0
+    for i in range(256 // size):
+        ret |= elem << (i * size)
+    return ret
+
+
+def _ref_addm(a: int, b: int, mod: int) -> int:
+    c = a + b
+    return c - mod if c >= mod else c
+
+
+def _ref_subm(a: int, b: int, mod: int) -> int:
+    c = a - b
+    return c + mod if c < 0 else c
+
+
+def _trn_op(size: int, odd: bool) -> VecOp:
+    def fast(a: int, b: int, m: int, i: int) -> int:
+        return trn_lanes(a, b, size, odd)
+
+    def ref(a: int, b: int, m: int, i: int) -> int:
+        return _ref_trn(a, b, size, odd)
+
+    return VecOp('bn.trn{}'.format(2 if odd else 1), size, fast, ref)
+
+
+def _vec_ops() -> List[VecOp]:
+    M32 = _mask(32)
+    ops = [
+        VecOp('bn.addv', 32,
+              lambda a, b, m, i: add_lanes(a, b, 32),
+              lambda a, b, m, i: map_elems(lambda x, y: x + y, 32, a, b)),
+        VecOp('bn.addvm', 32,
+              lambda a, b, m, i: add_mod_lanes(a, b, m & M32, 32),
+              lambda a, b, m, i: map_elems(lambda x, y:
+                                           _ref_addm(x, y, m & M32),
+                                           32, a, b)),
+        VecOp('bn.subv', 32,
+              lambda a, b, m, i: sub_lanes(a, b, 32),
+              lambda a, b, m, i: map_elems(lambda x, y: x - y, 32, a, b)),
+        VecOp('bn.subvm', 32,
+              lambda a, b, m, i: sub_mod_lanes(a, b, m & M32, 32),
+              lambda a, b, m, i: map_elems(lambda x, y:
+                                           _ref_subm(x, y, m & M32),
+                                           32, a, b)),
+        VecOp('bn.mulv', 32,
+              lambda a, b, m, i: mul_lanes(a, b, 32),
+              lambda a, b, m, i: map_elems(lambda x, y: x * y, 32, a, b)),
+        VecOp('bn.mulvl', 32,
+              lambda a, b, m, i: mul_by_lane(a, b, i % 8, 32),
+              lambda a, b, m, i: map_elems(lambda x, y: x * y, 32, a,
+                                           _ref_broadcast(b, i % 8, 32))),
+        VecOp('bn.mulvm', 32,
+              lambda a, b, m, i: mont_mul_lanes(a, b, m & M32,
+                                                (m >> 32) & M32, 32),
+              lambda a, b, m, i: _ref_mont(a, b, m, 32)),
+        VecOp('bn.mulvml', 32,
+              lambda a, b, m, i: mont_mul_by_lane(a, b, i % 8, m & M32,
+                                                  (m >> 32) & M32, 32),
+              lambda a, b, m, i: _ref_mont(a, _ref_broadcast(b, i % 8, 32),
+                                           m, 32)),
+        VecOp('bn.shv', 32,
+              lambda a, b, m, i: shift_lanes(a, 32, i & 1, (i >> 1) & 31),
+              lambda a, b, m, i: _ref_shv(a, 32, i & 1, (i >> 1) & 31)),
+        VecOp('bn.unpk', 32,
+              lambda a, b, m, i: unpack_24b(a, b, 64 * (i & 3)),
+              lambda a, b, m, i: _ref_unpk(a, b, 64 * (i & 3))),
+        VecOp('bn.pack', 32,
+              lambda a, b, m, i: pack_24b(a, b, 64 * (i & 3)),
+              lambda a, b, m, i: _ref_pack(a, b, 64 * (i & 3))),
+    ]
+
+    # The transposes are the only vector instructions that support more than
+    # one element size.
+    for size in [32, 64, 128]:
+        for odd in [False, True]:
+            ops.append(_trn_op(size, odd))
+    return ops
+
+
+VECTOR_OPS = _vec_ops()
+
+
+def random_inputs(rng: random.Random) -> Inputs:
+    '''Pick random inputs for an operation'''
+    return (rng.getrandbits(256), rng.getrandbits(256),
+            rng.getrandbits(256), rng.getrandbits(32))
+
+
+def time_fn(fn: VecFn, inputs: List[Inputs], repeats: int) -> float:
+    '''Return the best time per call of fn on inputs, in microseconds'''
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for vec_a, vec_b, mod, imm in inputs:
+            fn(vec_a, vec_b, mod, imm)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    assert best is not None
+    return 1e6 * best / len(inputs)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--count', type=int, default=2000,
+                        help='Number of random inputs for each operation.')
+    parser.add_argument('--repeats', type=int, default=5,
+                        help='How many times to time each operation.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    inputs = [random_inputs(rng) for _ in range(args.count)]
+
+    rows = []
+    for op in VECTOR_OPS:
+        # Check the operation against the reference as we go, so that a
+        # benchmark can't report a speed-up for a broken implementation.
+        for vec_a, vec_b, mod, imm in inputs[:100]:
+            if op.fast(vec_a, vec_b, mod, imm) != op.ref(vec_a, vec_b, mod,
+                                                         imm):
+                print('Mismatch for {} on inputs {}.'
+                      .format(op.name, (vec_a, vec_b, mod, imm)),
+                      file=sys.stderr)
+                return 1
+
+        ref_us = time_fn(op.ref, inputs, args.repeats)
+        fast_us = time_fn(op.fast, inputs, args.repeats)
+        rows.append((op.name, '.{}{}'.format(256 // op.size,
+                                             {32: 's', 64: 'd',
+                                              128: 'q'}[op.size]),
+                     ref_us, fast_us, ref_us / fast_us))
+
+    print(tabulate(rows,
+                   headers=['insn', 'elen', 'per-element (us)',
+                            'lanes (us)', 'speed-up'],
+                   floatfmt=('', '', '.2f', '.2f', '.1f')))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
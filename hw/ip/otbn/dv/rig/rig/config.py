@@ -4,7 +4,7 @@
 
 import os
 import random
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Dict, Hashable, List, Optional, Set, Tuple
 
 from serialize.parse_helpers import check_str, check_keys, load_yaml
 
@@ -258,3 +258,18 @@ class Config:
         self.gen_weights.merge(other.gen_weights)
         self.insn_weights.merge(other.insn_weights)
         self.ranges.merge(other.ranges)
+
+    def settings(self) -> Hashable:
+        '''Return a hashable summary of this config's settings
+
+        Loading a config that inherits from a random choice of parents can
+        give different settings each time. Two configs with equal settings
+        behave identically, so the snippet generators for one can be used for
+        the other.
+
+        '''
+        return (self.path,
+                tuple(sorted(self.gen_weights.values.items())),
+                tuple(sorted(self.insn_weights.values.items())),
+                tuple(sorted(self.ranges.min_values.items())),
+                tuple(sorted(self.ranges.max_values.items())))
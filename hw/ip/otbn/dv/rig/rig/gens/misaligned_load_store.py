@@ -69,10 +69,10 @@ class MisalignedLoadStore(SnippetGen):
             # this index and go around again.
             prog_insn = self.fill_insn(self.insns[idx], model)
             if prog_insn is None:
+                weights = weights.copy()
                 weights[idx] = 0
                 continue
 
-        weights = self.weights.copy()
         snippet = ProgSnippet(model.pc, [prog_insn])
         snippet.insert_into_program(program)
 
@@ -181,6 +181,12 @@ class Model:
     registers and locations in memory are guaranteed have defined values after
     following the instruction stream to this point.
 
+    Models get copied a lot (every branch and loop body works on a copy of
+    the model at that point), so copy() is lazy: the copy shares its register
+    and memory tracking with the original and each component is only copied
+    by whichever model first changes it. The names of the components that a
+    model may change in place are in self._owned.
+
     '''
     def __init__(self, dmem_size: int, fuel: int) -> None:
         assert fuel >= 0
@@ -198,7 +204,7 @@ class Model:
         # value is unknown (but the register does have an architectural value).
         #
         # Note that x1 behaves a bit strangely because of the call stack rules,
-        # so we don't store it in _known_regs but instead in _call_stack.
+        # so we don't store it in _known_regs but instead in the call stack.
         self._known_regs = {}  # type: Dict[str, Dict[int, Optional[int]]]
 
         # Set x0 (the zeros register)
@@ -219,10 +225,10 @@ class Model:
         # entry of None means an entry with an architectural value, but where
         # we don't actually know what it is (usually a result of some
         # arithmetic operation that got written to x1).
-        self.call_stack = CallStack()
+        self._call_stack = CallStack()
 
         # The loop stack.
-        self.loop_stack = LoopStack()
+        self._loop_stack = LoopStack()
 
         # Known values for memory, keyed by memory type ('dmem', 'csr', 'wsr').
         csrs = KnownMem(4096)
@@ -255,29 +261,104 @@ class Model:
         # generating)
         self.pc = 0
 
+        # The components that this model may change in place (because no
+        # other model can see them). Each memory type in _known_mem is tracked
+        # separately, by its name.
+        self._owned = {'known_regs', 'const_regs', 'const_stack',
+                       'call_stack', 'loop_stack'} | self._known_mem.keys()
+
+    @property
+    def call_stack(self) -> CallStack:
+        '''The model of x1, which the caller may change'''
+        if 'call_stack' not in self._owned:
+            self._call_stack = self._call_stack.copy()
+            self._owned.add('call_stack')
+        return self._call_stack
+
+    @call_stack.setter
+    def call_stack(self, value: CallStack) -> None:
+        self._call_stack = value
+        self._owned.add('call_stack')
+
+    @property
+    def loop_stack(self) -> LoopStack:
+        '''The model of the loop stack, which the caller may change'''
+        if 'loop_stack' not in self._owned:
+            self._loop_stack = self._loop_stack.copy()
+            self._owned.add('loop_stack')
+        return self._loop_stack
+
+    @loop_stack.setter
+    def loop_stack(self, value: LoopStack) -> None:
+        self._loop_stack = value
+        self._owned.add('loop_stack')
+
+    def _own_known_regs(self) -> Dict[str, Dict[int, Optional[int]]]:
+        '''Make sure _known_regs isn't shared and return it'''
+        if 'known_regs' not in self._owned:
+            self._known_regs = {n: regs.copy()
+                                for n, regs in self._known_regs.items()}
+            self._owned.add('known_regs')
+        return self._known_regs
+
+    def _own_const_regs(self) -> Dict[str, Set[int]]:
+        '''Make sure _const_regs isn't shared and return it'''
+        if 'const_regs' not in self._owned:
+            self._const_regs = {n: regs.copy()
+                                for n, regs in self._const_regs.items()}
+            self._owned.add('const_regs')
+        return self._const_regs
+
+    def _own_const_stack(self) -> List[Dict[str, Set[int]]]:
+        '''Make sure _const_stack isn't shared and return it
+
+        The entries on the stack are never changed in place (pop_const takes
+        ownership of them), so they can stay shared.
+
+        '''
+        if 'const_stack' not in self._owned:
+            self._const_stack = self._const_stack.copy()
+            self._owned.add('const_stack')
+        return self._const_stack
+
+    def _own_known_mem(self, mem_type: str) -> KnownMem:
+        '''Make sure the KnownMem for mem_type isn't shared and return it'''
+        if mem_type not in self._owned:
+            self._known_mem[mem_type] = self._known_mem[mem_type].copy()
+            self._owned.add(mem_type)
+        return self._known_mem[mem_type]
+
     def copy(self) -> 'Model':
-        '''Return a deep copy of the model'''
-        ret = Model(self.dmem_size, self.initial_fuel)
-        ret.pc = self.pc
+        '''Return a copy of the model
+
+        This takes constant time: the two models share everything until one
+        of them changes it.
+
+        '''
+        ret = Model.__new__(Model)
+        ret.initial_fuel = self.initial_fuel
         ret.fuel = self.fuel
-        ret._known_regs = {n: regs.copy()
-                           for n, regs in self._known_regs.items()}
-        ret._const_regs = {n: regs.copy()
-                           for n, regs in self._const_regs.items()}
-        for entry in self._const_stack:
-            ret._const_stack.append({n: regs.copy()
-                                     for n, regs in entry.items()})
-        ret.call_stack = self.call_stack.copy()
-        ret.loop_stack = self.loop_stack.copy()
-        ret._known_mem = {n: mem.copy()
-                          for n, mem in self._known_mem.items()}
+        ret.dmem_size = self.dmem_size
+        ret.pc = self.pc
+
+        ret._known_regs = self._known_regs
+        ret._const_regs = self._const_regs
+        ret._const_stack = self._const_stack
+        ret._call_stack = self._call_stack
+        ret._loop_stack = self._loop_stack
+        ret._known_mem = self._known_mem.copy()
+
+        # Neither model can change anything in place any more.
+        ret._owned = set()
+        self._owned = set()
         return ret
 
     def _merge_known_regs(self,
                           other: Dict[str, Dict[int, Optional[int]]]) -> None:
         '''Merge known registers from another model'''
-        for reg_type in self._known_regs.keys() | other.keys():
-            sregs = self._known_regs.get(reg_type)
+        known_regs = self._own_known_regs()
+        for reg_type in known_regs.keys() | other.keys():
+            sregs = known_regs.get(reg_type)
             oregs = other.get(reg_type)
             if sregs is None:
                 # If sregs is None, we have no registers that are known to have
@@ -286,7 +367,7 @@ class Model:
             if oregs is None:
                 # If oregs is None, other has no registers with architectural
                 # values. Thus the merged model shouldn't have any either.
-                del self._known_regs[reg_type]
+                del known_regs[reg_type]
                 continue
 
             # Both register files have at least some architectural values.
@@ -317,12 +398,13 @@ class Model:
                         # Otherwise, make it unknown.
                         merged[reg_name] = None if svalue != ovalue else svalue
 
-            self._known_regs[reg_type] = merged
+            known_regs[reg_type] = merged
 
     def _merge_const_regs(self, other: Dict[str, Set[int]]) -> None:
         '''Merge constant registers from another model'''
-        for reg_type in self._const_regs.keys() | other.keys():
-            cr = self._const_regs.setdefault(reg_type, set())
+        const_regs = self._own_const_regs()
+        for reg_type in const_regs.keys() | other.keys():
+            cr = const_regs.setdefault(reg_type, set())
             cr |= other.get(reg_type, set())
 
     def merge(self, other: 'Model') -> None:
@@ -331,16 +413,24 @@ class Model:
         self.fuel = min(self.fuel, other.fuel)
         assert self.dmem_size == other.dmem_size
 
-        self._merge_known_regs(other._known_regs)
-        self._merge_const_regs(other._const_regs)
+        # Merging something with itself doesn't change it, so we can skip
+        # any components that are still shared with other (which is common
+        # if other is a copy of self where only some things have changed).
+        if self._known_regs is not other._known_regs:
+            self._merge_known_regs(other._known_regs)
+        if self._const_regs is not other._const_regs:
+            self._merge_const_regs(other._const_regs)
 
         assert self._const_stack == other._const_stack
 
-        self.call_stack.merge(other.call_stack)
-        self.loop_stack.merge(other.loop_stack)
+        if self._call_stack is not other._call_stack:
+            self.call_stack.merge(other._call_stack)
+        if self._loop_stack is not other._loop_stack:
+            self.loop_stack.merge(other._loop_stack)
 
-        for mem_type, self_mem in self._known_mem.items():
-            self_mem.merge(other._known_mem[mem_type])
+        for mem_type, other_mem in other._known_mem.items():
+            if self._known_mem[mem_type] is not other_mem:
+                self._own_known_mem(mem_type).merge(other_mem)
 
         assert self.pc == other.pc
 
@@ -385,19 +475,31 @@ class Model:
                 self.call_stack.write(value, update)
                 return
 
-        self._known_regs.setdefault(reg_type, {})[idx] = value
+        self._own_known_regs().setdefault(reg_type, {})[idx] = value
 
     def get_reg(self, reg_type: str, idx: int) -> Optional[int]:
         '''Get a register value, if known.'''
         if reg_type == 'gpr' and idx == 1:
-            return self.call_stack.peek()
+            return self._call_stack.peek()
+
+        return self._arch_regs(reg_type).get(idx)
 
-        return self._known_regs.setdefault(reg_type, {}).get(idx)
+    def _arch_regs(self, reg_type: str) -> Dict[int, Optional[int]]:
+        '''Get the registers of the given type with architectural values
+
+        This returns the dictionary in _known_regs (adding an empty one if
+        there isn't one yet), which the caller must not change.
+
+        '''
+        regs = self._known_regs.get(reg_type)
+        if regs is None:
+            regs = self._own_known_regs().setdefault(reg_type, {})
+        return regs
 
     def touch_mem(self, mem_type: str, base: int, width: int) -> None:
         '''Mark {base .. base+width} as known for given memory type'''
         assert mem_type in self._known_mem
-        self._known_mem[mem_type].touch_range(base, width)
+        self._own_known_mem(mem_type).touch_range(base, width)
 
     def pick_operand_value(self,
                            op_type: OperandType,
@@ -464,9 +566,9 @@ class Model:
         # when the stack is full, because we only do one operand at a time.
         if op_type.reg_type == 'gpr':
             can_use_x1 = not self.is_const('gpr', 1)
-            if is_src and self.call_stack.empty():
+            if is_src and self._call_stack.empty():
                 can_use_x1 = False
-            if is_dst and self.call_stack.full():
+            if is_dst and self._call_stack.full():
                 can_use_x1 = False
 
             # Since x1 isn't tracked in known_regs, we add it here if wanted
@@ -551,8 +653,8 @@ class Model:
         # not None and can be read iff it isn't marked constant.
         if reg_type == 'gpr':
             assert 1 not in known_regs
-            if not self.call_stack.empty():
-                x1 = self.call_stack.peek()
+            if not self._call_stack.empty():
+                x1 = self._call_stack.peek()
                 if x1 is not None:
                     if not self.is_const('gpr', 1):
                         ret.append((1, x1))
@@ -561,14 +663,13 @@ class Model:
 
     def regs_with_architectural_vals(self, reg_type: str) -> List[int]:
         '''List registers that have an architectural value and can be read'''
-        known_regs = self._known_regs.setdefault(reg_type, {})
-        arch_regs = list(known_regs.keys())
+        arch_regs = list(self._arch_regs(reg_type).keys())
 
         # Handle x1, which has an architectural (and known) value iff the call
         # stack is not empty.
         if reg_type == 'gpr':
             assert 1 not in arch_regs
-            if not self.call_stack.empty():
+            if not self._call_stack.empty():
                 if not self.is_const('gpr', 1):
                     arch_regs.append(1)
 
@@ -582,14 +683,19 @@ class Model:
 
         '''
         snapshot = {n: regs.copy() for n, regs in self._const_regs.items()}
-        self._const_stack.append(snapshot)
-        return len(self._const_stack)
+        const_stack = self._own_const_stack()
+        const_stack.append(snapshot)
+        return len(const_stack)
 
     def pop_const(self, token: int) -> None:
         '''Pop an entry from the _const_regs snapshot stack'''
         assert token >= 1
         assert len(self._const_stack) == token
-        self._const_regs = self._const_stack.pop()
+        self._const_regs = self._own_const_stack().pop()
+
+        # The snapshot might still be on the const stack of some other model
+        # that shared it with us.
+        self._owned.discard('const_regs')
 
     def mark_const(self, reg_type: str, reg_idx: int) -> None:
         '''Mark a register as constant
@@ -603,7 +709,7 @@ class Model:
         if reg_idx == 0 and reg_type == 'gpr':
             return
 
-        self._const_regs.setdefault(reg_type, set()).add(reg_idx)
+        self._own_const_regs().setdefault(reg_type, set()).add(reg_idx)
 
     def is_const(self, reg_type: str, reg_idx: int) -> bool:
         '''Return true if this register is marked as constant'''
@@ -626,9 +732,8 @@ class Model:
 
         # Set the value in known_regs to None, but only if the register already
         # has an architectural value.
-        kr = self._known_regs.setdefault(reg_type, {})
-        if reg_idx in kr:
-            kr[reg_idx] = None
+        if reg_idx in self._arch_regs(reg_type):
+            self._own_known_regs()[reg_type][reg_idx] = None
 
     def pick_lsu_target(self,
                         mem_type: str,
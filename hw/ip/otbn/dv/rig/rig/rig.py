@@ -2,7 +2,7 @@
 # Licensed under the Apache License, Version 2.0, see LICENSE for details.
 # SPDX-License-Identifier: Apache-2.0
 
-from typing import Tuple
+from typing import Optional, Tuple
 
 from shared.insn_yaml import InsnsFile
 from shared.mem_layout import get_memory_layout
@@ -15,14 +15,35 @@ from .snippet_gens import SnippetGens
 from .snippet import Snippet
 
 
-def gen_program(config: Config,
-                fuel: int,
-                insns_file: InsnsFile) -> Tuple[InitData, Snippet, int]:
+def make_snippet_gens(config: Config, insns_file: InsnsFile) -> SnippetGens:
+    '''Make the snippet generators for config
+
+    Raises a RuntimeError if the config is bad.
+
+    '''
+    try:
+        return SnippetGens(config, insns_file)
+    except ValueError as err:
+        raise RuntimeError('Failed to initialise snippet generators: {}'
+                           .format(err)) from None
+
+
+def gen_program(
+        config: Config,
+        fuel: int,
+        insns_file: InsnsFile,
+        gens: Optional[SnippetGens] = None) -> Tuple[InitData, Snippet, int]:
     '''Generate a random program for OTBN
 
     fuel gives a rough upper bound for the number of instructions that will be
     executed by the generated program.
 
+    If gens is not None, it should be the result of make_snippet_gens for the
+    same config and insns_file. This avoids setting up the generators again
+    when generating several programs. Setting up the generators doesn't use
+    the random number generator, so the result for a given seed doesn't
+    depend on whether gens is passed.
+
     Returns (init_data, snippet, end_addr). init_data is a dict mapping (4-byte
     aligned) address to u32s that should be loaded into data memory before
     starting the program. snippets is a tree of instruction snippets. end_addr
@@ -49,11 +70,8 @@ def gen_program(config: Config,
     for addr in init_data.keys():
         model.touch_mem('dmem', addr, 4)
 
-    try:
-        gens = SnippetGens(config, insns_file)
-    except ValueError as err:
-        raise RuntimeError('Failed to initialise snippet generators: {}'
-                           .format(err)) from None
+    if gens is None:
+        gens = make_snippet_gens(config, insns_file)
 
     snippet, end_addr = gens.gen_program(model, program)
     return init_data, snippet, end_addr
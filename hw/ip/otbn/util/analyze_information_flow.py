@@ -4,63 +4,26 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import argparse
+import os
 import sys
+from typing import Dict, Set
 
 from shared.constants import parse_required_constants
-from shared.control_flow import program_control_graph, subroutine_control_graph
-from shared.decode import decode_elf
+from shared.control_flow import (ControlGraph, program_control_graph,
+                                 subroutine_control_graph)
+from shared.decode import OTBNProgram, decode_elf
 from shared.information_flow import InformationFlowGraph
 from shared.information_flow_analysis import (get_program_iflow,
-                                              get_subroutine_iflow,
+                                              get_subroutine_iflows,
                                               stringify_control_deps)
 
 
-def main() -> int:
-    parser = argparse.ArgumentParser(description=(
-        'Analyze the control flow and information flow of an OTBN '
-        'program or subroutine.'))
-    parser.add_argument('elf', help=('The .elf file to check.'))
-    parser.add_argument(
-        '--verbose',
-        action='store_true',
-        help=('Print full control-flow and information-flow graphs.'))
-    parser.add_argument(
-        '--clobbered',
-        action='store_true',
-        help=('Print the clobbered registers as they would be in a docstring. '
-              'Unless --verbose is set, will not print full graph.'))
-    parser.add_argument(
-        '--subroutine',
-        required=False,
-        help=(
-            'The specific subroutine to check. If not provided, start point is '
-            '_imem_start (whole program).'))
-    parser.add_argument(
-        '--constants',
-        nargs='+',
-        type=str,
-        required=False,
-        help=('Registers which are required to be constant at the start of the '
-              'subroutine. Only valid if `--subroutine` is passed. Write '
-              'in the form "reg:value", e.g. x3:5. Only GPRs are accepted as '
-              'required constants.'))
-    parser.add_argument(
-        '--secrets',
-        nargs='+',
-        type=str,
-        required=False,
-        help=(
-            'Initially secret information-flow nodes. If provided, the final '
-            'secrets will be printed.'))
-    args = parser.parse_args()
-    program = decode_elf(args.elf, [])
-
-    # Compute control-flow graph.
-    if args.subroutine is None:
-        graph = program_control_graph(program)
-    else:
-        graph = subroutine_control_graph(program, args.subroutine)
-
+def _print_analysis(args: argparse.Namespace, program: OTBNProgram,
+                    graph: ControlGraph, what: str,
+                    ret_iflow: InformationFlowGraph,
+                    end_iflow: InformationFlowGraph,
+                    control_deps: Dict[str, Set[int]]) -> None:
+    '''Print the results of analyzing a program or subroutine'''
     # Only print the control-flow graph if --verbose is set.
     if args.verbose:
         print('Control-flow graph:')
@@ -74,26 +37,6 @@ def main() -> int:
                     ', '.join(symbols)) if symbols else ''
                 print('{:#x}{}'.format(pc, label_str))
 
-    # Parse initial constants.
-    if args.constants is None:
-        constants = {}
-    else:
-        if args.subroutine is None:
-            raise ValueError('Cannot require initial constants for a whole '
-                             'program; use --subroutine to analyze a specific '
-                             'subroutine.')
-        constants = parse_required_constants(args.constants)
-
-    # Compute information-flow graph(s).
-    if args.subroutine is None:
-        what = 'program'
-        end_iflow, control_deps = get_program_iflow(program, graph)
-        ret_iflow = InformationFlowGraph.nonexistent()
-    else:
-        what = 'subroutine'
-        ret_iflow, end_iflow, control_deps = get_subroutine_iflow(
-            program, graph, args.subroutine, constants)
-
     # If no secrets were given or the --verbose flag is set, then print the
     # full information-flow graphs.
     if (args.verbose or (args.secrets is None and not args.clobbered)):
@@ -113,7 +56,7 @@ def main() -> int:
             print(ret_iflow.clobbered())
         # If we have no secrets listed, then just finish here.
         if args.secrets is None:
-            return 0
+            return
 
     if args.secrets is None:
         # If no initial secrets were provided, we will print all nodes that
@@ -156,6 +99,88 @@ def main() -> int:
             print('Final secrets for paths ending the program:',
                   ', '.join(sorted(final_secrets)))
 
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=(
+        'Analyze the control flow and information flow of an OTBN '
+        'program or subroutine.'))
+    parser.add_argument('elf', help=('The .elf file to check.'))
+    parser.add_argument(
+        '--verbose',
+        action='store_true',
+        help=('Print full control-flow and information-flow graphs.'))
+    parser.add_argument(
+        '--clobbered',
+        action='store_true',
+        help=('Print the clobbered registers as they would be in a docstring. '
+              'Unless --verbose is set, will not print full graph.'))
+    parser.add_argument(
+        '--subroutine',
+        nargs='+',
+        required=False,
+        help=(
+            'The specific subroutine to check. If not provided, start point is '
+            '_imem_start (whole program). If several subroutines are given, '
+            'each is analyzed separately (with the same constants and '
+            'secrets).'))
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=os.cpu_count(),
+        help=('The number of worker processes to use when analyzing several '
+              'subroutines. Defaults to the number of CPUs.'))
+    parser.add_argument(
+        '--constants',
+        nargs='+',
+        type=str,
+        required=False,
+        help=('Registers which are required to be constant at the start of the '
+              'subroutine. Only valid if `--subroutine` is passed. Write '
+              'in the form "reg:value", e.g. x3:5. Only GPRs are accepted as '
+              'required constants.'))
+    parser.add_argument(
+        '--secrets',
+        nargs='+',
+        type=str,
+        required=False,
+        help=(
+            'Initially secret information-flow nodes. If provided, the final '
+            'secrets will be printed.'))
+    args = parser.parse_args()
+    program = decode_elf(args.elf, [])
+
+    # Parse initial constants.
+    if args.constants is None:
+        constants = {}
+    else:
+        if args.subroutine is None:
+            raise ValueError('Cannot require initial constants for a whole '
+                             'program; use --subroutine to analyze a specific '
+                             'subroutine.')
+        constants = parse_required_constants(args.constants)
+
+    # Compute control-flow and information-flow graph(s).
+    if args.subroutine is None:
+        graph = program_control_graph(program)
+        end_iflow, control_deps = get_program_iflow(program, graph)
+        ret_iflow = InformationFlowGraph.nonexistent()
+        _print_analysis(args, program, graph, 'program',
+                        ret_iflow, end_iflow, control_deps)
+        return 0
+
+    # The subroutines are analyzed in parallel, but the results are printed
+    # in order.
+    results = get_subroutine_iflows(program, args.elf, [], args.subroutine,
+                                    constants, args.jobs or 1)
+    named_results = zip(args.subroutine, results)
+    for name, ((ret_iflow, end_iflow, control_deps), _) in named_results:
+        if len(args.subroutine) > 1:
+            print('Subroutine {}:'.format(name))
+        graph = subroutine_control_graph(program, name)
+        _print_analysis(args, program, graph, 'subroutine',
+                        ret_iflow, end_iflow, control_deps)
+
     return 0
 
 
@@ -4,14 +4,16 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import argparse
+import os
 import sys
 
 from shared.check import CheckResult
 from shared.constants import parse_required_constants
-from shared.control_flow import program_control_graph, subroutine_control_graph
+from shared.control_flow import program_control_graph
 from shared.decode import decode_elf
-from shared.information_flow_analysis import (get_program_iflow,
-                                              get_subroutine_iflow,
+from shared.information_flow_analysis import (IFlowCache,
+                                              get_program_iflow,
+                                              get_subroutine_iflows,
                                               stringify_control_deps)
 
 
@@ -23,9 +25,19 @@ def main() -> int:
     parser.add_argument('--verbose', action='store_true')
     parser.add_argument(
         '--subroutine',
+        nargs='+',
         required=False,
         help=('The specific subroutine to check. If not provided, the start '
-              'point is _imem_start (whole program).'))
+              'point is _imem_start (whole program). If several subroutines '
+              'are given, each is checked separately (with the same '
+              'constants and secrets) and the results are combined.'))
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=os.cpu_count(),
+        help=('The number of worker processes to use when checking several '
+              'subroutines. Defaults to the number of CPUs.'))
     parser.add_argument(
         '--ignore',
         nargs='+',
@@ -64,41 +76,57 @@ def main() -> int:
         constants = parse_required_constants(args.constants)
 
     # Compute control graph and get all nodes that influence control flow.
+    # This gives a list of tuples (what was analyzed, control deps, cache
+    # stats).
     program = decode_elf(args.elf, args.ignore or [])
+    analyses = []
     if args.subroutine is None:
         graph = program_control_graph(program)
-        to_analyze = 'entire program'
-        _, control_deps = get_program_iflow(program, graph)
+        cache = IFlowCache()
+        _, control_deps = get_program_iflow(program, graph, cache)
+        analyses.append(('entire program', control_deps, cache.stats()))
     else:
-        graph = subroutine_control_graph(program, args.subroutine)
-        to_analyze = 'subroutine {}'.format(args.subroutine)
-        _, _, control_deps = get_subroutine_iflow(program, graph,
-                                                  args.subroutine, constants)
+        results = get_subroutine_iflows(program, args.elf, args.ignore or [],
+                                        args.subroutine, constants,
+                                        args.jobs or 1)
+        named_results = zip(args.subroutine, results)
+        for name, ((_, _, control_deps), stats) in named_results:
+            analyses.append(('subroutine {}'.format(name), control_deps,
+                             stats))
 
-    if args.secrets is None:
-        if args.verbose:
-            print(
-                'No specific secrets provided; checking that {} has only one '
-                'control-flow path'.format(to_analyze))
-        secret_control_deps = control_deps
-    else:
+    out = CheckResult()
+
+    for to_analyze, control_deps, cache_stats in analyses:
         if args.verbose:
-            print('Analyzing {} with initial secrets {} and initial constants {}'.format(
-                to_analyze, args.secrets, constants))
-        # If secrets were provided, only show the ways in which those specific
-        # nodes could influence control flow.
-        secret_control_deps = {
-            node: pcs
-            for node, pcs in control_deps.items() if node in args.secrets
-        }
+            print('Information-flow cache for {}: {}'.format(to_analyze,
+                                                             cache_stats))
 
-    out = CheckResult()
+        if args.secrets is None:
+            if args.verbose:
+                print(
+                    'No specific secrets provided; checking that {} has only '
+                    'one control-flow path'.format(to_analyze))
+            secret_control_deps = control_deps
+        else:
+            if args.verbose:
+                print('Analyzing {} with initial secrets {} and initial '
+                      'constants {}'.format(to_analyze, args.secrets,
+                                            constants))
+            # If secrets were provided, only show the ways in which those
+            # specific nodes could influence control flow.
+            secret_control_deps = {
+                node: pcs
+                for node, pcs in control_deps.items() if node in args.secrets
+            }
 
-    if len(secret_control_deps) != 0:
-        msg = 'The following secrets may influence control flow:\n  '
-        msg += '\n  '.join(stringify_control_deps(program,
-                                                  secret_control_deps))
-        out.err(msg)
+        if len(secret_control_deps) != 0:
+            # If we're checking several subroutines, say which one this is.
+            where = ' in {}'.format(to_analyze) if len(analyses) > 1 else ''
+            msg = 'The following secrets may influence control flow{}:\n  ' \
+                .format(where)
+            msg += '\n  '.join(stringify_control_deps(program,
+                                                      secret_control_deps))
+            out.err(msg)
 
     if args.verbose or out.has_errors() or out.has_warnings():
         print(out.report())
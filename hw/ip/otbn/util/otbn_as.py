@@ -16,19 +16,27 @@ Partial support:
 
 '''
 
+import io
+import multiprocessing
 import os
 import re
 import subprocess
 import sys
 import tempfile
-from typing import Dict, List, Optional, Set, TextIO, Tuple
+from typing import Dict, Iterator, List, Optional, Set, TextIO, Tuple
 
 from shared.bit_ranges import BitRanges
+from shared.disk_cache import DiskCache, cache_key, file_digest
 from shared.encoding import Encoding
-from shared.insn_yaml import Insn, InsnsFile, load_insns_yaml
+from shared.insn_yaml import (CACHE_DIR_ENV_VAR, Insn, InsnsFile,
+                              cache_version, get_cache_dir, load_insns_yaml)
 from shared.operand import ImmOperandType, Operand, RegOperandType
 from shared.toolchain import find_tool
 
+# The environment variable that sets the number of worker processes to use
+# when transforming input files.
+JOBS_ENV_VAR = 'OTBN_AS_JOBS'
+
 
 class RVFmt:
     '''A simple representation of a format supported by .insn
@@ -370,19 +378,51 @@ def find_rv_encoding(enc: Encoding, name_to_operand: Dict[str, Operand],
                       part_field_to_rv_field)
 
 
-def find_insn_schemes(mnem_to_insn: Dict[str, Insn]) -> Dict[str, RVEncoding]:
-    '''Try to find a .insn scheme for each instruction'''
+def find_insn_schemes(
+        mnem_to_insn: Dict[str, Insn],
+        cache_dir: Optional[str] = None) -> Dict[str, RVEncoding]:
+    '''Try to find a .insn scheme for each instruction
+
+    If cache_dir is not None, it names a directory where we store the index in
+    RISCV_FORMATS of the scheme that we found for each instruction (or None if
+    there wasn't one). Later runs with the same instruction database then only
+    need to try that scheme, rather than searching through all of them.
+
+    '''
+    disk_cache = None
+    hints: Dict[str, Optional[int]] = {}
+    if cache_dir is not None:
+        disk_cache = DiskCache(cache_dir, 'otbn-as-schemes',
+                               file_digest(__file__))
+        cached = disk_cache.get(cache_version())
+        if isinstance(cached, dict):
+            hints = cached
+
     ret = {}
+    found: Dict[str, Optional[int]] = {}
     for mnem, insn in mnem_to_insn.items():
         # We definitely aren't going to manage it if we have no encoding
         if insn.encoding is None:
             continue
 
-        for rvfmt in RISCV_FORMATS:
+        if mnem in hints:
+            hint = hints[mnem]
+            to_try = [] if hint is None else [hint]
+        else:
+            to_try = list(range(len(RISCV_FORMATS)))
+
+        found[mnem] = None
+        for idx in to_try:
+            rvfmt = RISCV_FORMATS[idx]
             rve = find_rv_encoding(insn.encoding, insn.name_to_operand, rvfmt)
             if rve is not None:
                 ret[mnem] = rve
+                found[mnem] = idx
                 break
+
+    if disk_cache is not None and found != hints:
+        disk_cache.put(cache_version(), found)
+
     return ret
 
 
@@ -435,7 +475,13 @@ def parse_positionals(
               'for more information.\n'
               '\n'
               '  --otbn-translate: Translate the input and dump to '
-              'stdout rather than calling as.\n')
+              'stdout rather than calling as.\n'
+              '\n'
+              'Input files are translated in parallel, using the number of '
+              'worker\nprocesses given by the {} environment variable '
+              '(default: the\nnumber of CPUs). If {} is set, it names a '
+              'directory where\ntranslated files are cached.\n'
+              .format(JOBS_ENV_VAR, CACHE_DIR_ENV_VAR))
         sys.exit(0)
 
     return (positionals, others, flags)
@@ -1139,35 +1185,128 @@ def transform_input(out_handle: TextIO, in_path: str, in_handle: TextIO,
     transformer.at_eof()
 
 
+def _transform_text(in_path: str, in_idx: int, text: str,
+                    insns_file: InsnsFile, glued_insns_dec_len: List[Insn],
+                    mnem_to_rve: Dict[str, RVEncoding]) -> str:
+    '''Transform the contents of an input file, returning the result'''
+    out_handle = io.StringIO()
+    transform_input(out_handle, in_path, io.StringIO(text), in_idx,
+                    insns_file, glued_insns_dec_len, mnem_to_rve)
+    return out_handle.getvalue()
+
+
+# The arguments to _transform_text that are the same for every file. This is
+# set in worker processes by _init_worker.
+_WorkerArgs = Tuple[InsnsFile, List[Insn], Dict[str, RVEncoding]]
+_WORKER_ARGS: Optional[_WorkerArgs] = None
+
+
+def _init_worker(insns_file: InsnsFile, glued_insns_dec_len: List[Insn],
+                 mnem_to_rve: Dict[str, RVEncoding]) -> None:
+    '''Initialise a worker process for transform_inputs'''
+    global _WORKER_ARGS
+    _WORKER_ARGS = (insns_file, glued_insns_dec_len, mnem_to_rve)
+
+
+def _transform_in_worker(job: Tuple[str, int, str]) -> str:
+    '''Transform one input file in a worker process'''
+    assert _WORKER_ARGS is not None
+    in_path, in_idx, text = job
+    return _transform_text(in_path, in_idx, text, *_WORKER_ARGS)
+
+
+def _get_jobs() -> int:
+    '''The number of worker processes to use for transform_inputs'''
+    jobs_str = os.environ.get(JOBS_ENV_VAR)
+    if jobs_str is None:
+        return os.cpu_count() or 1
+    try:
+        return max(1, int(jobs_str))
+    except ValueError:
+        raise RuntimeError(f'Invalid value for {JOBS_ENV_VAR}: {jobs_str!r}'
+                           ' (should be a number).') from None
+
+
 def transform_inputs(out_dir: str, inputs: List[str], insns_file: InsnsFile,
                      mnem_to_rve: Dict[str, RVEncoding],
                      glued_insns_dec_len: List[Insn],
-                     just_translate: bool) -> List[str]:
-    '''Transform inputs to make them suitable for riscv as'''
+                     just_translate: bool,
+                     jobs: int = 1,
+                     cache_dir: Optional[str] = None) -> List[str]:
+    '''Transform inputs to make them suitable for riscv as
+
+    If jobs is more than 1, input files are transformed in parallel by that
+    many worker processes. If cache_dir is not None, it names a directory
+    where we store the transformed version of each input. This is keyed by the
+    contents of the input, its path and its position in inputs (which are all
+    visible in the output) and by the version of this script and the
+    instruction database. An unchanged input then doesn't need transforming
+    again.
+
+    '''
+    disk_cache = None
+    if cache_dir is not None:
+        disk_cache = DiskCache(cache_dir, 'otbn-as-transformed',
+                               cache_key(cache_version(),
+                                         file_digest(__file__)))
+
+    # Read all the inputs and look them up in the cache. texts[idx] is the
+    # transformed version of inputs[idx] if we have one, and otherwise None.
     out_paths = []
+    keys = []
+    texts: List[Optional[str]] = []
+    to_do = []
     for idx, in_path in enumerate(inputs):
-        out_path = os.path.join(out_dir, str(idx))
-        out_paths.append(out_path)
-
-        in_handle = sys.stdin
-        pretty_in_path = 'stdin'
-        out_handle = sys.stdout
-        try:
-            if in_path != '--':
-                in_handle = open(in_path, 'r')
-                pretty_in_path = in_path
-
-            if not just_translate:
-                out_handle = open(out_path, 'w')
+        out_paths.append(os.path.join(out_dir, str(idx)))
 
-            transform_input(out_handle, pretty_in_path, in_handle, idx, insns_file,
-                            glued_insns_dec_len, mnem_to_rve)
+        if in_path == '--':
+            pretty_in_path = 'stdin'
+            text = sys.stdin.read()
+        else:
+            pretty_in_path = in_path
+            with open(in_path, 'r') as in_handle:
+                text = in_handle.read()
+
+        key = cache_key(pretty_in_path, str(idx), text)
+        keys.append(key)
+        cached = disk_cache.get(key) if disk_cache is not None else None
+        texts.append(cached if isinstance(cached, str) else None)
+        if texts[-1] is None:
+            to_do.append((pretty_in_path, idx, text))
+
+    # Transform the inputs that weren't in the cache. The results come back in
+    # order so, as when transforming the files one at a time, any error is
+    # reported for the first bad file.
+    pool = None
+    results: Iterator[str]
+    if jobs > 1 and len(to_do) > 1:
+        pool = multiprocessing.Pool(min(jobs, len(to_do)),
+                                    initializer=_init_worker,
+                                    initargs=(insns_file, glued_insns_dec_len,
+                                              mnem_to_rve))
+        results = pool.imap(_transform_in_worker, to_do)
+    else:
+        results = (_transform_text(in_path, idx, text, insns_file,
+                                   glued_insns_dec_len, mnem_to_rve)
+                   for in_path, idx, text in to_do)
 
-        finally:
-            if in_handle is not sys.stdin and in_handle is not None:
-                in_handle.close()
-            if out_handle is not sys.stdout:
-                out_handle.close()
+    try:
+        for (_, idx, _), transformed in zip(to_do, results):
+            texts[idx] = transformed
+            if disk_cache is not None:
+                disk_cache.put(keys[idx], transformed)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    for out_path, out_text in zip(out_paths, texts):
+        assert out_text is not None
+        if just_translate:
+            sys.stdout.write(out_text)
+        else:
+            with open(out_path, 'w') as out_handle:
+                out_handle.write(out_text)
 
     return out_paths
 
@@ -1239,13 +1378,15 @@ def main(argv: List[str]) -> int:
 
     # Try to match up OTBN instruction encodings with .insn schemes (as stored
     # in RISCV_FORMATS).
-    mnem_to_rve = find_insn_schemes(insns_file.mnemonic_to_insn)
+    mnem_to_rve = find_insn_schemes(insns_file.mnemonic_to_insn,
+                                    get_cache_dir())
 
     with tempfile.TemporaryDirectory(suffix='.otbn-as') as tmpdir:
         try:
             transformed = transform_inputs(tmpdir, files, insns_file,
                                            mnem_to_rve, glued_insns_dec_len,
-                                           just_translate)
+                                           just_translate, _get_jobs(),
+                                           get_cache_dir())
         except RuntimeError as err:
             sys.stderr.write('{}\n'.format(err))
             return 1
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# Copyright lowRISC contributors (OpenTitan project).
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Measure the speed of otbn_as.py's pre-pass over OTBN assembly files
+
+This runs the transformation that otbn_as.py does before calling binutils as
+(see transform_inputs) on every .s file under a directory, which defaults to
+the OTBN crypto library in sw/otbn/crypto. It doesn't need a RISC-V toolchain.
+
+The transformation is timed serially, in parallel and with a cache directory
+(both when it starts empty and when it already holds every file).
+
+'''
+
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+from typing import List, Optional, Tuple
+
+from otbn_as import find_insn_schemes, transform_inputs
+from shared.insn_yaml import load_insns_yaml
+
+_REPO_TOP = os.path.normpath(os.path.join(os.path.dirname(__file__),
+                                          '..', '..', '..', '..'))
+
+
+def time_transform(inputs: List[str], jobs: int,
+                   cache_dir: Optional[str]) -> float:
+    '''Transform inputs once, returning the time it took in seconds'''
+    insns_file = load_insns_yaml()
+    mnem_to_rve = find_insn_schemes(insns_file.mnemonic_to_insn)
+    glued_insns_dec_len = sorted((insn for insn in insns_file.insns
+                                  if insn.glued_ops),
+                                 key=lambda insn: len(insn.mnemonic),
+                                 reverse=True)
+
+    with tempfile.TemporaryDirectory(suffix='.otbn-as-bench') as out_dir:
+        start_time = time.perf_counter()
+        transform_inputs(out_dir, inputs, insns_file, mnem_to_rve,
+                         glued_insns_dec_len, False, jobs, cache_dir)
+        return time.perf_counter() - start_time
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('src_dir', nargs='?',
+                        default=os.path.join(_REPO_TOP, 'sw', 'otbn',
+                                             'crypto'),
+                        help=('The directory to search (recursively) for .s '
+                              'files. Defaults to sw/otbn/crypto.'))
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help=('The number of worker processes for the '
+                              'parallel runs. Defaults to the number of '
+                              'CPUs.'))
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='How many times to run each configuration.')
+    args = parser.parse_args()
+
+    inputs = sorted(glob.glob(os.path.join(args.src_dir, '**', '*.s'),
+                              recursive=True))
+    if not inputs:
+        print(f'No .s files found under {args.src_dir}.', file=sys.stderr)
+        return 1
+
+    jobs = args.jobs or 1
+    print(f'Transforming {len(inputs)} files under {args.src_dir}.')
+
+    with tempfile.TemporaryDirectory(suffix='.otbn-as-cache') as cache_root:
+        # Each cold run uses a new cache directory, so that it starts empty.
+        # The warm runs reuse the directory that the last cold run filled in.
+        cold_dirs: List[Optional[str]] = [
+            os.path.join(cache_root, str(idx)) for idx in range(args.repeats)
+        ]
+        configs: List[Tuple[str, int, List[Optional[str]]]] = [
+            ('serial', 1, [None] * args.repeats),
+            (f'{jobs} jobs', jobs, [None] * args.repeats),
+            (f'{jobs} jobs, cold cache', jobs, cold_dirs),
+            ('warm cache', jobs, [cold_dirs[-1]] * args.repeats),
+        ]
+        for name, config_jobs, cache_dirs in configs:
+            best = min(time_transform(inputs, config_jobs, cache_dir)
+                       for cache_dir in cache_dirs)
+            print(f'{name:>24}: {best:.3f}s')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,51 +8,14 @@
 import argparse
 import subprocess
 import sys
-from enum import IntEnum
-from typing import List
 import tempfile
 
-from shared.check import CheckResult
 from shared.elf import read_elf
+from shared.final_state import ERR_BITS, check_final_state
 from shared.reg_dump import parse_reg_dump
 from shared.dmem_dump import parse_dmem_exp, parse_actual_dmem
 from shared.testcase import OtbnTestCase
 
-# Names of special registers
-ERR_BITS = 'ERR_BITS'
-INSN_CNT = 'INSN_CNT'
-STOP_PC = 'STOP_PC'
-
-
-# copied from hw/ip/otbn/dv/otbnsim/sim/constants.py
-class ErrBits(IntEnum):
-    '''A copy of the list of bits in the ERR_BITS register.'''
-    BAD_DATA_ADDR = 1 << 0
-    BAD_INSN_ADDR = 1 << 1
-    CALL_STACK = 1 << 2
-    ILLEGAL_INSN = 1 << 3
-    LOOP = 1 << 4
-    KEY_INVALID = 1 << 5
-    RND_REP_CHK_FAIL = 1 << 6
-    RND_FIPS_CHK_FAIL = 1 << 7
-    IMEM_INTG_VIOLATION = 1 << 16
-    DMEM_INTG_VIOLATION = 1 << 17
-    REG_INTG_VIOLATION = 1 << 18
-    BUS_INTG_VIOLATION = 1 << 19
-    BAD_INTERNAL_STATE = 1 << 20
-    ILLEGAL_BUS_ACCESS = 1 << 21
-    LIFECYCLE_ESCALATION = 1 << 22
-    FATAL_SOFTWARE = 1 << 23
-
-
-def get_err_names(err: int) -> List[str]:
-    '''Get the names of all error bits that are set.'''
-    out = []
-    for err_bit in ErrBits:
-        if err & err_bit != 0:
-            out.append(err_bit.name)
-    return out
-
 
 def main() -> int:
     parser = argparse.ArgumentParser()
@@ -88,9 +51,6 @@ def main() -> int:
 
     _, _, symbols = read_elf(args.elf)
 
-    # Parse expected values.
-    result = CheckResult()
-
     cmd_flags = []
 
     testcase = None
@@ -125,7 +85,6 @@ def main() -> int:
             regs_file.seek(0)
             print(regs_file.read().decode('utf-8'))
 
-    expected_err = 0
     expected_regs = {}
     if args.expected_regs is not None:
         expected_regs = parse_reg_dump(args.expected_regs.read())
@@ -134,59 +93,14 @@ def main() -> int:
     if args.expected_dmem is not None:
         expected_dmem = parse_dmem_exp(args.expected_dmem.read())
 
+    entrypoint = 0
     if testcase:
         expected_dmem = testcase.output.dmem
         expected_regs = testcase.output.regs
+        entrypoint = testcase.entrypoint
 
-    expected_err = expected_regs.get(ERR_BITS, 0)
-
-    if testcase and testcase.entrypoint and not expected_err:
-        # expect call stack error since we overwrite the entrypoint.
-        expected_err = 0x00000004
-
-    # Special handling for the ERR_BITS register.
-    actual_err = actual_regs[ERR_BITS]
-    insn_cnt = actual_regs[INSN_CNT]
-    stop_pc = actual_regs[STOP_PC]
-    if expected_err == 0 and actual_err != 0:
-        # Test is expected to have no errors, but an error occurred. In this
-        # case, give a special error message and exit rather than print all the
-        # mismatched registers.
-        if actual_err != 0:
-            err_names = ", ".join(get_err_names(actual_err))
-            result.err(f"OTBN encountered an unexpected error: {err_names}.\n"
-                       f"  {ERR_BITS}\t= {actual_err:#010x}\n"
-                       f"  {INSN_CNT}\t= {insn_cnt:#010x}\n"
-                       f"  {STOP_PC}\t= {stop_pc:#010x}")
-
-    else:
-        for reg, expected_value in expected_regs.items():
-            actual_value = actual_regs.get(reg, None)
-            if actual_value != expected_value:
-                if reg.startswith("w"):
-                    expected_str = f"{expected_value:#066x}"
-                    actual_str = f"{actual_value:#066x}"
-                else:
-                    expected_str = f"{expected_value:#010x}"
-                    actual_str = f"{actual_value:#010x}"
-                result.err(f"Mismatch for register {reg}:\n"
-                           f"  Expected: {expected_str}\n"
-                           f"  Actual:   {actual_str}")
-
-        for label, value in expected_dmem.items():
-            try:
-                offset = symbols[label]
-                actual = actual_dmem[offset:offset + len(value)]
-                if actual != value:
-                    result.err(
-                        f"Mismatch for dmem {label}:\n"
-                        f"  Expected:     {value.hex()}\n"
-                        f"  Actual:       {actual.hex()}\n"
-                        f"  Expected(BE): {value[::-1].hex()}\n"
-                        f"  Actual(BE):   {actual[::-1].hex()}"
-                    )
-            except KeyError:
-                result.err(f'No label "{label}" found in elf-file.')
+    result = check_final_state(expected_regs, expected_dmem, actual_regs,
+                               actual_dmem, symbols, entrypoint)
 
     if result.has_errors() or result.has_warnings() or args.verbose:
         print(result.report())
@@ -2,12 +2,16 @@
 # Licensed under the Apache License, Version 2.0, see LICENSE for details.
 # SPDX-License-Identifier: Apache-2.0
 
-from typing import Dict, Generic, List, Optional, TypeVar
+from collections import OrderedDict
+from typing import Dict, Generic, Hashable, Optional, Tuple, TypeVar
 
 K = TypeVar('K')  # Key type.
 V = TypeVar('V')  # Value type.
 X = TypeVar('X')  # Index type.
 
+# The position of an entry in a Cache: its index, shape and projection.
+EntryPos = Tuple[X, Hashable, Hashable]
+
 
 class CacheEntry(Generic[K, V]):
     '''Represents a single entry in a cache.
@@ -38,26 +42,139 @@ class CacheEntry(Generic[K, V]):
 class Cache(Generic[X, K, V]):
     '''Represents a cache to speed up recursive functions.
 
-    The cache is structured with two layers:
+    The cache is structured with three layers:
     - The first layer is a dictionary that maps some hashable index type to the
-      second layer, a list for each dictionary entry.
-    - The second layer is a list of CacheEntry instances to be checked.
+      second layer, a dictionary for each index.
+    - The second layer maps the "shape" of an entry's key to the third layer.
+    - The third layer is a dictionary of CacheEntry instances, keyed by the
+      "projection" of their keys.
+
+    The purpose of the index is to quickly narrow things down to a limited
+    number of potentially matching entries (for instance, it could be an input
+    parameter to the function that absolutely must match for the cache entries
+    to match).
+
+    An entry might not depend on all of a lookup key (see CacheEntry). The shape
+    of an entry says which parts it depends on and the projection of a key onto
+    a shape is just those parts. An entry matches a lookup key exactly when the
+    projection of the lookup key onto the entry's shape is the same as the
+    projection of the entry's own key. This means that a lookup only has to do
+    one dictionary lookup for each shape at the index, rather than calling
+    is_match on every entry. Subclasses define shapes and projections by
+    overriding key_shape and project_key. By default, the shape is None and the
+    projection is the whole key, which must then be hashable.
 
-    The purpose of the two-layer structure is to speed up lookups; the index
-    type should be used to quickly narrow things down to a limited number of
-    potentially matching entries (for instance, it could be an input parameter
-    to the function that absolutely must match for the cache entries to match).
+    If max_entries is not None, the cache holds at most that many entries,
+    evicting the least recently used entry when it is full. The hits, misses
+    and evictions counters record how well the cache is doing.
     '''
-    def __init__(self) -> None:
-        self.entries: Dict[X, List[CacheEntry[K, V]]] = {}
+    def __init__(self, max_entries: Optional[int] = None) -> None:
+        self.entries: Dict[X, Dict[Hashable,
+                                   Dict[Hashable,
+                                        Tuple[int, CacheEntry[K, V]]]]] = {}
+        self.max_entries = max_entries
+
+        # The position of each entry, least recently used first. Only tracked
+        # if max_entries is not None.
+        self._lru: OrderedDict[EntryPos[X], None] = OrderedDict()
+
+        # The number of entries that have been added. This is used to give
+        # each entry a sequence number: if several entries match a lookup,
+        # the oldest one wins.
+        self._num_added = 0
+        self._num_entries = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key_shape(self, key: K) -> Hashable:
+        '''Return the shape of an entry key (the parts of it that matter)'''
+        return None
+
+    def project_key(self, key: K, shape: Hashable) -> Optional[Hashable]:
+        '''Return the projection of a lookup key onto a shape
+
+        Returns None if the key can't match an entry with this shape at all.
+        '''
+        assert isinstance(key, Hashable)
+        return key
+
+    def __len__(self) -> int:
+        return self._num_entries
+
+    def _find(self, index: X,
+              key: K) -> Optional[Tuple[EntryPos[X], CacheEntry[K, V]]]:
+        '''Find the oldest entry that matches key at index
+
+        Returns the entry's position in the cache (its index, shape and
+        projection) and the entry itself.
+        '''
+        best = None
+        best_seq = None
+        for shape, by_proj in self.entries.get(index, {}).items():
+            proj = self.project_key(key, shape)
+            if proj is None:
+                continue
+            found = by_proj.get(proj)
+            if found is None:
+                continue
+            seq, entry = found
+            if best_seq is None or seq < best_seq:
+                best_seq = seq
+                best = ((index, shape, proj), entry)
+
+        return best
 
     def add(self, index: X, entry: CacheEntry[K, V]) -> None:
         # Only add if there's no matching entry already
-        if self.lookup(index, entry.key) is None:
-            self.entries.setdefault(index, []).append(entry)
+        if self._find(index, entry.key) is not None:
+            return
+
+        shape = self.key_shape(entry.key)
+        proj = self.project_key(entry.key, shape)
+        assert proj is not None
+
+        by_shape = self.entries.setdefault(index, {})
+        by_shape.setdefault(shape, {})[proj] = (self._num_added, entry)
+        self._num_added += 1
+        self._num_entries += 1
+
+        if self.max_entries is not None:
+            self._lru[(index, shape, proj)] = None
+            while self._num_entries > self.max_entries:
+                self._evict()
+
+    def _evict(self) -> None:
+        '''Drop the least recently used entry'''
+        (index, shape, proj), _ = self._lru.popitem(last=False)
+        by_shape = self.entries[index]
+        by_proj = by_shape[shape]
+        del by_proj[proj]
+        if not by_proj:
+            del by_shape[shape]
+        if not by_shape:
+            del self.entries[index]
+
+        self._num_entries -= 1
+        self.evictions += 1
 
     def lookup(self, index: X, key: K) -> Optional[V]:
-        for entry in self.entries.get(index, []):
-            if entry.is_match(key):
-                return entry.value
-        return None
+        found = self._find(index, key)
+        if found is None:
+            self.misses += 1
+            return None
+
+        pos, entry = found
+        self.hits += 1
+        if self.max_entries is not None:
+            self._lru.move_to_end(pos)
+        return entry.value
+
+    def stats(self) -> str:
+        '''Return a one-line summary of the cache counters'''
+        lookups = self.hits + self.misses
+        hit_pct = 100 * self.hits / lookups if lookups else 0.0
+        return (f'{len(self)} entries, {lookups} lookups, '
+                f'{self.hits} hits ({hit_pct:.1f}%), {self.misses} misses, '
+                f'{self.evictions} evictions')
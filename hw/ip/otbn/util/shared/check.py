@@ -3,6 +3,8 @@
 # Licensed under the Apache License, Version 2.0, see LICENSE for details.
 # SPDX-License-Identifier: Apache-2.0
 
+from typing import List
+
 
 class CheckResult:
     '''A class to record the results of static checks.
@@ -18,20 +20,20 @@ class CheckResult:
         # prints warnings/errors from both checks and "A warning"
         print(out.report())
     '''
-    def __init__(self):
-        self.errors = []
-        self.warnings = []
+    def __init__(self) -> None:
+        self.errors: List[str] = []
+        self.warnings: List[str] = []
         self.prefix = ''
 
-    def warn(self, msg):
+    def warn(self, msg: str) -> None:
         '''Add a warning.'''
         self.warnings.append(msg)
 
-    def err(self, msg):
+    def err(self, msg: str) -> None:
         '''Add an error.'''
         self.errors.append(msg)
 
-    def __add__(self, other):
+    def __add__(self, other: object) -> 'CheckResult':
         '''Combines both operands' errors/warnings in a new CheckResult.'''
         if not isinstance(other, CheckResult):
             raise ValueError(
@@ -42,17 +44,17 @@ class CheckResult:
         out.errors = self.errors + other.errors
         return out
 
-    def set_prefix(self, prefix):
+    def set_prefix(self, prefix: str) -> None:
         '''Add a prefix to the printouts for this check.'''
         self.prefix = prefix
 
-    def has_errors(self):
+    def has_errors(self) -> bool:
         return len(self.errors) != 0
 
-    def has_warnings(self):
+    def has_warnings(self) -> bool:
         return len(self.warnings) != 0
 
-    def report(self):
+    def report(self) -> str:
         '''Show a message to represent the results of the check.'''
         if not self.has_warnings() and not self.has_errors():
             return '{}PASS'.format(self.prefix)
@@ -6,7 +6,8 @@
 from typing import Dict, List, Set, Tuple
 
 from .decode import OTBNProgram
-from .insn_yaml import Insn
+from .disk_cache import DiskCache, cache_key
+from .insn_yaml import Insn, cache_version
 from .section import CodeSection
 
 
@@ -450,10 +451,28 @@ def _make_control_graph(program: OTBNProgram, start_pc: int) -> ControlGraph:
     '''Constructs a control flow graph with start_pc as the entrypoint.
 
     Assumes the loop stack is empty at start_pc.
+
+    If the program came from decode_elf with a cache directory, the graph is
+    stored there (keyed by the program and start_pc) and later calls, in this
+    process or another, load it instead of computing it again.
     '''
+    disk_cache = None
+    digest = ''
+    if program.cache_dir is not None and program.digest is not None:
+        disk_cache = DiskCache(program.cache_dir, 'otbn-control-graph',
+                               cache_version())
+        digest = cache_key(program.digest, str(start_pc))
+        cached = disk_cache.get(digest)
+        if isinstance(cached, ControlGraph):
+            return cached
+
     graph = ControlGraph(start_pc, {})
     _populate_control_graph(graph, program, start_pc, [])
     _fix_cycles(program, graph)
+
+    if disk_cache is not None:
+        disk_cache.put(digest, graph)
+
     return graph
 
 
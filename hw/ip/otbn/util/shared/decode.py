@@ -5,10 +5,12 @@
 
 import struct
 import sys
-from typing import Dict, List
+from typing import Any, Dict, List, Optional
 
+from shared.disk_cache import DiskCache, cache_key, file_digest
 from shared.elf import read_elf
-from shared.insn_yaml import Insn, load_insns_yaml
+from shared.insn_yaml import (Insn, cache_version, get_cache_dir,
+                              load_insns_yaml)
 
 # Load the insns.yml file at module load time.
 try:
@@ -80,6 +82,25 @@ class OTBNProgram:
             op_vals = insn.enc_vals_to_op_vals(pc, enc_vals)
             self.insns[pc] = (insn, op_vals)
 
+        # If the program came from decode_elf with a cache directory, these
+        # give the directory and a digest that identifies the program (the
+        # ELF file's contents and the nop_subfuncs list).
+        self.cache_dir: Optional[str] = None
+        self.digest: Optional[str] = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Pickle instructions by mnemonic, rather than pickling the Insn
+        # objects (which are big and which we want to share with INSNS_FILE).
+        state = dict(self.__dict__)
+        state['insns'] = {pc: (insn.mnemonic, op_vals)
+                          for pc, (insn, op_vals) in self.insns.items()}
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        state['insns'] = {pc: (INSNS_FILE.mnemonic_to_insn[mnem], op_vals)
+                          for pc, (mnem, op_vals) in state['insns'].items()}
+        self.__dict__.update(state)
+
     def min_pc(self) -> int:
         return min(self.insns.keys())
 
@@ -113,14 +134,42 @@ def _decode_mem(base_addr: int, data: bytes) -> Dict[int, int]:
             for offset, int_val in enumerate(struct.iter_unpack('<I', data))}
 
 
-def decode_elf(path: str, nop_subfuncs: List[str]) -> OTBNProgram:
+def decode_elf(path: str,
+               nop_subfuncs: List[str],
+               cache_dir: Optional[str] = None) -> OTBNProgram:
     '''Read ELF file at path and decode contents into an OTBNProgram instance
 
     Returns the OTBNProgram instance representing the program in the ELF file.
+
+    If cache_dir is None, it defaults to the value of the OTBN_UTIL_CACHE_DIR
+    environment variable. If there is a cache directory, decoded programs are
+    stored there, keyed by the contents of the ELF file, and the program
+    remembers the directory so that control_flow can cache its control graphs
+    there too.
     '''
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+
+    disk_cache = None
+    digest = ''
+    if cache_dir is not None:
+        digest = cache_key(file_digest(path), *nop_subfuncs)
+        disk_cache = DiskCache(cache_dir, 'otbn-program', cache_version())
+        program = disk_cache.get(digest)
+        if isinstance(program, OTBNProgram):
+            program.cache_dir = cache_dir
+            program.digest = digest
+            return program
+
     (imem_bytes, dmem_bytes, symbols) = read_elf(path)
 
     insns = _decode_mem(0, imem_bytes)
     data = _decode_mem(0, dmem_bytes)
 
-    return OTBNProgram(symbols, insns, data, nop_subfuncs)
+    program = OTBNProgram(symbols, insns, data, nop_subfuncs)
+    if disk_cache is not None:
+        disk_cache.put(digest, program)
+        program.cache_dir = cache_dir
+        program.digest = digest
+
+    return program
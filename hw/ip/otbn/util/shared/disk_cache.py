@@ -0,0 +1,92 @@
+# Copyright lowRISC contributors (OpenTitan project).
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''An on-disk cache for data that is slow to compute from an input file
+
+Entries are keyed by the SHA-256 hash of the input file (so a rebuilt ELF gets
+a new entry) and by a version string chosen by the user of the cache. The
+version should be bumped whenever the format of the cached data changes: stale
+entries are then just ignored.
+
+The cache is only an optimisation. Any problem reading an entry (a missing or
+corrupt file, or one written by an incompatible version) is treated as a miss
+and any problem writing one is silently ignored.
+
+'''
+
+import hashlib
+import os
+import pickle
+import tempfile
+from typing import Any, Iterable, Optional
+
+
+def file_digest(path: str) -> str:
+    '''Return the SHA-256 hash of the contents of the file at path'''
+    sha = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(1 << 16), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def files_digest(paths: Iterable[str]) -> str:
+    '''Return a SHA-256 hash of the names and contents of some files
+
+    This is useful as part of a cache version: if any of the files that
+    generate some cached data change, the digest will change too.
+
+    '''
+    sha = hashlib.sha256()
+    for path in paths:
+        sha.update(os.path.basename(path).encode() + b'\0')
+        sha.update(bytes.fromhex(file_digest(path)))
+    return sha.hexdigest()
+
+
+def cache_key(*parts: str) -> str:
+    '''Combine some strings into a key for a DiskCache'''
+    return hashlib.sha256('\0'.join(parts).encode()).hexdigest()
+
+
+class DiskCache:
+    '''A directory of pickled values, keyed by input file hash'''
+    def __init__(self, cache_dir: str, kind: str, version: str) -> None:
+        self.cache_dir = cache_dir
+        self.kind = kind
+        self.version = version
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, f'{self.kind}-{digest}.pickle')
+
+    def get(self, digest: str) -> Optional[Any]:
+        '''Return the value stored for digest, or None if there isn't one'''
+        try:
+            with open(self._path(digest), 'rb') as handle:
+                version, value = pickle.load(handle)
+        except Exception:
+            return None
+
+        return value if version == self.version else None
+
+    def put(self, digest: str, value: Any) -> None:
+        '''Store value for digest
+
+        The entry is written to a temporary file and then renamed into place,
+        so concurrent users of the cache never see a partial entry.
+
+        '''
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir,
+                                            prefix=f'.{self.kind}-')
+            try:
+                with os.fdopen(fd, 'wb') as handle:
+                    pickle.dump((self.version, value), handle)
+                os.replace(tmp_path, self._path(digest))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError:
+            pass
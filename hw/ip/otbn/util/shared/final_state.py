@@ -0,0 +1,116 @@
+# Copyright lowRISC contributors (OpenTitan project).
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Check the state at the end of an OTBN simulation against expected values'''
+
+from enum import IntEnum
+from typing import Dict, List
+
+from .check import CheckResult
+
+# Names of special registers
+ERR_BITS = 'ERR_BITS'
+INSN_CNT = 'INSN_CNT'
+STOP_PC = 'STOP_PC'
+
+
+# copied from hw/ip/otbn/dv/otbnsim/sim/constants.py
+class ErrBits(IntEnum):
+    '''A copy of the list of bits in the ERR_BITS register.'''
+    BAD_DATA_ADDR = 1 << 0
+    BAD_INSN_ADDR = 1 << 1
+    CALL_STACK = 1 << 2
+    ILLEGAL_INSN = 1 << 3
+    LOOP = 1 << 4
+    KEY_INVALID = 1 << 5
+    RND_REP_CHK_FAIL = 1 << 6
+    RND_FIPS_CHK_FAIL = 1 << 7
+    IMEM_INTG_VIOLATION = 1 << 16
+    DMEM_INTG_VIOLATION = 1 << 17
+    REG_INTG_VIOLATION = 1 << 18
+    BUS_INTG_VIOLATION = 1 << 19
+    BAD_INTERNAL_STATE = 1 << 20
+    ILLEGAL_BUS_ACCESS = 1 << 21
+    LIFECYCLE_ESCALATION = 1 << 22
+    FATAL_SOFTWARE = 1 << 23
+
+
+def get_err_names(err: int) -> List[str]:
+    '''Get the names of all error bits that are set.'''
+    out = []
+    for err_bit in ErrBits:
+        if err & err_bit != 0:
+            out.append(err_bit.name)
+    return out
+
+
+def check_final_state(expected_regs: Dict[str, int],
+                      expected_dmem: Dict[str, bytes],
+                      actual_regs: Dict[str, int],
+                      actual_dmem: bytes,
+                      symbols: Dict[str, int],
+                      entrypoint: int = 0) -> CheckResult:
+    '''Compare the registers and DMEM at the end of a run with expectations.
+
+    expected_regs maps register names to values and expected_dmem maps ELF
+    symbols to little-endian bytes. Registers and memory that are not listed
+    are allowed to have any value, except for ERR_BITS, which is expected to
+    be zero if it isn't listed. actual_regs should contain every register
+    (as in a register dump from the simulator) and actual_dmem is the whole
+    of DMEM. If entrypoint is nonzero, the run started there rather than at
+    the start of the program.
+
+    '''
+    result = CheckResult()
+
+    expected_err = expected_regs.get(ERR_BITS, 0)
+
+    if entrypoint and not expected_err:
+        # expect call stack error since we overwrite the entrypoint.
+        expected_err = ErrBits.CALL_STACK
+
+    # Special handling for the ERR_BITS register.
+    actual_err = actual_regs[ERR_BITS]
+    insn_cnt = actual_regs[INSN_CNT]
+    stop_pc = actual_regs[STOP_PC]
+    if expected_err == 0 and actual_err != 0:
+        # Test is expected to have no errors, but an error occurred. In this
+        # case, give a special error message and exit rather than print all the
+        # mismatched registers.
+        err_names = ", ".join(get_err_names(actual_err))
+        result.err(f"OTBN encountered an unexpected error: {err_names}.\n"
+                   f"  {ERR_BITS}\t= {actual_err:#010x}\n"
+                   f"  {INSN_CNT}\t= {insn_cnt:#010x}\n"
+                   f"  {STOP_PC}\t= {stop_pc:#010x}")
+        return result
+
+    for reg, expected_value in expected_regs.items():
+        actual_value = actual_regs.get(reg, None)
+        if actual_value != expected_value:
+            if reg.startswith("w"):
+                expected_str = f"{expected_value:#066x}"
+                actual_str = f"{actual_value:#066x}"
+            else:
+                expected_str = f"{expected_value:#010x}"
+                actual_str = f"{actual_value:#010x}"
+            result.err(f"Mismatch for register {reg}:\n"
+                       f"  Expected: {expected_str}\n"
+                       f"  Actual:   {actual_str}")
+
+    for label, value in expected_dmem.items():
+        try:
+            offset = symbols[label]
+            actual = actual_dmem[offset:offset + len(value)]
+            if actual != value:
+                result.err(
+                    f"Mismatch for dmem {label}:\n"
+                    f"  Expected:     {value.hex()}\n"
+                    f"  Actual:       {actual.hex()}\n"
+                    f"  Expected(BE): {value[::-1].hex()}\n"
+                    f"  Actual(BE):   {actual[::-1].hex()}"
+                )
+        except KeyError:
+            result.err(f'No label "{label}" found in elf-file.')
+
+    return result
@@ -3,14 +3,15 @@
 # Licensed under the Apache License, Version 2.0, see LICENSE for details.
 # SPDX-License-Identifier: Apache-2.0
 
+import multiprocessing
 from copy import deepcopy
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Dict, Hashable, List, Optional, Set, Tuple
 
 from .cache import Cache, CacheEntry
 from .constants import ConstantContext, get_op_val_str
 from .control_flow import (ControlLoc, ControlGraph, Cycle, Ecall,
-                           ImemEnd, LoopStart, Ret)
-from .decode import OTBNProgram
+                           ImemEnd, LoopStart, Ret, subroutine_control_graph)
+from .decode import OTBNProgram, decode_elf
 from .information_flow import InformationFlowGraph
 from .insn_yaml import Insn
 
@@ -53,14 +54,38 @@ class IFlowCacheEntry(CacheEntry[ConstantContext, IFlowResult]):
         return constants.includes(self.key)
 
 
+# The default maximum number of entries in an IFlowCache
+IFLOW_CACHE_MAX_ENTRIES = 1 << 16
+
+
 class IFlowCache(Cache[int, ConstantContext, IFlowResult]):
     '''Represents the cache for _get_iflow.
 
     The index of the cache is the start PC for the call to _get_iflow. If this
     index and the values of the constants used in the call match a new call,
     the cached result is returned.
+
+    The shape of an entry is the (sorted) names of the constants that it used,
+    so a lookup only needs a dictionary lookup for each set of used constants
+    seen at the start PC, not a comparison with each entry.
     '''
-    pass
+    def __init__(self,
+                 max_entries: Optional[int] = IFLOW_CACHE_MAX_ENTRIES) -> None:
+        super().__init__(max_entries)
+
+    def key_shape(self, key: ConstantContext) -> Hashable:
+        return tuple(sorted(key.values))
+
+    def project_key(self, key: ConstantContext,
+                    shape: Hashable) -> Optional[Hashable]:
+        assert isinstance(shape, tuple)
+        values = []
+        for name in shape:
+            value = key.get(name)
+            if value is None:
+                return None
+            values.append(value)
+        return tuple(values)
 
 
 # The information flow of a subroutine is represented as a tuple whose entries
@@ -529,10 +554,12 @@ def _get_iflow(program: OTBNProgram, graph: ControlGraph, start_pc: int,
     return out
 
 
-def get_subroutine_iflow(program: OTBNProgram,
-                         graph: ControlGraph,
-                         subroutine_name: str,
-                         start_constants: Dict[str, int]) -> SubroutineIFlow:
+def get_subroutine_iflow(
+        program: OTBNProgram,
+        graph: ControlGraph,
+        subroutine_name: str,
+        start_constants: Dict[str, int],
+        cache: Optional[IFlowCache] = None) -> SubroutineIFlow:
     '''Gets the information-flow graphs for the subroutine.
 
     Returns three items:
@@ -543,6 +570,9 @@ def get_subroutine_iflow(program: OTBNProgram,
        paths)
     3. The information-flow nodes whose values at the start of the subroutine
        influence its control flow.
+
+    If cache is not None, it is used (and updated) for the analysis. This can
+    be used to look at its hit rate afterwards.
     '''
     if 'x0' in start_constants and start_constants['x0'] != 0:
         raise ValueError('The x0 register is always 0; cannot require '
@@ -550,8 +580,10 @@ def get_subroutine_iflow(program: OTBNProgram,
     start_constants['x0'] = 0
     constants = ConstantContext(start_constants)
     start_pc = program.get_pc_at_symbol(subroutine_name)
+    if cache is None:
+        cache = IFlowCache()
     _, ret_iflow, end_iflow, _, cycles, control_deps = _get_iflow(
-        program, graph, start_pc, constants, None, IFlowCache())
+        program, graph, start_pc, constants, None, cache)
     if cycles:
         for pc in cycles:
             print(cycles[pc].pretty())
@@ -564,8 +596,77 @@ def get_subroutine_iflow(program: OTBNProgram,
     return ret_iflow, end_iflow, control_deps
 
 
+# The result of analyzing one subroutine with get_subroutine_iflows: its
+# information flow and a summary of the cache statistics for the analysis (see
+# Cache.stats)
+SubroutineIFlowResult = Tuple[SubroutineIFlow, str]
+
+# The decoded program being analyzed by get_subroutine_iflows and the required
+# start constants. These are set by _init_iflow_worker in each worker process.
+_WORKER_PROGRAM: Optional[OTBNProgram] = None
+_WORKER_CONSTANTS: Dict[str, int] = {}
+
+
+def _init_iflow_worker(elf_path: str,
+                       nop_subfuncs: List[str],
+                       start_constants: Dict[str, int]) -> None:
+    global _WORKER_PROGRAM, _WORKER_CONSTANTS
+    _WORKER_PROGRAM = decode_elf(elf_path, nop_subfuncs)
+    _WORKER_CONSTANTS = start_constants
+
+
+def _analyze_subroutine_in(program: OTBNProgram,
+                           start_constants: Dict[str, int],
+                           subroutine_name: str) -> SubroutineIFlowResult:
+    '''Get the information flow for a subroutine, with a fresh cache'''
+    graph = subroutine_control_graph(program, subroutine_name)
+    cache = IFlowCache()
+    iflow = get_subroutine_iflow(program, graph, subroutine_name,
+                                 dict(start_constants), cache)
+    return (iflow, cache.stats())
+
+
+def _analyze_subroutine(subroutine_name: str) -> SubroutineIFlowResult:
+    '''Get the information flow for a subroutine in a worker process'''
+    assert _WORKER_PROGRAM is not None
+    return _analyze_subroutine_in(_WORKER_PROGRAM, _WORKER_CONSTANTS,
+                                  subroutine_name)
+
+
+def get_subroutine_iflows(program: OTBNProgram,
+                          elf_path: str,
+                          nop_subfuncs: List[str],
+                          subroutine_names: List[str],
+                          start_constants: Dict[str, int],
+                          jobs: int) -> List[SubroutineIFlowResult]:
+    '''Gets the information-flow graphs for several subroutines.
+
+    program should be the result of decoding the ELF file at elf_path with
+    decode_elf (passing nop_subfuncs). This calls get_subroutine_iflow for
+    each subroutine, with the same start constants. The analyses are
+    independent, so they are spread across a pool of up to jobs worker
+    processes. Each of these decodes the ELF file once. With a single job,
+    the analyses run in this process on program.
+
+    Returns a list with an entry for each subroutine, in the same order as
+    subroutine_names. Any exception raised when analyzing a subroutine is
+    raised here.
+    '''
+    jobs = min(jobs, len(subroutine_names))
+    if jobs <= 1:
+        return [_analyze_subroutine_in(program, start_constants, name)
+                for name in subroutine_names]
+
+    init_args = (elf_path, nop_subfuncs, start_constants)
+    with multiprocessing.Pool(jobs,
+                              initializer=_init_iflow_worker,
+                              initargs=init_args) as pool:
+        return pool.map(_analyze_subroutine, subroutine_names, chunksize=1)
+
+
 def get_program_iflow(program: OTBNProgram,
-                      graph: ControlGraph) -> ProgramIFlow:
+                      graph: ControlGraph,
+                      cache: Optional[IFlowCache] = None) -> ProgramIFlow:
     '''Gets the information-flow graph for the whole program.
 
     Returns two items:
@@ -573,10 +674,14 @@ def get_program_iflow(program: OTBNProgram,
        program (e.g. ECALL or the end of IMEM)
     2. The information-flow nodes whose values at the start of the subroutine
        influence its control flow.
+
+    The cache argument is as for get_subroutine_iflow.
     '''
+    if cache is None:
+        cache = IFlowCache()
     _, ret_iflow, end_iflow, _, cycles, control_deps = _get_iflow(
         program, graph, program.min_pc(), ConstantContext.empty(), None,
-        IFlowCache())
+        cache)
     if cycles:
         raise RuntimeError('Unresolved cycles; start PCs: {}'.format(', '.join(
             ['{:#x}'.format(k) for k in cycles.keys()])))
@@ -4,15 +4,18 @@
 
 '''Support code for reading the instruction database in insns.yml'''
 
+import glob
 import itertools
 import os
 import re
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple, cast
 
 from serialize.parse_helpers import (check_keys, check_str, check_bool,
                                      check_list, index_list, get_optional_str,
                                      load_yaml)
 
+from .disk_cache import DiskCache, files_digest
 from .encoding import Encoding
 from .encoding_scheme import EncSchemes
 from .information_flow import InsnInformationFlow
@@ -419,19 +422,62 @@ def make_isr_dict(path: str) -> IsrMap:
 
 _DEFAULT_INSNS_FILE: Optional[InsnsFile] = None
 
+# If this environment variable is set, it names a directory where the OTBN
+# tools can store data that is slow to compute (the parsed instruction
+# database, decoded programs and so on) between runs.
+CACHE_DIR_ENV_VAR = 'OTBN_UTIL_CACHE_DIR'
+
+
+def _data_dir() -> str:
+    dirname = os.path.dirname(__file__)
+    return os.path.normpath(os.path.join(dirname, '..', '..', 'data'))
+
+
+def get_cache_dir() -> Optional[str]:
+    '''Return the cache directory named by OTBN_UTIL_CACHE_DIR, if any'''
+    return os.environ.get(CACHE_DIR_ENV_VAR) or None
+
+
+@lru_cache(maxsize=None)
+def cache_version() -> str:
+    '''The version for data in an OTBN_UTIL_CACHE_DIR cache
+
+    This is a hash of the YAML files that define the instructions and of the
+    code in this directory, so a cache never gives results from an older
+    version of the instruction database or the tools.
+
+    '''
+    shared_dir = os.path.dirname(__file__)
+    paths = (sorted(glob.glob(os.path.join(_data_dir(), '*.yml'))) +
+             sorted(glob.glob(os.path.join(shared_dir, '*.py'))))
+    return files_digest(paths)
+
 
 def load_insns_yaml() -> InsnsFile:
     '''Load the insns.yml file from its default location.
 
     Caches its result. Raises a RuntimeError on syntax or schema error.
 
+    If the OTBN_UTIL_CACHE_DIR environment variable is set, the parsed file
+    is also stored in that directory, so later processes can load it without
+    parsing and checking the YAML again. The cache entry is keyed by
+    cache_version(), so it is ignored once the YAML files change.
+
     '''
     global _DEFAULT_INSNS_FILE
     if _DEFAULT_INSNS_FILE is not None:
         return _DEFAULT_INSNS_FILE
 
-    dirname = os.path.dirname(__file__)
-    data_path = os.path.normpath(os.path.join(dirname, '..', '..', 'data'))
+    disk_cache = None
+    cache_dir = get_cache_dir()
+    if cache_dir is not None:
+        disk_cache = DiskCache(cache_dir, 'otbn-insns', cache_version())
+        cached = disk_cache.get(cache_version())
+        if isinstance(cached, InsnsFile):
+            _DEFAULT_INSNS_FILE = cached
+            return cached
+
+    data_path = _data_dir()
 
     csrs = make_isr_dict(os.path.join(data_path, 'csr.yml'))
     wsrs = make_isr_dict(os.path.join(data_path, 'wsr.yml'))
@@ -439,4 +485,7 @@ def load_insns_yaml() -> InsnsFile:
     _DEFAULT_INSNS_FILE = load_file(os.path.join(data_path, 'insns.yml'),
                                     IsrMaps(csrs, wsrs))
 
+    if disk_cache is not None:
+        disk_cache.put(cache_version(), _DEFAULT_INSNS_FILE)
+
     return _DEFAULT_INSNS_FILE
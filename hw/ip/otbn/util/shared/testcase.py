@@ -126,8 +126,16 @@ class OtbnTestCase:
         Returns:
             A OtbnTestCase object representing the parsed testcase.
         """
-        data: Dict[str, object] = hjson.loads(hjson_str)
+        return OtbnTestCase.from_dict(hjson.loads(hjson_str), symbols)
 
+    @staticmethod
+    def from_dict(data: Dict[str, object],
+                  symbols: Dict[str, int]) -> 'OtbnTestCase':
+        """
+        Like from_hjson, but for a testcase that has already been parsed into
+        a dictionary (or that was generated by a script, as in
+        shared.testgen).
+        """
         unknown_keys = set(data.keys()) - {'entrypoint', 'input', 'output'}
         if len(unknown_keys):
             raise ValueError(f'Got unknown keys in testcase: {unknown_keys}')
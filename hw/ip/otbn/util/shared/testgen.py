@@ -5,11 +5,18 @@
 import argparse
 import json
 import random
-from typing import Callable, Dict, Optional, TextIO
+from typing import Any, Callable, Dict, Optional, TextIO, Tuple
 
 _GPR_NAMES = [f'x{i}' for i in range(32)]
 _WDR_NAMES = [f'w{i}' for i in range(32)]
 
+# A testcase as a dictionary in the HJSON format read by shared.testcase.
+Testcase = Dict[str, object]
+
+# The inputs and expected register values for an expectation test, as passed
+# to write_test_data and write_test_exp.
+Expectation = Tuple[Dict[str, bytes], Dict[str, bytes]]
+
 
 def itoa_dmem(value: bytes) -> str:
     ''' Convert an integer (in the form of a bytearray) to a DMEM hexstring for
@@ -24,7 +31,7 @@ def itoa_gpr(value: bytes) -> str:
     ''' Convert an integer (in the form of a bytearray) to a GPR hexstring for
         usage in Exp or HJSON testcase files.. '''
     if len(value) > 8:
-        raise ValueError(f'Expected value is too large: {value}')
+        raise ValueError(f'Expected value is too large: {value!r}')
     v = int.from_bytes(value, byteorder='little')
     return f'{v:#010x}'
 
@@ -33,62 +40,144 @@ def itoa_wdr(value: bytes) -> str:
     ''' Convert an integer (in the form of a bytearray) to a WDR hexstring for
         usage in Exp or HJSON testcase files.. '''
     if len(value) > 32:
-        raise ValueError(f'Expected value is too large: {value}')
+        raise ValueError(f'Expected value is too large: {value!r}')
     v = int.from_bytes(value, byteorder='little')
     return f'{v:#066x}'
 
 
+def _pad_input(value: bytes) -> Tuple[int, bytes]:
+    '''Return the alignment and padded contents of an input buffer.'''
+    if len(value) <= 4:
+        # Buffer should be read as a 32-bit (4-byte) value.
+        return 4, value.ljust(4, b'\0')
+    # Buffer should be read as a (sequence of) 256-bit (32-byte) values.
+    return 32, value.ljust(((len(value) + 31) // 32) * 32, b'\0')
+
+
 def write_test_data(inputs: Dict[str, bytes], data_file: TextIO) -> None:
     '''Write the test input data to DMEM.'''
     data_file.write('.data\n')
     for name in inputs:
         data_file.write('\n')
-        if len(inputs[name]) <= 4:
-            # Buffer should be read as a 32-bit (4-byte) value.
-            align = 4
-            length = 4
-        else:
-            # Buffer should be read as a (sequence of) 256-bit (32-byte) values.
-            align = 32
-            length = ((len(inputs[name]) + 31) // 32) * 32
+        align, value = _pad_input(inputs[name])
         data_file.write(f'.balign {align}\n')
         data_file.write(f'.globl {name}\n')
         data_file.write(f'{name}:\n')
-        for i in range(0, length, 4):
-            word = int.from_bytes(inputs[name][i:i + 4], byteorder='little')
+        for i in range(0, len(value), 4):
+            word = int.from_bytes(value[i:i + 4], byteorder='little')
             data_file.write(f'.word {word:#010x}\n')
 
 
+def _exp_reg_value(name: str, value: bytes) -> str:
+    '''Format an expected register value for an Exp or HJSON file.'''
+    if name in _GPR_NAMES or name == 'ERR_BITS':
+        return itoa_gpr(value)
+    if name in _WDR_NAMES:
+        return itoa_wdr(value)
+    raise ValueError(f'Register name {name} not recognized.')
+
+
 def write_test_exp(exp: Dict[str, bytes], exp_file: TextIO) -> None:
     '''Write the expected-values file for the test.'''
     for name in exp:
-        if name in _GPR_NAMES or name == 'ERR_BITS':
-            exp_file.write(f'{name} = {itoa_gpr(exp[name])}\n')
-        elif name in _WDR_NAMES:
-            exp_file.write(f'{name} = {itoa_wdr(exp[name])}\n')
-        else:
-            raise ValueError(f'Register name {name} not recognized.')
-
-
-def testcase(gen: Callable[[Optional[int]], Dict]) -> None:
-    '''Generic entry point for the creation of arbitrary autogen testcases.
-       Parses the command line arguments and invokes the provided callback
-       function that generates the HJSON dictionary.'''
-    def generate():
+        exp_file.write(f'{name} = {_exp_reg_value(name, exp[name])}\n')
+
+
+def expectation_testcase(inputs: Dict[str, bytes],
+                         exp: Dict[str, bytes]) -> Testcase:
+    '''Convert the inputs and expected values of an expectation test into a
+       testcase. The testcase overwrites each input buffer at its label, so it
+       can be run on a program that was built with the data file of another
+       test with the same buffer sizes.'''
+    dmem = {name: itoa_dmem(_pad_input(value)[1])
+            for name, value in inputs.items()}
+    regs = {name: _exp_reg_value(name, value) for name, value in exp.items()}
+    return {
+        "input": {
+            "dmem": dmem,
+        },
+        "output": {
+            "regs": regs,
+        }
+    }
+
+
+class RandomTestGen:
+    '''A generator of random tests for an OTBN program.
+
+       This wraps a function that generates one test, using the random module
+       for randomness. The function is called with the seed (which has
+       already been passed to random.seed) and with any parameters as keyword
+       arguments. For kind 'testcase', it returns a testcase dictionary. For
+       kind 'expectation', it returns the inputs and expected values for
+       write_test_data and write_test_exp.
+
+       Calling the object parses command line arguments and writes a single
+       test, which is how the generator scripts are run by Bazel. See
+       shared.testgen_batch for generating many tests at once.'''
+    def __init__(self, gen: Callable[..., Any], kind: str) -> None:
+        assert kind in ['testcase', 'expectation']
+        self.gen = gen
+        self.kind = kind
+
+    def generate(self, seed: Optional[int], **params: Any) -> Any:
+        '''Generate a test in the format for this kind of generator.'''
+        if seed is not None:
+            random.seed(seed)
+        return self.gen(seed, **params)
+
+    def testcase(self, seed: Optional[int], **params: Any) -> Testcase:
+        '''Generate a test as a testcase dictionary.'''
+        test = self.generate(seed, **params)
+        if self.kind == 'expectation':
+            inputs, exp = test
+            return expectation_testcase(inputs, exp)
+        assert isinstance(test, dict)
+        return test
+
+    def __call__(self) -> None:
         parser = argparse.ArgumentParser()
         parser.add_argument('-s', '--seed',
                             type=int,
                             required=False,
                             help=('Seed value for pseudorandomness.'))
-        parser.add_argument('hjson',
-                            metavar='FILE',
-                            type=argparse.FileType('w'),
-                            help=('Testcase HJSON file.'))
+        if self.kind == 'testcase':
+            parser.add_argument('hjson',
+                                metavar='FILE',
+                                type=argparse.FileType('w'),
+                                help=('Testcase HJSON file.'))
+        else:
+            parser.add_argument('data',
+                                metavar='FILE',
+                                type=argparse.FileType('w'),
+                                help=('Output file for input DMEM values.'))
+            parser.add_argument('exp',
+                                metavar='FILE',
+                                type=argparse.FileType('w'),
+                                help=('Output file for expected register '
+                                      'values.'))
         args = parser.parse_args()
 
-        if args.seed is not None:
-            random.seed(args.seed)
+        test = self.generate(args.seed)
+        if self.kind == 'testcase':
+            json.dump(test, args.hjson)
+        else:
+            inputs, exp = test
+            write_test_data(inputs, args.data)
+            write_test_exp(exp, args.exp)
 
-        json.dump(gen(), args.hjson)
 
-    return generate
+def testcase(gen: Callable[..., Testcase]) -> RandomTestGen:
+    '''Generic entry point for the creation of arbitrary autogen testcases.
+       Wraps a function that generates the HJSON dictionary for a testcase.
+       Calling the result parses the command line arguments and writes the
+       testcase to a file.'''
+    return RandomTestGen(gen, 'testcase')
+
+
+def expectation(gen: Callable[..., Expectation]) -> RandomTestGen:
+    '''Entry point for the creation of autogen expectation tests. Wraps a
+       function that generates the test inputs and expected register values.
+       Calling the result parses the command line arguments and writes the
+       data and expected-values files.'''
+    return RandomTestGen(gen, 'expectation')
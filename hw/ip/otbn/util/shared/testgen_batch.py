@@ -0,0 +1,135 @@
+# Copyright lowRISC contributors (OpenTitan project).
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Generate many random tests at once, in parallel and with a cache
+
+The generator scripts (such as those in sw/otbn/crypto/tests/generated) each
+write a single test for a seed when they are run. To check a program against
+thousands of random inputs, we instead import a script, find its
+RandomTestGen and call it for a range of seeds in a pool of worker processes.
+
+Each test is returned as a testcase dictionary (see shared.testcase), which
+says how to set up DMEM and registers and what to expect at the end. This
+means that every test can be run on the same ELF file.
+
+'''
+
+import importlib.util
+import json
+import multiprocessing
+import os
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from . import testgen
+from .disk_cache import DiskCache, cache_key, files_digest
+from .testgen import RandomTestGen, Testcase
+
+
+def load_testgen(path: str) -> RandomTestGen:
+    '''Import the generator script at path and return its generator
+
+    The script must define exactly one RandomTestGen (which is what the
+    shared.testgen.testcase and shared.testgen.expectation decorators make).
+
+    '''
+    name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    if spec is None or spec.loader is None:
+        raise RuntimeError(f'Cannot import test generator from {path}.')
+
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    gens = [value for value in vars(module).values()
+            if isinstance(value, RandomTestGen)]
+    if len(gens) != 1:
+        raise RuntimeError(f'{path} should define exactly one test '
+                           f'generator, but it defines {len(gens)}.')
+    return gens[0]
+
+
+_WORKER_ARGS: Optional[Tuple[RandomTestGen, Dict[str, Any]]] = None
+
+
+def _init_worker(path: str, params: Dict[str, Any]) -> None:
+    '''Initialise a worker process for generate_testcases'''
+    global _WORKER_ARGS
+    _WORKER_ARGS = (load_testgen(path), params)
+
+
+def _gen_in_worker(seed: int) -> Testcase:
+    '''Generate one testcase in a worker process'''
+    assert _WORKER_ARGS is not None
+    gen, params = _WORKER_ARGS
+    return gen.testcase(seed, **params)
+
+
+def generate_testcases(path: str,
+                       seeds: List[int],
+                       params: Optional[Dict[str, Any]] = None,
+                       jobs: int = 1,
+                       cache_dir: Optional[str] = None
+                       ) -> Iterator[Tuple[int, Testcase]]:
+    '''Generate a testcase for each seed with the generator script at path
+
+    Yields (seed, testcase) pairs in the order of seeds. params are passed to
+    the generator as keyword arguments, so must be JSON-serializable.
+
+    If jobs is more than 1, testcases are generated in parallel by that many
+    worker processes. If cache_dir is not None, it names a directory where we
+    store each testcase. This is keyed by the name of the generator script,
+    the seed and params, and by the contents of the script and of
+    shared/testgen.py, so changing either means the tests are generated
+    again.
+
+    '''
+    if params is None:
+        params = {}
+    gen = load_testgen(path)
+    name = os.path.basename(path)
+    params_str = json.dumps(params, sort_keys=True)
+
+    disk_cache = None
+    if cache_dir is not None:
+        disk_cache = DiskCache(cache_dir, 'otbn-testgen',
+                               files_digest([path, testgen.__file__]))
+
+    # Look up each seed in the cache. cases[idx] is the testcase for
+    # seeds[idx] if it was cached, and otherwise None.
+    keys = []
+    cases: List[Optional[Testcase]] = []
+    to_do = []
+    for idx, seed in enumerate(seeds):
+        key = cache_key(name, str(seed), params_str)
+        keys.append(key)
+        cached = disk_cache.get(key) if disk_cache is not None else None
+        cases.append(cached if isinstance(cached, dict) else None)
+        if cases[-1] is None:
+            to_do.append(seed)
+
+    pool = None
+    results: Iterator[Testcase]
+    if jobs > 1 and len(to_do) > 1:
+        pool = multiprocessing.Pool(min(jobs, len(to_do)),
+                                    initializer=_init_worker,
+                                    initargs=(path, params))
+        results = pool.imap(_gen_in_worker, to_do,
+                            chunksize=max(1, len(to_do) // (4 * jobs)))
+    else:
+        results = (gen.testcase(seed, **params) for seed in to_do)
+
+    # The generated testcases come back in order, so we can merge them with
+    # the cached ones as we go.
+    try:
+        for idx, seed in enumerate(seeds):
+            case = cases[idx]
+            if case is None:
+                case = next(results)
+                if disk_cache is not None:
+                    disk_cache.put(keys[idx], case)
+            yield (seed, case)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
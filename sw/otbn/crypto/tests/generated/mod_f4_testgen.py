@@ -4,7 +4,7 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import random
-from typing import Optional
+from typing import List, Optional
 
 from shared.testgen import itoa_dmem, itoa_gpr, testcase
 
@@ -14,8 +14,9 @@ WORD_SIZE = 256
 
 
 @testcase
-def gen_mod_f4_test(seed: Optional[int] = None):
-    mod_size = MOD_SIZES[random.randint(0, len(MOD_SIZES) - 1)]
+def gen_mod_f4_test(seed: Optional[int] = None,
+                    mod_sizes: List[int] = MOD_SIZES):
+    mod_size = mod_sizes[random.randint(0, len(mod_sizes) - 1)]
 
     k = mod_size // WORD_SIZE
     b = mod_size // 8
@@ -31,14 +32,12 @@ def gen_mod_f4_test(seed: Optional[int] = None):
         if y_coprime != 0:
             break
 
-    # Sample x such that gcd(x, F4) > 1.
-    x_multiple = 0
-    y_multiple = 0
-    while True:
-        x_multiple = random.randint(2**(mod_size - 1), 2**mod_size - 1)
-        y_multiple = x_multiple % e
-        if y_multiple == 0:
-            break
+    # Sample x such that gcd(x, F4) > 1. Since F4 is prime, x is a multiple
+    # of F4. Pick the multiple directly: rejection sampling would need about
+    # F4 attempts.
+    x_multiple = e * random.randint(-(-2**(mod_size - 1) // e),
+                                    (2**mod_size - 1) // e)
+    y_multiple = x_multiple % e
 
     k_bytes = int.to_bytes(k, byteorder='little', length=4)
 
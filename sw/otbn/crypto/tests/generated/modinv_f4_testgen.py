@@ -4,7 +4,7 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import random
-from typing import Optional
+from typing import List, Optional
 
 from shared.testgen import itoa_dmem, itoa_gpr, testcase
 
@@ -14,8 +14,9 @@ WORD_SIZE = 256
 
 
 @testcase
-def gen_modinv_f4_test(seed: Optional[int] = None):
-    mod_size = MOD_SIZES[random.randint(0, len(MOD_SIZES) - 1)]
+def gen_modinv_f4_test(seed: Optional[int] = None,
+                       mod_sizes: List[int] = MOD_SIZES):
+    mod_size = mod_sizes[random.randint(0, len(mod_sizes) - 1)]
 
     k = mod_size // WORD_SIZE
     b = mod_size // 8
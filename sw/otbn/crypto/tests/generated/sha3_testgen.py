@@ -3,63 +3,54 @@
 # Licensed under the Apache License, Version 2.0, see LICENSE for details.
 # SPDX-License-Identifier: Apache-2.0
 
-import argparse
 import random
-from typing import TextIO, Optional
+from typing import List, Optional
 
 from Crypto.Hash import SHA3_224, SHA3_256, SHA3_384, SHA3_512
 
-from shared.testgen import write_test_data, write_test_exp
+from shared.testgen import Expectation, expectation
 
-DST_LEN = random.choice([28, 32, 48, 64])  # 28, 32, 48, 64
+DST_LENS = [28, 32, 48, 64]  # SHA3-224, SHA3-256, SHA3-384, SHA3-512
 MSG_LEN_UBOUND = 512  # change this to set upper bound for message's length
 
 
-def gen_sha3_test(seed: Optional[int], data_file: TextIO, exp_file: TextIO):
+@expectation
+def gen_sha3_test(seed: Optional[int],
+                  dst_lens: List[int] = DST_LENS,
+                  msg_len_ubound: int = MSG_LEN_UBOUND) -> Expectation:
     # Generate random operands.
-    if seed is not None:
-        random.seed(seed)
-    msg_len = random.randint(0, MSG_LEN_UBOUND)
+    dst_len = random.choice(dst_lens)
+    msg_len = random.randint(0, msg_len_ubound)
     msg = random.getrandbits(8 * msg_len)
-    dst_len_bytes = int.to_bytes(DST_LEN, byteorder='little', length=32)
+    dst_len_bytes = int.to_bytes(dst_len, byteorder='little', length=32)
     msg_len_bytes = int.to_bytes(msg_len, byteorder='little', length=32)
     msg_bytes = int.to_bytes(msg, byteorder='little', length=msg_len)
 
-    # Write input values.
-    inputs = {'dst_len': dst_len_bytes, 'msg': msg_bytes, 'msg_len': msg_len_bytes}
-    write_test_data(inputs, data_file)
+    # Input values. The message buffer always has room for the longest
+    # message, so that every test has the same DMEM layout.
+    inputs = {
+        'dst_len': dst_len_bytes,
+        'msg': msg_bytes.ljust(msg_len_ubound, b'\0'),
+        'msg_len': msg_len_bytes
+    }
 
-    # Compute SHA3-{DST_LEN}.
-    if DST_LEN == 28:
+    # Compute SHA3-{dst_len}.
+    if dst_len == 28:
         dst_ref = SHA3_224.new()
-    elif DST_LEN == 32:
+    elif dst_len == 32:
         dst_ref = SHA3_256.new()
-    elif DST_LEN == 48:
+    elif dst_len == 48:
         dst_ref = SHA3_384.new()
     else:
         dst_ref = SHA3_512.new()
     dst_ref.update(msg_bytes)
 
-    # Write expected output values.
+    # Expected output values.
     exp = {}
     for i in range(2):
         exp[f'w{i}'] = dst_ref.digest()[32 * i: 32 * (i + 1)]
-    write_test_exp(exp, exp_file)
+    return inputs, exp
 
 
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser()
-    parser.add_argument('-s', '--seed',
-                        type=int,
-                        required=False,
-                        help=('Seed value for pseudorandomness.'))
-    parser.add_argument('data',
-                        metavar='FILE',
-                        type=argparse.FileType('w'),
-                        help=('Output file for input DMEM values.'))
-    parser.add_argument('exp',
-                        metavar='FILE',
-                        type=argparse.FileType('w'),
-                        help=('Output file for expected register values.'))
-    args = parser.parse_args()
-    gen_sha3_test(args.seed, args.data, args.exp)
+    gen_sha3_test()